@@ -1,18 +1,43 @@
-import google.generativeai as genai
 import json
 import re
 from .memory import ChatMemory
 from .tools import AgentTools
+from .streaming import ReplyStreamParser
+from .response_cache import ResponseCache
+from .router import ROUTED_REPLIES
+from .prompt import PromptBuilder
 
 class ElevateUAgent:
-    def __init__(self, mongo_db, api_key):
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY is required")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
-        self.memory = ChatMemory(mongo_db)
-        self.tools = AgentTools(mongo_db)
+    def __init__(self, mongo_db, api_key, context_builder=None, model=None, response_cache=None,
+                 router=None, prompt_builder=None, conversation_store=None, retriever=None):
+        if model is not None:
+            # Injected model (e.g. FakeModel for local runs and tests)
+            self.model = model
+        else:
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY is required")
+            
+            # Imported here: the SDK takes about a second to load and is
+            # not needed when a model is injected
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel("gemini-2.0-flash")
+        # `conversation_store` (conversation_store.ConversationStore) holds
+        # both the chat sessions and the agent's memory
+        self.memory = ChatMemory(mongo_db, store=conversation_store)
+        self.tools = AgentTools(mongo_db, context_builder=context_builder)
+        # Optional get/set cache (cache.make_cache) for model replies;
+        # repeated questions from an unchanged user skip the model call
+        self.response_cache = ResponseCache(
+            response_cache, getattr(self.model, 'model_name', 'gemini')
+        ) if response_cache is not None else None
+        # Optional IntentRouter; confident progress/recommendation requests
+        # are answered by the tools without a model call
+        self.router = router
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        # Optional TopicRetriever; the few course/topic snippets most
+        # relevant to the message are added to the prompt
+        self.retriever = retriever
         self.is_initialized = True
         print(" * ElevateU Agent initialized with Gemini model")
 
@@ -26,38 +51,113 @@ class ElevateUAgent:
         return text.strip()
 
     def build_prompt(self, user_message, user_context, conversation_history):
-        return f"""
-You are ElevateU Agent — a friendly learning assistant for an online learning platform.
-
-USER CONTEXT:
-{json.dumps(user_context, indent=2) if user_context else "No user context available"}
-
-CONVERSATION HISTORY (last 5 messages):
-{conversation_history}
-
-USER MESSAGE: "{user_message}"
-
-RESPONSE REQUIREMENTS:
-- Be conversational and helpful
-- If user asks about progress, courses, learning, or recommendations, provide specific answers
-- For progress-related questions, use action: "get_progress"
-- For course recommendations, use action: "recommend_courses"  
-- For general questions, just answer conversationally with action: "none"
-
-CRITICAL: You MUST respond with VALID JSON only in this exact format:
-{{
-  "reply": "Your helpful response here",
-  "action": "none|get_progress|recommend_courses",
-  "parameters": {{}}
-}}
-
-EXAMPLES:
-- User: "What is Python?" → {{"reply": "Python is a popular programming language known for being beginner-friendly!", "action": "none", "parameters": {{}}}}
-- User: "Show my progress" → {{"reply": "Let me check your learning progress!", "action": "get_progress", "parameters": {{}}}}
-- User: "What courses should I take?" → {{"reply": "I'll find some great courses for you!", "action": "recommend_courses", "parameters": {{}}}}
-""".strip()
-
-    def process_message(self, message, user_id):
+        prompt, _ = self.prompt_builder.build(user_message, user_context, conversation_history)
+        return prompt
+
+    def _routed(self, message, user_id, user_context, session):
+        """Answer locally when the router is confident, else None"""
+        if self.router is None or not user_id:
+            return None
+        decision = self.router.route(message)
+        if decision is None:
+            return None
+        print(f" * Routed locally: {decision.intent} ({decision.confidence:.2f}, {decision.source})")
+        context = user_context or self.tools.build_context(user_id)
+        result = self._finish(
+            message, user_id, context, (ROUTED_REPLIES[decision.intent], decision.intent, {}), session
+        )
+        result["routing"] = decision.to_dict()
+        return result
+
+    def _retrieve(self, message, context):
+        if self.retriever is None:
+            return []
+        enrolled = [e.get('courseId') for e in getattr(context, 'enrollments', None) or []]
+        snippets = self.retriever.retrieve(message, enrolled)
+        print(f" * Retrieved {len(snippets)} course snippets")
+        return snippets
+
+    def _prepare(self, message, user_id, user_context):
+        """Load context, memory and course material and build the prompt.
+
+        Returns (context, cache context, prompt); the cache context holds
+        the prompt context and the retrieved material the response cache
+        keys on (see ResponseCache).
+        """
+        context = user_context or self.tools.build_context(user_id)
+        prompt_context = self.tools.get_user_context(user_id, context)
+        history = self.memory.get_recent_history(user_id)
+        material = self._retrieve(message, context)
+
+        print(f" * User context: {prompt_context}")
+        print(f" * Conversation history: {history}")
+
+        # Build structured prompt (within the token budget)
+        prompt, prompt_stats = self.prompt_builder.build(message, prompt_context, history, material)
+        print(f" * Prompt built: {prompt_stats}")
+        cache_context = {'user': prompt_context, 'material': [snippet['text'] for snippet in material or []]}
+        return context, cache_context, prompt
+
+    def _cached_response(self, message, cache_context):
+        if self.response_cache is None:
+            return None
+        cached = self.response_cache.get(message, cache_context)
+        if cached is not None:
+            print(" * Response cache hit")
+        return cached
+
+    def _cache_response(self, message, cache_context, parsed):
+        if self.response_cache is not None:
+            self.response_cache.set(message, cache_context, *parsed)
+
+    def _parse_response(self, raw_text):
+        """Turn the raw model text into (reply, action, parameters)"""
+        print(f" * Raw AI response: {raw_text}")
+
+        # Clean and parse JSON response
+        cleaned_response = self.clean_json_response(raw_text)
+        print(f" * Cleaned response: {cleaned_response}")
+
+        try:
+            parsed_response = json.loads(cleaned_response)
+            clean_reply = parsed_response.get("reply", "I'm here to help! Could you please rephrase that?")
+            action = parsed_response.get("action", "none")
+            parameters = parsed_response.get("parameters", {})
+            
+            print(f" * Parsed - Reply: '{clean_reply}', Action: '{action}'")
+            
+        except json.JSONDecodeError as e:
+            print(f" * JSON parsing failed: {e}")
+            # If JSON parsing fails, use the raw text as reply
+            clean_reply = raw_text if raw_text else "I'm here to help! Could you please rephrase your question?"
+            action = "none"
+            parameters = {}
+        return clean_reply, action, parameters
+
+    def _finish(self, message, user_id, context, parsed, session=None):
+        """Run the requested action and save the turn"""
+        clean_reply, action, parameters = parsed
+
+        # Handle agent response with the parsed data
+        result = self.tools.handle_agent_response({
+            "reply": clean_reply,
+            "action": action,
+            "parameters": parameters
+        }, user_id, context)
+        
+        # Save memory (one write path for the agent and the chat session)
+        self.memory.save_turn(user_id, message, result, session)
+
+        print(f" * Final result: {result}")
+        return result
+
+    def process_message(self, message, user_id, user_context=None, session=None):
+        """Answer one chat message.
+
+        `user_context` is the request's UserContext when the caller already
+        built one; otherwise it is loaded here. `session` ({sessionId,
+        userName, userEmail}) says which chat session the turn is saved to.
+        """
         if not hasattr(self, 'is_initialized') or not self.is_initialized:
             return {
                 "reply": "I'm still getting ready. Please try again in a moment.",
@@ -66,56 +166,19 @@ EXAMPLES:
 
         try:
             print(f" * Processing message from user {user_id}: '{message}'")
-            
-            # Load context + memory
-            user_context = self.tools.get_user_context(user_id)
-            history = self.memory.get_recent_history(user_id)
-
-            print(f" * User context: {user_context}")
-            print(f" * Conversation history: {history}")
-
-            # Build structured prompt
-            prompt = self.build_prompt(message, user_context, history)
-            print(f" * Prompt built, length: {len(prompt)}")
-
-            # Model response
-            ai_response = self.model.generate_content(prompt)
-            raw_text = ai_response.text
-            print(f" * Raw AI response: {raw_text}")
-
-            # Clean and parse JSON response
-            cleaned_response = self.clean_json_response(raw_text)
-            print(f" * Cleaned response: {cleaned_response}")
-
-            # Parse JSON response
-            try:
-                parsed_response = json.loads(cleaned_response)
-                clean_reply = parsed_response.get("reply", "I'm here to help! Could you please rephrase that?")
-                action = parsed_response.get("action", "none")
-                parameters = parsed_response.get("parameters", {})
-                
-                print(f" * Parsed - Reply: '{clean_reply}', Action: '{action}'")
-                
-            except json.JSONDecodeError as e:
-                print(f" * JSON parsing failed: {e}")
-                # If JSON parsing fails, use the raw text as reply
-                clean_reply = raw_text if raw_text else "I'm here to help! Could you please rephrase your question?"
-                action = "none"
-                parameters = {}
-
-            # Save memory
-            self.memory.save_message(user_id, "user", message)
-            self.memory.save_message(user_id, "agent", clean_reply)
-
-            # Handle agent response with the parsed data
-            result = self.tools.handle_agent_response({
-                "reply": clean_reply,
-                "action": action,
-                "parameters": parameters
-            }, user_id)
-            
-            print(f" * Final result: {result}")
-            return result
+            routed = self._routed(message, user_id, user_context, session)
+            if routed is not None:
+                return routed
+
+            context, cache_context, prompt = self._prepare(message, user_id, user_context)
+
+            parsed = self._cached_response(message, cache_context)
+            if parsed is None:
+                # Model response
+                ai_response = self.model.generate_content(prompt)
+                parsed = self._parse_response(ai_response.text)
+                self._cache_response(message, cache_context, parsed)
+            return self._finish(message, user_id, context, parsed, session)
             
         except Exception as e:
             print(f" * Error in process_message: {e}")
@@ -124,4 +187,57 @@ EXAMPLES:
             return {
                 "reply": "I encountered an error while processing your message. Please try again.",
                 "action": "none"
-            }
\ No newline at end of file
+            }
+
+    def process_message_stream(self, message, user_id, user_context=None, session=None):
+        """Streaming variant of process_message.
+
+        Yields ("delta", text) events with reply text as the model generates
+        it, then one ("final", result) event with the same result
+        process_message would return. The turn is saved once the model is done.
+        """
+        if not hasattr(self, 'is_initialized') or not self.is_initialized:
+            yield "final", {
+                "reply": "I'm still getting ready. Please try again in a moment.",
+                "action": "none"
+            }
+            return
+
+        try:
+            print(f" * Streaming message from user {user_id}: '{message}'")
+            routed = self._routed(message, user_id, user_context, session)
+            if routed is not None:
+                yield "final", routed
+                return
+
+            context, cache_context, prompt = self._prepare(message, user_id, user_context)
+
+            parsed = self._cached_response(message, cache_context)
+            if parsed is not None:
+                yield "delta", parsed[0]
+                yield "final", self._finish(message, user_id, context, parsed, session)
+                return
+
+            parser = ReplyStreamParser()
+            for chunk in self.model.generate_content(prompt, stream=True):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. safety metadata)
+                    continue
+                delta = parser.feed(text)
+                if delta:
+                    yield "delta", delta
+
+            parsed = self._parse_response(parser.buffer)
+            self._cache_response(message, cache_context, parsed)
+            yield "final", self._finish(message, user_id, context, parsed, session)
+
+        except Exception as e:
+            print(f" * Error in process_message_stream: {e}")
+            import traceback
+            traceback.print_exc()
+            yield "final", {
+                "reply": "I encountered an error while processing your message. Please try again.",
+                "action": "none"
+            }
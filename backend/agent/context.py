@@ -0,0 +1,270 @@
+from bson import ObjectId
+
+# Number of topics without shipping the topic list itself
+TOPIC_COUNT = {'$cond': [{'$isArray': '$topics'}, {'$size': '$topics'}, 0]}
+
+# Course fields needed by each kind of consumer
+COURSE_SUMMARY_PROJECTION = {'title': 1, 'topicCount': TOPIC_COUNT}
+COURSE_TOPICS_PROJECTION = {'title': 1, 'topics': 1}
+RECOMMENDATION_PROJECTION = {
+    'title': 1, 'description': 1, 'instructor': 1,
+    'duration': 1, 'difficulty': 1, 'topicCount': TOPIC_COUNT
+}
+# The same fields from a catalog.CourseRecord
+RECOMMENDATION_FIELDS = {'_id': 1, **{field: 1 for field in RECOMMENDATION_PROJECTION}}
+
+
+def topic_count(course):
+    if 'topicCount' in course:
+        return course['topicCount']
+    topics = course.get('topics')
+    return len(topics) if isinstance(topics, list) else 0
+
+
+class UserContext:
+    """Learning data for one user, loaded once with batched queries.
+
+    The chatbot, the Flowise tools and AgentTools all read from this object
+    instead of each re-querying enrollments, courses and progress.
+    """
+
+    def __init__(self, db, user_id, user, user_filter, enrollments, courses, progress_by_course,
+                 recommender=None, cache=None, recommendations_key=None, catalog=None):
+        self.db = db
+        self.recommender = recommender
+        self.catalog = catalog
+        self.cache = cache
+        self.recommendations_key = recommendations_key
+        self.user_id = user_id
+        self.user = user
+        self.user_filter = user_filter
+        self.enrollments = enrollments
+        self.courses = courses
+        self.progress_by_course = progress_by_course
+        self._course_progress = None
+        self._recommendations = {}
+
+    def snapshot(self):
+        """Plain data for the context cache (courses keyed by string id)"""
+        return {
+            'enrollments': self.enrollments,
+            'courses': self.courses,
+            'progressByCourse': self.progress_by_course
+        }
+
+    def course_progress(self):
+        """One entry per enrollment whose course still exists"""
+        if self._course_progress is None:
+            entries = []
+            for enrollment in self.enrollments:
+                course = self.courses.get(enrollment.get('courseId'))
+                if not course:
+                    continue
+                progress = self.progress_by_course.get(enrollment['courseId']) or {}
+                topics = course.get('topics')
+                completed = progress.get('completedTopics')
+                entries.append({
+                    'courseTitle': str(course.get('title', 'Untitled')),
+                    'courseId': enrollment['courseId'],
+                    'progress': float(progress.get('progress', 0) or 0),
+                    'completedTopics': completed if isinstance(completed, list) else [],
+                    'totalTopics': topic_count(course),
+                    'topics': topics if isinstance(topics, list) else [],
+                    'enrolledAt': enrollment.get('enrolledAt')
+                })
+            self._course_progress = entries
+        return self._course_progress
+
+    def average_progress(self):
+        entries = self.course_progress()
+        return sum(e['progress'] for e in entries) / len(entries) if entries else 0
+
+    def progress_summary(self):
+        """Compact per-course progress (no topic lists)"""
+        return [{
+            'courseTitle': e['courseTitle'],
+            'progress': e['progress'],
+            'completedTopics': len(e['completedTopics']),
+            'totalTopics': e['totalTopics']
+        } for e in self.course_progress()]
+
+    def for_prompt(self):
+        """The subset of the context the agent prompt uses"""
+        summary = self.progress_summary()
+        return {
+            'name': self.user.get('name') if self.user else None,
+            'email': self.user.get('email') if self.user else None,
+            'totalEnrollments': len(self.enrollments),
+            'courseProgress': summary,
+            'hasProgress': len(summary) > 0
+        }
+
+    def recommendations(self, limit=5):
+        """Courses to suggest (memoized).
+
+        Ranked by the recommender when one is attached (each course gets
+        `score` and `reason`); otherwise any courses the user is not
+        enrolled in. With a catalog (catalog.CourseCatalog) the course
+        details come from its in-memory snapshot. With a cache the lists
+        are stored per limit under `recommendations_key` next to the
+        cached context, so they are invalidated with it.
+        """
+        if limit not in self._recommendations:
+            cached = {}
+            if self.cache is not None:
+                cached = self.cache.get(self.recommendations_key) or {}
+            if str(limit) in cached:
+                self._recommendations[limit] = cached[str(limit)]
+            else:
+                self._recommendations[limit] = self._load_recommendations(limit)
+                if self.cache is not None:
+                    self.cache.set(
+                        self.recommendations_key, {**cached, str(limit): self._recommendations[limit]}
+                    )
+        return self._recommendations[limit]
+
+    def _load_recommendations(self, limit):
+        if self.recommender is not None:
+            ranked = self.recommender.recommend({
+                e['courseId']: (self.progress_by_course.get(e['courseId']) or {}).get('progress', 0)
+                for e in self.enrollments if e.get('courseId')
+            }, k=limit)
+            if ranked:
+                found = self._courses_by_id([course_id for course_id, _, _ in ranked])
+                return [
+                    {**found[course_id], 'score': score, 'reason': reason}
+                    for course_id, score, reason in ranked if course_id in found
+                ]
+        if self.catalog is not None:
+            enrolled = {e.get('courseId') for e in self.enrollments}
+            snapshot = self.catalog.snapshot()
+            return [
+                self._course_summary(snapshot.records[course_id])
+                for course_id in snapshot.order if course_id not in enrolled
+            ][:limit]
+        enrolled = [
+            ObjectId(e['courseId']) for e in self.enrollments
+            if ObjectId.is_valid(e.get('courseId', ''))
+        ]
+        return list(self.db['courses'].find(
+            {'_id': {'$nin': enrolled}},
+            RECOMMENDATION_PROJECTION
+        ).limit(limit))
+
+    @staticmethod
+    def _course_summary(record):
+        # Fields the course document lacks are left out, as a projection would
+        return {k: v for k, v in record.to_dict(RECOMMENDATION_FIELDS).items() if v is not None}
+
+    def _courses_by_id(self, course_ids):
+        if self.catalog is not None:
+            return {
+                course_id: self._course_summary(record)
+                for course_id, record in self.catalog.many(course_ids).items()
+            }
+        ids = [ObjectId(course_id) for course_id in course_ids if ObjectId.is_valid(course_id)]
+        return {
+            str(course['_id']): course
+            for course in self.db['courses'].find({'_id': {'$in': ids}}, RECOMMENDATION_PROJECTION)
+        }
+
+    def recent_study_updates(self, limit=10):
+        return list(self.db['study_updates'].find(
+            self.user_filter,
+            {'content': 1, 'date': 1, 'verified': 1}
+        ).sort('date', -1).limit(limit))
+
+
+class UserContextBuilder:
+    """Builds a UserContext with a constant number of queries.
+
+    `resolver` is an optional identity resolver (see identity.UserResolver);
+    without one the id is matched as a Clerk id and userId is filtered as-is.
+
+    `recommender` is an optional recommender.CourseRecommender and
+    `catalog` an optional catalog.CourseCatalog, both used by
+    UserContext.recommendations().
+
+    `cache` is an optional get/set/delete/clear cache (see cache.make_cache).
+    Assembled contexts and their recommendations are cached per canonical
+    user key; write paths that change enrollments, progress or courses must
+    call invalidate() or invalidate_all().
+    """
+
+    def __init__(self, db, resolver=None, cache=None, recommender=None, catalog=None):
+        self.db = db
+        self.resolver = resolver
+        self.cache = cache
+        self.recommender = recommender
+        self.catalog = catalog
+
+    def _cache_keys(self, user_key):
+        return [f"ctx:{user_key}:topics", f"ctx:{user_key}:summary", f"ctx:{user_key}:recs"]
+
+    def invalidate(self, user_id):
+        """Drop the cached context of one user (any of their ids)"""
+        if self.cache is None or not user_id:
+            return
+        resolved = self.resolver.resolve(user_id) if self.resolver is not None else None
+        for user_key in {user_id, resolved.key if resolved else user_id}:
+            for key in self._cache_keys(user_key):
+                self.cache.delete(key)
+
+    def invalidate_all(self):
+        """Drop every cached context (e.g. after a catalog change)"""
+        if self.cache is not None:
+            self.cache.clear()
+
+    def build(self, user_id, include_topics=True):
+        if self.resolver is not None:
+            resolved = self.resolver.resolve(user_id)
+            user = resolved.user if resolved else None
+            user_filter = resolved.user_filter() if resolved else {'userId': user_id}
+            user_key = resolved.key if resolved else user_id
+        else:
+            user = self.db['users'].find_one({'clerkId': user_id})
+            user_filter = {'userId': user_id}
+            user_key = user_id
+
+        cache_keys = self._cache_keys(user_key)
+        cache_key = cache_keys[0 if include_topics else 1]
+        context_options = {
+            'recommender': self.recommender, 'catalog': self.catalog,
+            'cache': self.cache, 'recommendations_key': cache_keys[2]
+        }
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return UserContext(
+                    self.db, user_id, user, user_filter, cached['enrollments'],
+                    cached['courses'], cached['progressByCourse'], **context_options
+                )
+
+        enrollments = list(self.db['enrollments'].find(
+            user_filter,
+            {'courseId': 1, 'enrolledAt': 1, 'lastAccessed': 1}
+        ))
+        course_ids = [e.get('courseId') for e in enrollments if e.get('courseId')]
+        object_ids = [ObjectId(cid) for cid in set(course_ids) if ObjectId.is_valid(cid)]
+
+        courses = {}
+        progress_by_course = {}
+        if object_ids:
+            projection = COURSE_TOPICS_PROJECTION if include_topics else COURSE_SUMMARY_PROJECTION
+            courses = {
+                str(course['_id']): course
+                for course in self.db['courses'].find({'_id': {'$in': object_ids}}, projection)
+            }
+            for progress in self.db['progress'].find(
+                {**user_filter, 'courseId': {'$in': course_ids}},
+                {'courseId': 1, 'progress': 1, 'completedTopics': 1}
+            ):
+                progress_by_course.setdefault(progress['courseId'], progress)
+
+        context = UserContext(
+            self.db, user_id, user, user_filter, enrollments, courses, progress_by_course,
+            **context_options
+        )
+        if self.cache is not None:
+            self.cache.set(cache_key, context.snapshot())
+        return context
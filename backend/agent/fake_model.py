@@ -0,0 +1,42 @@
+import json
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    Returns scripted responses (or a canned JSON reply) and supports
+    stream=True by yielding the text in small chunks, so the agent and the
+    streaming endpoint can run locally and in tests without a Gemini key.
+    Enable it in the app with AGENT_MODEL=fake.
+    """
+
+    model_name = 'fake'
+
+    def __init__(self, responses=None, chunk_size=8):
+        self.responses = list(responses or [])
+        self.chunk_size = chunk_size
+        self.prompts = []
+
+    def _next_text(self, prompt):
+        self.prompts.append(prompt)
+        if self.responses:
+            return self.responses.pop(0)
+        return json.dumps({
+            "reply": "This is a local test reply from the ElevateU agent.",
+            "action": "none",
+            "parameters": {}
+        })
+
+    def generate_content(self, prompt, stream=False):
+        text = self._next_text(prompt)
+        if not stream:
+            return FakeResponse(text)
+        return [
+            FakeResponse(text[i:i + self.chunk_size])
+            for i in range(0, len(text), self.chunk_size)
+        ]
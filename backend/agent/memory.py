@@ -2,8 +2,17 @@ from datetime import datetime
 from bson import ObjectId
 
 class ChatMemory:
-    def __init__(self, db):
+    """Per-user agent conversation memory.
+
+    With a `store` (conversation_store.ConversationStore) each turn is
+    written once into the chat session it belongs to, and the agent's
+    history is read back from the same messages the session endpoints
+    serve. Without one it falls back to the `agent_memory` collection.
+    """
+
+    def __init__(self, db, store=None):
         self.collection = db["agent_memory"]
+        self.store = store
 
     def save_message(self, user_id, role, content):
         self.collection.insert_one({
@@ -13,11 +22,40 @@ class ChatMemory:
             "timestamp": datetime.utcnow()
         })
 
+    def save_turn(self, user_id, message, result, session=None):
+        """Persist the user's message and the agent's final reply.
+
+        `session` is {sessionId, userName, userEmail}; turns without one go
+        to a per-user "agent_<userId>" session.
+        """
+        if self.store is None:
+            self.save_message(user_id, "user", message)
+            self.save_message(user_id, "agent", result.get("reply", ""))
+            return
+
+        session = session or {}
+        session_id = session.get("sessionId") or f"agent_{user_id}"
+        owner = {k: session[k] for k in ("userName", "userEmail") if k in session}
+        self.store.append(session_id, user_id, {"type": "user", "content": message}, owner=owner)
+        self.store.append(session_id, user_id, {
+            "type": "agent",
+            "content": result.get("reply", ""),
+            "action": result.get("action", "none"),
+            "data": result.get("data", {})
+        })
+
     def get_recent_history(self, user_id, limit=5):
+        if self.store is not None:
+            messages = self.store.recent_history(user_id, limit)
+            return "\n".join(
+                f"{'agent' if m.get('type') == 'agent' else 'user'}: {m.get('content', '')}"
+                for m in messages
+            )
+
         messages = list(self.collection.find({"userId": user_id})
                           .sort("timestamp", -1)
                           .limit(limit))
         history = []
         for m in messages:
             history.append(f"{m['role']}: {m['content']}")
-        return "\n".join(history[::-1])  # Reverse to show oldest first
\ No newline at end of file
+        return "\n".join(history[::-1])  # Reverse to show oldest first
@@ -0,0 +1,221 @@
+import json
+import threading
+import time
+
+from tokenizer import tokenize
+
+# The instruction block never changes, so it is assembled once and leads
+# the prompt (a stable prefix also lets the provider reuse it)
+STATIC_PREFIX = """
+You are ElevateU Agent — a friendly learning assistant for an online learning platform.
+
+RESPONSE REQUIREMENTS:
+- Be conversational and helpful
+- If user asks about progress, courses, learning, or recommendations, provide specific answers
+- For progress-related questions, use action: "get_progress"
+- For course recommendations, use action: "recommend_courses"
+- For general questions, just answer conversationally with action: "none"
+- When COURSE MATERIAL is provided, base course-specific answers on it and name the course
+
+CRITICAL: You MUST respond with VALID JSON only in this exact format:
+{"reply": "Your helpful response here", "action": "none|get_progress|recommend_courses", "parameters": {}}
+
+EXAMPLES:
+- User: "What is Python?" → {"reply": "Python is a popular programming language known for being beginner-friendly!", "action": "none", "parameters": {}}
+- User: "Show my progress" → {"reply": "Let me check your learning progress!", "action": "get_progress", "parameters": {}}
+- User: "What courses should I take?" → {"reply": "I'll find some great courses for you!", "action": "recommend_courses", "parameters": {}}
+""".strip()
+
+DEFAULT_TOKEN_BUDGET = 1500
+MAX_TOPICS_PER_COURSE = 5
+MAX_HISTORY_LINE_CHARS = 400
+# Share of the free budget kept for history before context is packed
+HISTORY_SHARE = 0.25
+# Most of the free budget retrieved course material may take
+MATERIAL_SHARE = 0.3
+
+PROMPT_TEMPLATE = (
+    "{prefix}\n\n"
+    "USER CONTEXT:\n{context}\n\n"
+    "{material}"
+    "CONVERSATION HISTORY:\n{history}\n\n"
+    "{message}"
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def compact_json(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def _words(text):
+    return set(tokenize(text))
+
+
+def _topic_title(topic):
+    return topic.get('title', '') if isinstance(topic, dict) else str(topic)
+
+
+class PromptBuilder:
+    """Assembles agent prompts within a token budget.
+
+    Course entries are ranked by word overlap with the message (then by
+    their original order) and dropped from the tail once the budget is
+    spent; topic lists are cut to the most relevant few. Retrieved course
+    material (agent.retrieval snippets, best first) is packed before the
+    context, up to MATERIAL_SHARE of the budget. Remaining budget goes to
+    the most recent history lines. build() returns the prompt and
+    per-request stats; stats() aggregates them.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        # Fixed cost of every prompt: instructions plus section headers
+        self.fixed_tokens = estimate_tokens(
+            PROMPT_TEMPLATE.format(prefix=STATIC_PREFIX, context='', material='', history='None', message='')
+        )
+        self._lock = threading.Lock()
+        self.count = 0
+        self._tokens_sum = 0
+        self._max_tokens = 0
+        self._build_ms_sum = 0.0
+        self.last = None
+
+    def _rank_courses(self, courses, message_words):
+        def score(indexed):
+            index, course = indexed
+            words = _words(course.get('courseTitle', ''))
+            for topic in course.get('topics') or []:
+                words |= _words(_topic_title(topic))
+            return (-len(words & message_words), index)
+
+        return [course for _, course in sorted(enumerate(courses), key=score)]
+
+    def _trim_topics(self, course, message_words):
+        topics = course.get('topics')
+        if not isinstance(topics, list) or len(topics) <= MAX_TOPICS_PER_COURSE:
+            return course
+        ranked = sorted(
+            topics, key=lambda topic: -len(_words(_topic_title(topic)) & message_words)
+        )
+        return {**course, 'topics': ranked[:MAX_TOPICS_PER_COURSE]}
+
+    def _fit_context(self, user_context, message_words, budget):
+        """Compact context JSON within `budget` tokens -> (text, included, omitted)"""
+        if not user_context:
+            return "No user context available", 0, 0
+        courses = user_context.get('courseProgress') or []
+        base = {key: value for key, value in user_context.items() if key != 'courseProgress'}
+        ranked = [self._trim_topics(course, message_words)
+                  for course in self._rank_courses(courses, message_words)]
+
+        # Room for the base fields and an "omittedCourses" counter
+        used = estimate_tokens(compact_json({**base, 'courseProgress': [], 'omittedCourses': 0}))
+        included = []
+        for course in ranked:
+            cost = estimate_tokens(compact_json(course)) + 1
+            if used + cost > budget:
+                break
+            included.append(course)
+            used += cost
+        omitted = len(courses) - len(included)
+        context = {**base, 'courseProgress': included}
+        if omitted:
+            context['omittedCourses'] = omitted
+        return compact_json(context), len(included), omitted
+
+    def _fit_material(self, snippets, budget):
+        """COURSE MATERIAL section within `budget` tokens -> (text, included)"""
+        if not snippets:
+            return '', 0
+        header = "COURSE MATERIAL:\n"
+        used = estimate_tokens(header) + 1
+        lines = []
+        for snippet in snippets:
+            label = snippet['courseTitle']
+            if snippet.get('topic'):
+                label = f"{label} / {snippet['topic']}"
+            line = f"- [{label}] {snippet['text']}"
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        if not lines:
+            return '', 0
+        return header + '\n'.join(lines) + '\n\n', len(lines)
+
+    def _fit_history(self, history, budget):
+        """Most recent history lines within `budget` tokens"""
+        lines = [line[:MAX_HISTORY_LINE_CHARS] for line in (history or '').splitlines() if line.strip()]
+        kept = []
+        used = 0
+        for line in reversed(lines):
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+        kept.reverse()
+        return '\n'.join(kept), len(kept), len(lines) - len(kept)
+
+    def build(self, user_message, user_context, conversation_history, material=None):
+        started = time.perf_counter()
+        message_words = _words(user_message)
+        message_part = f'USER MESSAGE: "{user_message}"'
+
+        remaining = max(self.token_budget - self.fixed_tokens - estimate_tokens(message_part), 0)
+        material_text, material_included = self._fit_material(material, int(remaining * MATERIAL_SHARE))
+        remaining = max(remaining - estimate_tokens(material_text), 0)
+        history_reserve = min(estimate_tokens(conversation_history or ''), int(remaining * HISTORY_SHARE))
+        context_text, courses_included, courses_omitted = self._fit_context(
+            user_context, message_words, remaining - history_reserve
+        )
+        remaining = max(remaining - estimate_tokens(context_text), 0)
+        history_text, history_included, history_omitted = self._fit_history(
+            conversation_history, remaining
+        )
+
+        prompt = PROMPT_TEMPLATE.format(
+            prefix=STATIC_PREFIX,
+            context=context_text,
+            material=material_text,
+            history=history_text or 'None',
+            message=message_part
+        )
+        stats = {
+            'chars': len(prompt),
+            'tokens': estimate_tokens(prompt),
+            'budget': self.token_budget,
+            'coursesIncluded': courses_included,
+            'coursesOmitted': courses_omitted,
+            'materialSnippets': material_included,
+            'historyLines': history_included,
+            'historyOmitted': history_omitted,
+            'buildMs': round((time.perf_counter() - started) * 1000, 3)
+        }
+        self._record(stats)
+        return prompt, stats
+
+    def _record(self, stats):
+        with self._lock:
+            self.count += 1
+            self._tokens_sum += stats['tokens']
+            self._max_tokens = max(self._max_tokens, stats['tokens'])
+            self._build_ms_sum += stats['buildMs']
+            self.last = stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                'prompts': self.count,
+                'budget': self.token_budget,
+                'avgTokens': round(self._tokens_sum / self.count, 1) if self.count else 0,
+                'maxTokens': self._max_tokens,
+                'avgBuildMs': round(self._build_ms_sum / self.count, 3) if self.count else 0,
+                'last': self.last
+            }
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import re
+
+# Actions that change data; their replies are never served from cache
+UNCACHEABLE_ACTIONS = {'update_progress'}
+
+_SPACES = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.,;:]+$')
+
+# Words that tie a message to the user's own enrollments and progress
+PERSONAL_WORDS = frozenset("i i'm im i've i'd me my mine myself we our us".split())
+# Words that only make sense after earlier turns ("is it hard?", "tell me more")
+FOLLOW_UP_WORDS = frozenset('it its that this those these them they more again above previous earlier else'.split())
+FOLLOW_UP_OPENERS = frozenset('and but so also then why ok okay yes no sure'.split())
+
+# What a reply depends on, and so what its key must cover
+STANDALONE = 'standalone'
+PERSONAL = 'personal'
+FOLLOW_UP = 'follow_up'
+
+
+def normalize_message(message):
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    text = _SPACES.sub(' ', (message or '').strip().lower())
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+def message_kind(normalized):
+    """STANDALONE, PERSONAL or FOLLOW_UP for a normalized message"""
+    words = normalized.split()
+    if not words or words[0] in FOLLOW_UP_OPENERS or any(w in FOLLOW_UP_WORDS for w in words):
+        return FOLLOW_UP
+    if any(w in PERSONAL_WORDS for w in words):
+        return PERSONAL
+    return STANDALONE
+
+
+def context_fingerprint(prompt_context):
+    """Stable hash of the user-context fields the prompt is built from"""
+    encoded = json.dumps(prompt_context, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Caches parsed model replies in front of the Gemini call.
+
+    `cache_context` is {'user': prompt context, 'material': snippet texts}.
+    Every key covers the model name, the retrieved material and the
+    normalized message. Standalone questions ("what is python") stop
+    there and are shared by all users; messages about the user's own data
+    ("my progress") also cover a fingerprint of the user context.
+    Follow-ups ("tell me more", "is it hard") depend on the conversation
+    and are never cached. Entries hold the parsed (reply, action,
+    parameters); the agent still runs the action against live data on a
+    hit. `cache` is any get/set cache from cache.make_cache(), which
+    provides TTL/LRU eviction and hit counters.
+    """
+
+    def __init__(self, cache, model_name):
+        self.cache = cache
+        self.model_name = model_name
+        self.skipped = 0
+
+    def key(self, message, cache_context):
+        """Cache key for the message, or None when it must not be cached"""
+        normalized = normalize_message(message)
+        kind = message_kind(normalized)
+        if kind == FOLLOW_UP:
+            return None
+        parts = [self.model_name, context_fingerprint(cache_context.get('material') or [])]
+        if kind == PERSONAL:
+            parts.append(context_fingerprint(cache_context.get('user')))
+        raw = '\n'.join([*parts, normalized])
+        return 'llm:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, message, cache_context):
+        key = self.key(message, cache_context)
+        entry = self.cache.get(key) if key is not None else None
+        if entry is None:
+            return None
+        return entry['reply'], entry['action'], entry.get('parameters') or {}
+
+    def set(self, message, cache_context, reply, action, parameters):
+        key = self.key(message, cache_context)
+        # Shared entries must not greet the next user by this user's name
+        first_name = str((cache_context.get('user') or {}).get('name') or '').split()[:1]
+        addresses_user = (
+            first_name and message_kind(normalize_message(message)) == STANDALONE
+            and re.search(rf'\b{re.escape(first_name[0])}\b', str(reply))
+        )
+        if key is None or action in UNCACHEABLE_ACTIONS or addresses_user:
+            self.skipped += 1
+            return
+        self.cache.set(key, {
+            'reply': reply,
+            'action': action,
+            'parameters': parameters
+        })
+
+    def stats(self):
+        return {**self.cache.stats(), 'model': self.model_name, 'skipped': self.skipped}
@@ -0,0 +1,256 @@
+"""Local retrieval of course material for the agent prompt.
+
+Every course topic (and every course description) becomes a short
+snippet. Snippets are embedded as hashed TF-IDF vectors: word unigrams
+and bigrams are hashed into DIMENSIONS buckets with crc32, which is
+stable across processes, so an index built on one machine can be loaded
+on another. Nothing calls an external embedding service. A query is
+vectorized the same way and scored by cosine similarity through an
+inverted list of buckets. Only the top few snippets that clear
+MIN_SCORE go into the prompt, and snippets from the user's own courses
+get a boost.
+
+The index is rebuilt from MongoDB in the background. It can also be built
+offline from a `mongoexport --jsonArray` dump of the courses collection
+and loaded at startup:
+
+    python -m agent.retrieval build courses.json topic_index.json
+"""
+import json
+import math
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+
+from background import guarded, start_background, start_periodic
+from tokenizer import QUESTION_STOPWORDS, tokenize
+
+DIMENSIONS = 1 << 18
+DEFAULT_TOP_K = 3
+MIN_SCORE = 0.12
+# Score multiplier for snippets from courses the user is enrolled in
+ENROLLED_BOOST = 1.25
+MAX_SNIPPET_CHARS = 300
+
+
+def _bucket(feature):
+    return zlib.crc32(feature.encode('utf-8')) % DIMENSIONS
+
+
+def hashed_features(text):
+    """Bucket counts of the text's unigrams and bigrams"""
+    tokens = tokenize(text, QUESTION_STOPWORDS)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return Counter(_bucket(feature) for feature in features)
+
+
+def _topic_parts(topic):
+    """(title, body) of a topic stored as a string or a document"""
+    if isinstance(topic, dict):
+        body = topic.get('description') or topic.get('content') or topic.get('summary') or ''
+        return str(topic.get('title', '')), str(body)
+    return str(topic), ''
+
+
+def course_snippets(course):
+    course_id = str(course.get('_id'))
+    course_title = str(course.get('title') or 'Untitled')
+    snippets = []
+    description = course.get('description')
+    if isinstance(description, str) and description.strip():
+        snippets.append({
+            'courseId': course_id,
+            'courseTitle': course_title,
+            'topic': None,
+            'text': description.strip()[:MAX_SNIPPET_CHARS]
+        })
+    topics = course.get('topics')
+    for topic in topics if isinstance(topics, list) else []:
+        title, body = _topic_parts(topic)
+        if not title.strip() and not body.strip():
+            continue
+        text = f"{title.strip()}: {body.strip()}" if body.strip() else title.strip()
+        snippets.append({
+            'courseId': course_id,
+            'courseTitle': course_title,
+            'topic': title.strip(),
+            'text': text[:MAX_SNIPPET_CHARS]
+        })
+    return snippets
+
+
+class TopicIndex:
+    """Immutable hashed-vector index over course snippets"""
+
+    __slots__ = ('snippets', 'idf', 'postings', 'built_at')
+
+    def __init__(self, snippets, idf, postings, built_at=None):
+        self.snippets = snippets
+        self.idf = idf
+        self.postings = postings
+        self.built_at = built_at or time.time()
+
+    @classmethod
+    def build(cls, courses):
+        snippets = []
+        for course in courses:
+            snippets.extend(course_snippets(course))
+
+        # The course title is part of every snippet's vector, so "loops in
+        # Python" finds the loops topic of the Python course
+        counts = [hashed_features(f"{s['courseTitle']} {s['text']}") for s in snippets]
+        document_frequency = Counter()
+        for features in counts:
+            document_frequency.update(features.keys())
+        total = len(snippets)
+        idf = {bucket: math.log((1 + total) / (1 + df)) + 1 for bucket, df in document_frequency.items()}
+
+        postings = {}
+        for i, features in enumerate(counts):
+            weights = {bucket: (1 + math.log(tf)) * idf[bucket] for bucket, tf in features.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for bucket, weight in weights.items():
+                postings.setdefault(bucket, []).append((i, weight / norm))
+        return cls(snippets, idf, postings)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            data['snippets'],
+            {int(bucket): value for bucket, value in data['idf'].items()},
+            {int(bucket): [tuple(entry) for entry in entries] for bucket, entries in data['postings'].items()},
+            data.get('builtAt')
+        )
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'dimensions': DIMENSIONS,
+                'builtAt': self.built_at,
+                'snippets': self.snippets,
+                'idf': self.idf,
+                'postings': self.postings
+            }, f, separators=(',', ':'))
+
+    def search(self, query, k=DEFAULT_TOP_K, min_score=MIN_SCORE, boost_courses=()):
+        """Top `k` (snippet, score) pairs by cosine similarity"""
+        features = hashed_features(query)
+        weights = {bucket: (1 + math.log(tf)) * self.idf[bucket]
+                   for bucket, tf in features.items() if bucket in self.idf}
+        if not weights:
+            return []
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        scores = {}
+        for bucket, weight in weights.items():
+            for i, doc_weight in self.postings.get(bucket, ()):
+                scores[i] = scores.get(i, 0.0) + weight / norm * doc_weight
+
+        boost_courses = set(boost_courses)
+        results = []
+        for i, score in scores.items():
+            if self.snippets[i]['courseId'] in boost_courses:
+                score *= ENROLLED_BOOST
+            if score >= min_score:
+                results.append((score, i))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return [(self.snippets[i], round(score, 4)) for score, i in results[:k]]
+
+
+class TopicRetriever:
+    """Serves TopicIndex lookups and keeps the index fresh.
+
+    `load_courses` returns the course documents to index; without it only
+    a preloaded `index` is served.
+    """
+
+    def __init__(self, load_courses=None, index=None, top_k=DEFAULT_TOP_K, min_score=MIN_SCORE):
+        self.load_courses = load_courses
+        self.index = index
+        self.top_k = top_k
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._stale = False
+        self.lookups = 0
+        self.hits = 0
+        self._snippets_sum = 0
+        self._ms_sum = 0.0
+
+    def retrieve(self, message, course_ids=()):
+        """Snippet dicts (with `score`) relevant to the message"""
+        index = self.index
+        if index is None:
+            return []
+        started = time.perf_counter()
+        results = index.search(message, self.top_k, self.min_score, boost_courses=course_ids)
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.lookups += 1
+            self.hits += 1 if results else 0
+            self._snippets_sum += len(results)
+            self._ms_sum += elapsed
+        return [{**snippet, 'score': score} for snippet, score in results]
+
+    def refresh(self):
+        """Rebuild the index from `load_courses()`"""
+        if self.load_courses is None:
+            return self.index
+        if not self._refreshing.acquire(blocking=False):
+            # A build is running; make it go round once more so this
+            # request's course changes are not missed
+            self._stale = True
+            return self.index
+        try:
+            self._stale = True
+            while self._stale:
+                self._stale = False
+                started = time.perf_counter()
+                self.index = TopicIndex.build(self.load_courses())
+                build_ms = round((time.perf_counter() - started) * 1000, 1)
+                print(f" * Topic index built: {len(self.index.snippets)} snippets, {build_ms} ms")
+            return self.index
+        finally:
+            self._refreshing.release()
+
+    def refresh_async(self):
+        start_background(guarded(self.refresh, 'Topic index refresh'), 'topic-index-refresh')
+
+    def start_refresh_thread(self, interval_seconds):
+        """Build now (unless an index was preloaded), then every `interval_seconds`"""
+        return start_periodic(
+            guarded(self.refresh, 'Topic index refresh'), interval_seconds, 'topic-index-refresh',
+            run_now=self.index is None
+        )
+
+    def stats(self):
+        index = self.index
+        with self._lock:
+            return {
+                'snippets': len(index.snippets) if index else 0,
+                'builtAt': index.built_at if index else None,
+                'lookups': self.lookups,
+                'hitRate': round(self.hits / self.lookups, 3) if self.lookups else 0,
+                'avgSnippets': round(self._snippets_sum / self.lookups, 2) if self.lookups else 0,
+                'avgMs': round(self._ms_sum / self.lookups, 3) if self.lookups else 0
+            }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        print("usage: python -m agent.retrieval build <courses.json> <topic_index.json>")
+        sys.exit(1)
+    from bson import json_util
+
+    with open(sys.argv[2]) as f:
+        raw = f.read().strip()
+    # mongoexport writes a JSON array with --jsonArray, JSON lines without
+    courses = json_util.loads(raw) if raw.startswith('[') else [
+        json_util.loads(line) for line in raw.splitlines() if line.strip()
+    ]
+    index = TopicIndex.build(courses)
+    index.save(sys.argv[3])
+    print(f"Indexed {len(index.snippets)} snippets from {len(courses)} courses -> {sys.argv[3]}")
@@ -0,0 +1,208 @@
+"""Local intent router for the agent.
+
+Keyword/regex rules (plus an optional naive Bayes model trained offline)
+classify a message before any model call. Intents the tools can answer
+from Mongo alone (progress, recommendations) are routed straight to them
+when the confidence clears the threshold; everything else goes to Gemini.
+
+Train a model from JSON lines of {"text": ..., "intent": ...}:
+
+    python -m agent.router train examples.jsonl intent_model.json
+"""
+import json
+import math
+import re
+import sys
+import threading
+from collections import Counter
+
+ROUTABLE_INTENTS = ('get_progress', 'recommend_courses')
+
+# Canned opening lines; the tools append the data-backed part
+ROUTED_REPLIES = {
+    'get_progress': "Let me check your learning progress!",
+    'recommend_courses': "I'll find some great courses for you!"
+}
+
+# A request phrased as a command or direct question, optionally after a
+# polite lead-in, and without a negation ("why can't I see my progress"
+# and "how do I track my progress" are troubleshooting, not requests)
+REQUEST_START = (
+    r"^(?!.*\b(?:not|never|cannot)\b)(?!.*n't\b)\s*"
+    r"(?:(?:please|hey|hi|ok(?:ay)?|can you|could you|would you|will you|"
+    r"i want to|i'?d like to|let me)[\s,]+)*"
+)
+
+# (intent, pattern, confidence)
+INTENT_RULES = [
+    ('get_progress',
+     REQUEST_START + r"(show|check|see|view|what'?s|what is|track)\b.*\bmy (learning )?progress\b", 0.95),
+    # A bare mention ("why isn't my progress updating?", "reset my
+    # progress") stays below the threshold and goes to the model
+    ('get_progress', r"\bmy (learning |course )?progress\b", 0.6),
+    ('get_progress', r"\bhow (am i|far am i|much have i)\b.*\b(doing|along|progress(ed|ing)?|completed?|done)\b", 0.85),
+    ('get_progress', r"\b(which|what) (courses|topics) (have i|did i) (completed?|finished|done)\b", 0.8),
+    ('recommend_courses', r"\b(recommend|suggest)\w*\b.*\b(courses?|classes|something|what)\b", 0.95),
+    ('recommend_courses', r"\bwhat (course|courses|class) should i (take|do|learn|study|enroll)\b", 0.95),
+    ('recommend_courses', r"\bwhat should i (learn|study|take) next\b", 0.9),
+    ('recommend_courses', r"\b(any|good|new) courses? (for me|to take)\b", 0.85),
+]
+COMPILED_RULES = [(intent, re.compile(pattern, re.IGNORECASE), confidence)
+                  for intent, pattern, confidence in INTENT_RULES]
+
+# Long messages are usually open-ended even if a rule matches
+LONG_MESSAGE_WORDS = 16
+LONG_MESSAGE_PENALTY = 0.8
+
+_TOKEN = re.compile(r"[a-z']+")
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or '').lower())
+
+
+class NaiveBayesIntentModel:
+    """Multinomial naive Bayes over word tokens (pure Python, JSON file)"""
+
+    def __init__(self, priors, token_log_probs, unknown_log_probs):
+        self.priors = priors
+        self.token_log_probs = token_log_probs
+        self.unknown_log_probs = unknown_log_probs
+
+    @classmethod
+    def train(cls, examples, alpha=1.0):
+        """`examples` is an iterable of (text, intent) pairs"""
+        intent_counts = Counter()
+        token_counts = {}
+        vocabulary = set()
+        for text, intent in examples:
+            intent_counts[intent] += 1
+            tokens = tokenize(text)
+            token_counts.setdefault(intent, Counter()).update(tokens)
+            vocabulary.update(tokens)
+
+        total = sum(intent_counts.values())
+        priors, token_log_probs, unknown_log_probs = {}, {}, {}
+        for intent, count in intent_counts.items():
+            counts = token_counts[intent]
+            denominator = sum(counts.values()) + alpha * (len(vocabulary) + 1)
+            priors[intent] = math.log(count / total)
+            token_log_probs[intent] = {
+                token: math.log((n + alpha) / denominator) for token, n in counts.items()
+            }
+            unknown_log_probs[intent] = math.log(alpha / denominator)
+        return cls(priors, token_log_probs, unknown_log_probs)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['priors'], data['tokenLogProbs'], data['unknownLogProbs'])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'priors': self.priors,
+                'tokenLogProbs': self.token_log_probs,
+                'unknownLogProbs': self.unknown_log_probs
+            }, f)
+
+    def predict(self, text):
+        """(intent, posterior probability) of the most likely intent"""
+        tokens = tokenize(text)
+        if not tokens or not self.priors:
+            return None, 0.0
+        scores = {}
+        for intent, prior in self.priors.items():
+            log_probs = self.token_log_probs[intent]
+            unknown = self.unknown_log_probs[intent]
+            scores[intent] = prior + sum(log_probs.get(token, unknown) for token in tokens)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        normalizer = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / normalizer
+
+
+class RouteDecision:
+    __slots__ = ('intent', 'confidence', 'source')
+
+    def __init__(self, intent, confidence, source):
+        self.intent = intent
+        self.confidence = confidence
+        self.source = source
+
+    def to_dict(self):
+        return {'intent': self.intent, 'confidence': round(self.confidence, 3), 'source': self.source}
+
+
+class IntentRouter:
+    """Classifies messages and counts routing decisions.
+
+    route() returns a RouteDecision for a routable intent at or above
+    `threshold`, otherwise None (the caller falls back to the model).
+    """
+
+    def __init__(self, threshold=0.8, model=None):
+        self.threshold = threshold
+        self.model = model
+        self._lock = threading.Lock()
+        self.routed = Counter()
+        self.fallbacks = 0
+        self.low_confidence = 0
+        self._confidence_sum = 0.0
+
+    def classify(self, message):
+        """Best (intent, confidence, source) from the rules and the model"""
+        best = (None, 0.0, None)
+        for intent, pattern, confidence in COMPILED_RULES:
+            if confidence > best[1] and pattern.search(message or ''):
+                best = (intent, confidence, 'rules')
+
+        if self.model is not None:
+            intent, probability = self.model.predict(message)
+            if intent == best[0]:
+                # Agreement between rules and model raises confidence
+                best = (intent, 1 - (1 - best[1]) * (1 - probability), 'rules+model')
+            elif probability > best[1]:
+                best = (intent, probability, 'model')
+
+        if best[0] and len(tokenize(message)) > LONG_MESSAGE_WORDS:
+            best = (best[0], best[1] * LONG_MESSAGE_PENALTY, best[2])
+        return best
+
+    def route(self, message):
+        intent, confidence, source = self.classify(message)
+        routable = intent in ROUTABLE_INTENTS
+        with self._lock:
+            if routable and confidence >= self.threshold:
+                self.routed[intent] += 1
+                self._confidence_sum += confidence
+                return RouteDecision(intent, confidence, source)
+            self.fallbacks += 1
+            if routable:
+                self.low_confidence += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            routed = sum(self.routed.values())
+            total = routed + self.fallbacks
+            return {
+                'threshold': self.threshold,
+                'model': self.model is not None,
+                'routed': dict(self.routed),
+                'fallbacks': self.fallbacks,
+                'lowConfidence': self.low_confidence,
+                'routedRate': round(routed / total, 3) if total else 0,
+                'avgRoutedConfidence': round(self._confidence_sum / routed, 3) if routed else 0
+            }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'train':
+        print("usage: python -m agent.router train <examples.jsonl> <model.json>")
+        sys.exit(1)
+    with open(sys.argv[2]) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    NaiveBayesIntentModel.train((row['text'], row['intent']) for row in rows).save(sys.argv[3])
+    print(f"Trained on {len(rows)} examples -> {sys.argv[3]}")
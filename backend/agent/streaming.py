@@ -0,0 +1,65 @@
+import json
+import re
+
+REPLY_KEY = re.compile(r'"reply"\s*:\s*"')
+SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class ReplyStreamParser:
+    """Pulls the "reply" string out of a streamed JSON model response.
+
+    The model answers with {"reply": "...", "action": ..., ...}, possibly
+    wrapped in a ```json fence. feed() takes raw chunks as they arrive and
+    returns the newly decoded reply text, so it can be relayed before the
+    JSON object is complete.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = None  # index of the next unread reply character
+        self.done = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.done:
+            return ''
+        if self.position is None:
+            match = REPLY_KEY.search(self.buffer)
+            if not match:
+                return ''
+            self.position = match.end()
+
+        out = []
+        i = self.position
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            # Escape sequence: wait for the rest of it if it is split
+            if i + 1 >= len(self.buffer):
+                break
+            code = self.buffer[i + 1]
+            if code == 'u':
+                if i + 6 > len(self.buffer):
+                    break
+                try:
+                    out.append(chr(int(self.buffer[i + 2:i + 6], 16)))
+                except ValueError:
+                    pass
+                i += 6
+            else:
+                out.append(SIMPLE_ESCAPES.get(code, code))
+                i += 2
+        self.position = i
+        return ''.join(out)
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
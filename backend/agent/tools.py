@@ -1,50 +1,28 @@
 import re
 import json
-from bson import ObjectId
 from datetime import datetime
+from .context import UserContextBuilder, topic_count
 
 class AgentTools:
-    def __init__(self, db):
+    def __init__(self, db, context_builder=None):
         self.db = db
+        self.context_builder = context_builder or UserContextBuilder(db)
 
-    def get_user_context(self, user_id):
+    def build_context(self, user_id):
+        """Load the user's learning context (without topic lists)"""
+        return self.context_builder.build(user_id, include_topics=False)
+
+    def get_user_context(self, user_id, user_context=None):
         try:
-            user = self.db["users"].find_one({"clerkId": user_id})
-            if not user:
+            context = user_context or self.build_context(user_id)
+            if not context.user:
                 return {"error": "User not found"}
-
-            enrollments = list(self.db["enrollments"].find({"userId": user_id}))
-            progress_list = list(self.db["progress"].find({"userId": user_id}))
-
-            # Build course progress
-            course_progress = []
-            for progress in progress_list:
-                course_id = progress.get("courseId")
-                course = self.db["courses"].find_one({"_id": ObjectId(course_id)})
-                if course:
-                    completed = len(progress.get("completedTopics", []))
-                    total = len(course.get("topics", []))
-                    progress_percent = (completed / total * 100) if total > 0 else 0
-                    
-                    course_progress.append({
-                        "courseTitle": course.get("title", "Unknown Course"),
-                        "progress": progress_percent,
-                        "completedTopics": completed,
-                        "totalTopics": total
-                    })
-
-            return {
-                "name": user.get("name"),
-                "email": user.get("email"),
-                "totalEnrollments": len(enrollments),
-                "courseProgress": course_progress,
-                "hasProgress": len(course_progress) > 0
-            }
+            return context.for_prompt()
         except Exception as e:
             print(f"Error in get_user_context: {e}")
             return {"error": str(e)}
 
-    def handle_agent_response(self, parsed_response, user_id):
+    def handle_agent_response(self, parsed_response, user_id, user_context=None):
         """Handle agent response with parsed data"""
         action = parsed_response.get("action", "none")
         reply = parsed_response.get("reply", "I'm here to help!")
@@ -57,10 +35,10 @@ class AgentTools:
             return {"reply": reply, "action": "none"}
 
         if action == "get_progress":
-            return self._handle_get_progress(user_id, reply)
+            return self._handle_get_progress(user_id, reply, user_context)
             
         if action == "recommend_courses":
-            return self._handle_recommend_courses(user_id, reply)
+            return self._handle_recommend_courses(user_id, reply, user_context)
             
         if action == "update_progress":
             return self._handle_update_progress(user_id, parameters, reply)
@@ -68,31 +46,17 @@ class AgentTools:
         # Default fallback
         return {"reply": reply, "action": "none"}
 
-    def _handle_get_progress(self, user_id, base_reply):
+    def _handle_get_progress(self, user_id, base_reply, user_context=None):
         """Handle get progress action"""
         try:
-            progress_list = list(self.db["progress"].find({"userId": user_id}))
-            if not progress_list:
+            context = user_context or self.build_context(user_id)
+            if not context.enrollments:
                 return {
                     "reply": "You haven't started any courses yet. Would you like me to recommend some?",
                     "action": "get_progress"
                 }
 
-            progress_details = []
-            for progress in progress_list:
-                course_id = progress.get("courseId")
-                course = self.db["courses"].find_one({"_id": ObjectId(course_id)})
-                if course:
-                    completed = len(progress.get("completedTopics", []))
-                    total = len(course.get("topics", []))
-                    progress_percent = (completed / total * 100) if total > 0 else 0
-                    
-                    progress_details.append({
-                        "courseTitle": course.get("title", "Unknown Course"),
-                        "progress": progress_percent,
-                        "completedTopics": completed,
-                        "totalTopics": total
-                    })
+            progress_details = context.progress_summary()
 
             # Create a friendly progress summary
             if progress_details:
@@ -118,26 +82,21 @@ class AgentTools:
                 "action": "get_progress"
             }
 
-    def _handle_recommend_courses(self, user_id, base_reply):
+    def _handle_recommend_courses(self, user_id, base_reply, user_context=None):
         """Handle course recommendations"""
         try:
-            # Get user's enrolled courses
-            enrollments = list(self.db["enrollments"].find({"userId": user_id}))
-            enrolled_ids = [e["courseId"] for e in enrollments]
-
-            # Find courses not enrolled in
-            all_courses = list(self.db["courses"].find())
+            # Courses the user is not enrolled in
+            context = user_context or self.build_context(user_id)
             recommendations = []
             
-            for course in all_courses:
-                if str(course["_id"]) not in enrolled_ids:
-                    recommendations.append({
-                        "title": course.get("title", "Untitled Course"),
-                        "description": course.get("description", "No description"),
-                        "instructor": course.get("instructor", "Staff"),
-                        "topics": len(course.get("topics", [])),
-                        "duration": course.get("duration", "Self-paced")
-                    })
+            for course in context.recommendations(limit=3):
+                recommendations.append({
+                    "title": course.get("title", "Untitled Course"),
+                    "description": course.get("description", "No description"),
+                    "instructor": course.get("instructor", "Staff"),
+                    "topics": topic_count(course),
+                    "duration": course.get("duration", "Self-paced")
+                })
 
             # Create recommendation text
             if recommendations:
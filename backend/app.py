@@ -1,17 +1,44 @@
-from flask import Flask, request, jsonify
+import time
+# Cold-start clock, read by create_app()
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Blueprint, Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure, BulkWriteError
 from bson import ObjectId
 from datetime import datetime, timezone
 import os
-from flask import send_from_directory
 from dotenv import load_dotenv
 import atexit
 import functools
-from agent.agent_core import ElevateUAgent
-
-# Import our intelligent chatbot service
+import re
+import threading
+from agent.context import UserContextBuilder, topic_count
+from agent.streaming import sse_event
+from agent.fake_model import FakeModel
+from agent.router import IntentRouter, NaiveBayesIntentModel
+from agent.prompt import PromptBuilder, DEFAULT_TOKEN_BUDGET
+from agent.retrieval import TopicRetriever, TopicIndex, DEFAULT_TOP_K
+from indexes import ensure_indexes
+from cache import make_cache
+from identity import UserResolver, ResolvedUser, user_keys_expression
+from stats import PlatformStats
+from recommender import CourseRecommender, COMPLETED
+from search_index import CourseSearchIndex
+from catalog import CourseCatalog
+from static_files import StaticSite
+from json_provider import FastJSONProvider
+from compression import init_compression
+from write_behind import WriteBehindQueue
+from conversation_store import ConversationStore, check_history_cursor
+from pagination import (
+    parse_limit, encode_cursor, decode_cursor, after_filter, paginate, paginated_response,
+    parse_fields, embedded_fields, top_level
+)
+
+# Import our intelligent chatbot service (the Gemini SDK itself is only
+# imported when the agent is built, see get_agent)
 try:
     from agent.agent_core import ElevateUAgent
     chatbot_available = True
@@ -21,31 +48,100 @@ except ImportError as e:
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+# Every route is registered on this blueprint; create_app() mounts it
+api = Blueprint('elevateu', __name__)
 
-# MongoDB connection with connection pooling and error handling
+# MongoDB connection settings. The client, and every service below that
+# holds it or runs a background thread, is built per process by
+# init_services() on the process's first request. Under gunicorn each
+# worker therefore connects after the fork: a MongoClient (its pool and
+# monitor threads) must not be shared across one.
 MONGO_URI = os.getenv('MONGO_URI')
 DB_NAME = os.getenv('DB_NAME', 'elevateu')
 
-try:
-    # Use connection pooling for better performance
-    client = MongoClient(
-        MONGO_URI,
-        serverSelectionTimeoutMS=5000,  # 5 second timeout
-        connectTimeoutMS=5000,
-        maxPoolSize=50,
-        minPoolSize=10
-    )
-    # Test connection
-    client.server_info()
-    db = client[DB_NAME]
-    print(f"Connected to MongoDB: {DB_NAME}")
-except (ServerSelectionTimeoutError, ConnectionFailure) as e:
-    print(f"MongoDB connection failed: {e}")
-    print("Please ensure MongoDB is running or update MONGO_URI in .env")
-    client = None
-    db = None
+# Import + create_app() and each worker's init_services() are logged
+# against this budget
+COLD_START_BUDGET_MS = float(os.getenv('COLD_START_BUDGET_MS', '1500'))
+
+# Worker processes serving the app (gunicorn.conf.py exports its count).
+# The identity cache, and the context cache unless CONTEXT_CACHE_URL points
+# at a shared server, live in each worker, and a write only invalidates them
+# in the worker that handled it. With several workers their TTLs default to
+# at most LOCAL_CACHE_TTL seconds, which bounds how long another worker can
+# serve a stale entry.
+WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+LOCAL_CACHE_TTL = int(os.getenv('LOCAL_CACHE_TTL', '15'))
+
+
+def cache_ttl(name, default, shared=False):
+    """TTL from env `name`; per-worker caches are capped when several workers run"""
+    if not shared and WORKERS > 1:
+        default = min(default, LOCAL_CACHE_TTL)
+    return int(os.getenv(name, str(default)))
+
+
+# Canonical identity resolution, cached in-process across requests
+# USER_ID_DUAL_READ keeps matching legacy userId forms until
+# migrate_user_ids.py has normalized every row to the canonical key
+USER_ID_DUAL_READ = os.getenv('USER_ID_DUAL_READ', 'true').lower() == 'true'
+
+# Cache of model replies keyed on model + course material + message, plus the
+# user-context fingerprint for messages about the user's own data.
+# Uses its own key prefix so context invalidation never clears it;
+# AGENT_CACHE_TTL=0 disables it.
+AGENT_CACHE_TTL = int(os.getenv('AGENT_CACHE_TTL', '600'))
+
+# Per-process services, set by init_services()
+client = None
+db = None
+courses_collection = None
+users_collection = None
+enrollments_collection = None
+progress_collection = None
+study_updates_collection = None
+chat_sessions_collection = None
+user_resolver = None
+platform_stats = None
+context_cache = None
+course_recommender = None
+course_catalog = None
+search_index = None
+context_builder = None
+topic_retriever = None
+chat_writer = None
+conversation_store = None
+# Built on first use by get_agent()
+agent = None
+agent_loaded = False
+
+# App-level helpers, set by create_app()
+static_site = None
+response_compressor = None
+
+services_pid = None
+services_lock = threading.Lock()
+agent_lock = threading.Lock()
+
+def connect_mongodb():
+    """(client, db) for this process, or (None, None) if MongoDB is unreachable"""
+    try:
+        # Use connection pooling for better performance; the pool is per
+        # process, so size it for one worker's threads
+        mongo_client = MongoClient(
+            MONGO_URI,
+            serverSelectionTimeoutMS=5000,  # 5 second timeout
+            connectTimeoutMS=5000,
+            maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+            minPoolSize=int(os.getenv('MONGO_MIN_POOL_SIZE', '10'))
+        )
+        # Test connection
+        mongo_client.server_info()
+        print(f"Connected to MongoDB: {DB_NAME}")
+        return mongo_client, mongo_client[DB_NAME]
+    except (ServerSelectionTimeoutError, ConnectionFailure) as e:
+        print(f"MongoDB connection failed: {e}")
+        print("Please ensure MongoDB is running or update MONGO_URI in .env")
+        return None, None
 
 # Cleanup on exit
 def close_mongodb_connection():
@@ -61,69 +157,307 @@ def get_collection(name):
         raise ConnectionError("MongoDB not connected")
     return db[name]
 
-# Initialize collections only if db is connected
-if db is not None:
-    courses_collection = get_collection('courses')
-    users_collection = get_collection('users')
-    enrollments_collection = get_collection('enrollments')
-    progress_collection = get_collection('progress')
-    study_updates_collection = get_collection('study_updates')
-    chat_sessions_collection = get_collection('chat_sessions')
-else:
-    courses_collection = None
-    users_collection = None
-    enrollments_collection = None
-    progress_collection = None
-    study_updates_collection = None
-    chat_sessions_collection = None
-
-# Initialize the ElevateUAgent only once with proper parameters
-agent = None
-if chatbot_available and db is not None:
+# Local intent router in front of the model (AGENT_ROUTER=false disables).
+# AGENT_ROUTER_MODEL points at an optional model trained with
+# `python -m agent.router train`.
+def build_intent_router():
+    if os.getenv('AGENT_ROUTER', 'true').lower() != 'true':
+        return None
+    model = None
+    model_path = os.getenv('AGENT_ROUTER_MODEL')
+    if model_path:
+        try:
+            model = NaiveBayesIntentModel.load(model_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f" * Intent model not loaded ({model_path}): {e}")
+    return IntentRouter(threshold=float(os.getenv('AGENT_ROUTER_THRESHOLD', '0.8')), model=model)
+
+def build_topic_retriever():
+    """Course material retrieval for agent prompts (AGENT_RETRIEVAL=false disables)"""
+    if courses_collection is None or os.getenv('AGENT_RETRIEVAL', 'true').lower() != 'true':
+        return None
+    index = None
+    index_path = os.getenv('AGENT_RETRIEVAL_INDEX')
+    if index_path:
+        try:
+            index = TopicIndex.load(index_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f" * Topic index not loaded ({index_path}): {e}")
+    retriever = TopicRetriever(
+        lambda: courses_collection.find({}, {'title': 1, 'description': 1, 'topics': 1}),
+        index=index,
+        top_k=int(os.getenv('AGENT_RETRIEVAL_TOP_K', str(DEFAULT_TOP_K)))
+    )
+    retriever.start_refresh_thread(int(os.getenv('AGENT_RETRIEVAL_REFRESH_SECONDS', '900')))
+    return retriever
+
+def init_services():
+    """Connect to MongoDB and build the services this process's requests share"""
+    global client, db, courses_collection, users_collection, enrollments_collection, \
+        progress_collection, study_updates_collection, chat_sessions_collection, \
+        user_resolver, platform_stats, context_cache, course_recommender, course_catalog, \
+        search_index, context_builder, topic_retriever, chat_writer, conversation_store, \
+        agent, agent_loaded
+
+    client, db = connect_mongodb()
+
+    # Initialize collections only if db is connected
+    if db is not None:
+        courses_collection = get_collection('courses')
+        users_collection = get_collection('users')
+        enrollments_collection = get_collection('enrollments')
+        progress_collection = get_collection('progress')
+        study_updates_collection = get_collection('study_updates')
+        chat_sessions_collection = get_collection('chat_sessions')
+    else:
+        courses_collection = None
+        users_collection = None
+        enrollments_collection = None
+        progress_collection = None
+        study_updates_collection = None
+        chat_sessions_collection = None
+
+    user_resolver = UserResolver(
+        users_collection,
+        ttl=cache_ttl('IDENTITY_CACHE_TTL', 300),
+        miss_ttl=int(os.getenv('IDENTITY_MISS_TTL', '5')),
+        dual_read=USER_ID_DUAL_READ
+    ) if users_collection is not None else None
+
+    # Materialized counters behind /api/admin/stats
+    platform_stats = PlatformStats(db) if db is not None else None
+    if platform_stats is not None:
+        reconcile_seconds = int(os.getenv('STATS_RECONCILE_SECONDS', '900'))
+        if reconcile_seconds > 0:
+            platform_stats.start_reconcile_thread(reconcile_seconds)
+
+    # Make sure every hot filter is backed by an index (idempotent)
+    if db is not None and os.getenv('AUTO_CREATE_INDEXES', 'true').lower() == 'true':
+        ensure_indexes(db)
+
+    # Batched learning-context loader shared by the chatbot, Flowise tools and
+    # agent. Contexts are cached per user; set CONTEXT_CACHE_URL to a
+    # Redis-compatible server to share the cache (and its invalidation)
+    # across workers.
+    context_cache_url = os.getenv('CONTEXT_CACHE_URL')
+    context_cache = make_cache(
+        context_cache_url,
+        prefix='elevateu:',
+        maxsize=int(os.getenv('CONTEXT_CACHE_SIZE', '2048')),
+        ttl=cache_ttl('CONTEXT_CACHE_TTL', 120, shared=bool(context_cache_url))
+    )
+    # Item-item course recommender, rebuilt in the background every
+    # RECOMMENDER_REFRESH_SECONDS and after RECOMMENDER_REFRESH_AFTER writes
+    course_recommender = None
+    if db is not None:
+        course_recommender = CourseRecommender(
+            db, refresh_after=int(os.getenv('RECOMMENDER_REFRESH_AFTER', '500'))
+        )
+        course_recommender.start_refresh_thread(int(os.getenv('RECOMMENDER_REFRESH_SECONDS', '600')))
+
+    # In-memory course catalog shared by every course read; reloaded when the
+    # catalog version (bumped by course writes) moves
+    course_catalog = CourseCatalog(
+        db,
+        check_interval=float(os.getenv('CATALOG_CHECK_SECONDS', '5')),
+        counts_ttl=float(os.getenv('CATALOG_COUNTS_TTL', '30'))
+    ) if db is not None else None
+
+    # Full-text course search (BM25 + prefix), built from the catalog snapshot
+    # and rebuilt when the catalog version moves, so writes handled by other
+    # workers show up within CATALOG_CHECK_SECONDS.
+    search_index = CourseSearchIndex() if course_catalog is not None else None
+
+    context_builder = UserContextBuilder(
+        db, resolver=user_resolver, cache=context_cache, recommender=course_recommender,
+        catalog=course_catalog
+    ) if db is not None else None
+
+    topic_retriever = build_topic_retriever()
+
+    # Chat turns queue their chat_sessions/agent_memory writes here; they are
+    # applied in batches by a background thread and flushed at shutdown.
+    # WRITE_BEHIND=false writes synchronously instead.
+    chat_writer = None
+    if db is not None:
+        chat_writer = WriteBehindQueue(
+            db,
+            maxsize=int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', '10000')),
+            batch_size=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500')),
+            retries=int(os.getenv('WRITE_BEHIND_RETRIES', '3'))
+        )
+        if os.getenv('WRITE_BEHIND', 'true').lower() == 'true':
+            chat_writer.start()
+            # Registered after the connection cleanup so it runs first
+            atexit.register(chat_writer.close)
+
+    # One store for chat sessions and the agent's memory: header docs in
+    # chat_sessions, messages in chat_messages buckets
+    conversation_store = ConversationStore(db, writer=chat_writer) if db is not None else None
+
+    agent = None
+    agent_loaded = False
+
+def build_agent():
+    """The ElevateUAgent, or None if its dependencies or settings are missing"""
+    if not chatbot_available or db is None:
+        print(" * ElevateU Agent not initialized (missing dependencies)")
+        return None
     try:
-        agent = ElevateUAgent(
+        # AGENT_MODEL=fake runs the agent on a scripted offline model
+        model = FakeModel() if os.getenv('AGENT_MODEL') == 'fake' else None
+        response_cache = make_cache(
+            os.getenv('AGENT_CACHE_URL', os.getenv('CONTEXT_CACHE_URL')),
+            prefix='elevateu-llm:',
+            maxsize=int(os.getenv('AGENT_CACHE_SIZE', '1024')),
+            ttl=AGENT_CACHE_TTL
+        ) if AGENT_CACHE_TTL > 0 else None
+        chat_agent = ElevateUAgent(
             mongo_db=db,
-            api_key=os.getenv("GEMINI_API_KEY")
+            api_key=os.getenv("GEMINI_API_KEY"),
+            context_builder=context_builder,
+            model=model,
+            response_cache=response_cache,
+            router=build_intent_router(),
+            prompt_builder=PromptBuilder(
+                token_budget=int(os.getenv('AGENT_PROMPT_TOKENS', str(DEFAULT_TOKEN_BUDGET)))
+            ),
+            conversation_store=conversation_store,
+            retriever=topic_retriever
         )
         print(" * ElevateU Agent initialized successfully")
+        return chat_agent
     except Exception as e:
         print(f" * Failed to initialize ElevateU Agent: {e}")
-        agent = None
-else:
-    print(" * ElevateU Agent not initialized (missing dependencies)")
-
-def safe_progress(progress, course):
-    """Ensures progress is always a valid dict structure"""
-    if not isinstance(progress, dict):
-        progress = {}
-
-    # Ensure course topics is a list
-    course_topics = course.get("topics", [])
-    if not isinstance(course_topics, list):
-        course_topics = []
-
-    return {
-        "progress": progress.get("progress", 0),
-        "completedTopics": progress.get("completedTopics", []),
-        "totalTopics": len(course_topics),
-        "topics": course_topics,
-    }
-
-def sanitize_topics(topics):
-    """Ensure topics is always a list of dicts."""
-    if not isinstance(topics, list):
-        return []
-    clean = []
-    for t in topics:
-        if isinstance(t, dict):
-            clean.append(t)
-    return clean
-
-# Helper function to convert ObjectId to string
-def serialize_doc(doc):
-    if doc and '_id' in doc:
-        doc['_id'] = str(doc['_id'])
-    return doc
+        return None
+
+def get_agent():
+    """The agent, built on the first chatbot request of this process.
+
+    Building it imports the Gemini SDK (about a second), which is kept off
+    the cold-start path of workers that never serve a chat.
+    """
+    global agent, agent_loaded
+    if not agent_loaded:
+        with agent_lock:
+            if not agent_loaded:
+                agent = build_agent()
+                agent_loaded = True
+    return agent
+
+def log_cold_start(stage, elapsed_ms):
+    over = elapsed_ms > COLD_START_BUDGET_MS
+    print(f" * {stage} in {elapsed_ms:.0f} ms"
+          f"{f' (over the {COLD_START_BUDGET_MS:.0f} ms cold-start budget)' if over else ''}")
+
+def ensure_services():
+    """Build the services once per process; a forked worker builds its own"""
+    global services_pid
+    pid = os.getpid()
+    if services_pid == pid:
+        return
+    with services_lock:
+        if services_pid != pid:
+            started = time.perf_counter()
+            init_services()
+            services_pid = pid
+            log_cold_start(f"Services ready (pid {pid})", (time.perf_counter() - started) * 1000)
+
+def create_app():
+    """The ElevateU Flask app.
+
+    Nothing here connects to MongoDB or starts a thread, so the app can be
+    created in a parent process (gunicorn --preload) and forked; each
+    process builds its services on its first request.
+    """
+    global static_site, response_compressor
+    app = Flask(__name__)
+    # Encodes ObjectId/datetime natively (orjson when installed)
+    app.json = FastJSONProvider(app)
+    CORS(app, expose_headers=['X-Next-Cursor', 'X-Total-Count'])
+    # gzip/brotli for JSON responses of COMPRESS_MIN_SIZE bytes or more
+    response_compressor = init_compression(
+        app, min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    ) if os.getenv('COMPRESS_RESPONSES', 'true').lower() == 'true' else None
+    # The built bundle is indexed once; precompress.py adds .br/.gz copies
+    static_site = StaticSite(os.path.join(app.root_path, "static"))
+
+    app.before_request(ensure_services)
+    app.register_blueprint(api)
+    log_cold_start("App created", (time.perf_counter() - IMPORT_STARTED) * 1000)
+    return app
+
+def resolve_user(user_id):
+    """Resolve a Clerk id or Mongo _id to a ResolvedUser, at most once per request"""
+    if not user_id or user_resolver is None:
+        return None
+    resolved_users = g.setdefault('resolved_users', {})
+    if user_id not in resolved_users:
+        resolved_users[user_id] = user_resolver.resolve(user_id)
+    return resolved_users[user_id]
+
+def user_filter(user_id, field='userId'):
+    """Filter on the user's stored id(s), or the raw id if the user is unknown"""
+    resolved = resolve_user(user_id)
+    if resolved:
+        return resolved.user_filter(field)
+    return {field: user_id}
+
+def request_user_context(user_id, include_topics=True):
+    """Build the user's learning context at most once per request"""
+    contexts = g.setdefault('user_contexts', {})
+    # A context with topic lists also serves callers that don't need them
+    for key in ((user_id, True), (user_id, include_topics)):
+        if key in contexts:
+            return contexts[key]
+    context = context_builder.build(user_id, include_topics=include_topics)
+    contexts[(user_id, include_topics)] = context
+    return context
+
+def canonical_user_id(user_id):
+    """Key new rows are written under: the canonical user key when known"""
+    resolved = resolve_user(user_id)
+    return resolved.key if resolved else user_id
+
+def courses_by_id(course_ids, fields=None):
+    """The given courses from the catalog snapshot, keyed by their string id"""
+    return {cid: record.to_dict(fields) for cid, record in course_catalog.many(course_ids).items()}
+
+# Fields list endpoints accept in `fields=` (embedded documents also by
+# subfield, e.g. course.title)
+COURSE_FIELDS = (
+    'title', 'description', 'instructor', 'duration', 'topics', 'topicCount',
+    'difficulty', 'createdAt', 'enrollmentCount'
+)
+PROGRESS_FIELDS = ('userId', 'courseId', 'completedTopics', 'progress', 'lastUpdated')
+ENROLLMENT_FIELDS = (
+    'userId', 'courseId', 'enrolledAt', 'status', 'lastAccessed', 'course', 'progress',
+    *(f'course.{field}' for field in COURSE_FIELDS if field != 'enrollmentCount'),
+    *(f'progress.{field}' for field in PROGRESS_FIELDS)
+)
+STUDY_UPDATE_FIELDS = (
+    'userId', 'courseId', 'content', 'date', 'verified', 'adminComment', 'course',
+    *(f'course.{field}' for field in COURSE_FIELDS if field != 'enrollmentCount')
+)
+MESSAGE_FIELDS = ('type', 'content', 'timestamp', 'action', 'data')
+
+def list_params(allowed_fields, cursor_keys=('id',)):
+    """(limit, cursor, projection) from the query string; ValueError if invalid"""
+    limit = parse_limit(request.args.get('limit'))
+    cursor = decode_cursor(request.args.get('after'), cursor_keys)
+    fields = parse_fields(request.args.get('fields'), allowed_fields)
+    return limit, cursor, fields
+
+def etag_response(etag, build):
+    """JSON of build() tagged with `etag`, or a bare 304 if the client has it"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Cached copies must be revalidated, which the ETag makes cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 # Helper to check MongoDB connection
 def check_mongodb():
@@ -146,13 +480,8 @@ def admin_required():
             if admin_key == 'elevateu-admin-2024':
                 return f(*args, **kwargs)
             elif user_id:
-                user = users_collection.find_one({
-                    '$or': [
-                        {'clerkId': user_id},
-                        {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-                    ]
-                })
-                if user and user.get('role') == 'admin':
+                resolved = resolve_user(user_id)
+                if resolved and resolved.user.get('role') == 'admin':
                     return f(*args, **kwargs)
 
             return jsonify({'error': 'Admin access required'}), 403
@@ -162,33 +491,68 @@ def admin_required():
 # -------------------------------------------------------
 # Serve React Frontend (works in local + Docker)
 # -------------------------------------------------------
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+
+@api.route('/', defaults={'path': ''})
+@api.route('/<path:path>')
 def serve_react(path):
     # When running locally, user will run Vite, so skip serving React
     if os.environ.get("FLASK_ENV") == "development":
         return jsonify({"message": "Frontend is served by Vite in local mode"}), 200
 
-    # In Docker/VM production:
-    static_folder = os.path.join(app.root_path, "static")
-
-    if path != "" and os.path.exists(os.path.join(static_folder, path)):
-        return send_from_directory(static_folder, path)
-
-    # otherwise return index.html
-    return send_from_directory(static_folder, "index.html")
+    # In Docker/VM production: served from the table built at startup
+    asset = static_site.lookup(path)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    return static_site.serve(asset, request)
 
 # Courses endpoints
-@app.route('/api/courses', methods=['GET'])
+@api.route('/api/courses', methods=['GET'])
 def get_courses():
-    courses = list(courses_collection.find())
-    # Add enrollment count for each course
-    for course in courses:
-        enrollment_count = enrollments_collection.count_documents({'courseId': str(course['_id'])})
-        course['enrollmentCount'] = enrollment_count
-    return jsonify([serialize_doc(course) for course in courses])
-
-@app.route('/api/courses', methods=['POST'])
+    """Every course by _id, or `limit` per page when given (cursor in X-Next-Cursor).
+
+    Served from the catalog snapshot plus cached enrollment counts;
+    `fields` picks the course fields to return (e.g.
+    title,topicCount,enrollmentCount). Revalidation with If-None-Match
+    answers 304 without a body.
+    """
+    try:
+        limit, cursor, fields = list_params(COURSE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Legacy clients expect the whole catalog; paging starts with `limit`
+    if 'limit' not in request.args:
+        limit = None
+    # Snapshot ids are strings; decode_cursor() also accepts ObjectIds
+    after = str(cursor['id']) if cursor else None
+    etag, build, last_id, total = course_catalog.listing(limit, after, fields)
+    response = etag_response(etag, build)
+    if last_id:
+        response.headers['X-Next-Cursor'] = encode_cursor({'id': last_id})
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+@api.route('/api/courses/search', methods=['GET'])
+def search_courses():
+    """Ranked course summaries from the in-memory index.
+
+    Query params: q (words; the last one also matches as a prefix), limit,
+    after (cursor from X-Next-Cursor). An empty q lists courses by title.
+    """
+    limit = parse_limit(request.args.get('limit'))
+    try:
+        cursor = decode_cursor(request.args.get('after'), required=('o',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    offset = (cursor or {}).get('o', 0)
+    if not isinstance(offset, int) or offset < 0:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    search_index.sync(course_catalog.snapshot())
+    page, total = search_index.search(request.args.get('q', ''), limit=limit, offset=offset)
+    next_cursor = encode_cursor({'o': offset + limit}) if offset + limit < total else None
+    return paginated_response(page, next_cursor, total)
+
+@api.route('/api/courses', methods=['POST'])
 def create_course():
     data = request.json
     course = {
@@ -200,17 +564,23 @@ def create_course():
         'createdAt': datetime.now(timezone.utc).isoformat()
     }
     result = courses_collection.insert_one(course)
+    platform_stats.course_added()
+    context_builder.invalidate_all()
+    course_recommender.refresh_async()
     course['_id'] = str(result.inserted_id)
-    return jsonify(serialize_doc(course)), 201
+    course_catalog.bump()
+    if topic_retriever is not None:
+        topic_retriever.refresh_async()
+    return jsonify(course), 201
 
-@app.route('/api/courses/<course_id>', methods=['GET'])
+@api.route('/api/courses/<course_id>', methods=['GET'])
 def get_course(course_id):
-    course = courses_collection.find_one({'_id': ObjectId(course_id)})
-    if not course:
+    record = course_catalog.get(course_id)
+    if record is None:
         return jsonify({'error': 'Course not found'}), 404
-    return jsonify(serialize_doc(course))
+    return etag_response(course_catalog.etag(course_id), record.to_dict)
 
-@app.route('/api/courses/<course_id>', methods=['PUT'])
+@api.route('/api/courses/<course_id>', methods=['PUT'])
 def update_course(course_id):
     data = request.json
     update_data = {
@@ -226,10 +596,18 @@ def update_course(course_id):
     )
     if result.matched_count == 0:
         return jsonify({'error': 'Course not found'}), 404
-    course = courses_collection.find_one({'_id': ObjectId(course_id)})
-    return jsonify(serialize_doc(course))
+    context_builder.invalidate_all()
+    course_catalog.bump()
+    record = course_catalog.get(course_id)
+    if record is None:
+        # Deleted by a concurrent request
+        return jsonify({'error': 'Course not found'}), 404
+    course = record.to_dict()
+    if topic_retriever is not None:
+        topic_retriever.refresh_async()
+    return jsonify(course)
 
-@app.route('/api/courses/<course_id>', methods=['DELETE'])
+@api.route('/api/courses/<course_id>', methods=['DELETE'])
 def delete_course(course_id):
     result = courses_collection.delete_one({'_id': ObjectId(course_id)})
     if result.deleted_count == 0:
@@ -237,10 +615,17 @@ def delete_course(course_id):
     # Also delete enrollments and progress
     enrollments_collection.delete_many({'courseId': course_id})
     progress_collection.delete_many({'courseId': course_id})
+    # Cascading deletes can change every counter; recompute them
+    platform_stats.reconcile()
+    context_builder.invalidate_all()
+    course_catalog.bump()
+    course_recommender.refresh_async()
+    if topic_retriever is not None:
+        topic_retriever.refresh_async()
     return jsonify({'message': 'Course deleted'}), 200
 
 # User endpoints
-@app.route('/api/users', methods=['POST'])
+@api.route('/api/users', methods=['POST'])
 def create_user():
     data = request.json
 
@@ -262,19 +647,22 @@ def create_user():
         ]
     })
     if existing:
-        return jsonify(serialize_doc(existing))
+        return jsonify(existing)
     result = users_collection.insert_one(user)
+    # Drop any cached "not found" for this Clerk id
+    user_resolver.invalidate(user['clerkId'])
+    context_builder.invalidate(user['clerkId'])
     user['_id'] = str(result.inserted_id)
-    return jsonify(serialize_doc(user)), 201
+    return jsonify(user), 201
 
-@app.route('/api/users/<clerk_id>', methods=['GET'])
+@api.route('/api/users/<clerk_id>', methods=['GET'])
 def get_user(clerk_id):
     user = users_collection.find_one({'clerkId': clerk_id})
     if not user:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify(serialize_doc(user))
+    return jsonify(user)
 
-@app.route('/api/users/<clerk_id>', methods=['PUT'])
+@api.route('/api/users/<clerk_id>', methods=['PUT'])
 def update_user(clerk_id):
     data = request.json
     user = users_collection.find_one({'clerkId': clerk_id})
@@ -293,128 +681,121 @@ def update_user(clerk_id):
         {'clerkId': clerk_id},
         {'$set': update_data}
     )
+    user_resolver.invalidate(clerk_id, str(user['_id']))
 
     if result.modified_count > 0:
         updated_user = users_collection.find_one({'clerkId': clerk_id})
-        return jsonify(serialize_doc(updated_user))
+        return jsonify(updated_user)
     else:
         return jsonify({'message': 'No changes made'}), 200
 
 # Enrollment endpoints
-@app.route('/api/enrollments', methods=['POST'])
+@api.route('/api/enrollments', methods=['POST'])
 def create_enrollment():
     data = request.json
     enrollment = {
-        'userId': data.get('userId'),
+        'userId': canonical_user_id(data.get('userId')),
         'courseId': data.get('courseId'),
         'enrolledAt': datetime.now(timezone.utc).isoformat(),
         'status': 'in_progress'
     }
     # Check if already enrolled
     existing = enrollments_collection.find_one({
-        'userId': enrollment['userId'],
+        **user_filter(data.get('userId')),
         'courseId': enrollment['courseId']
     })
     if existing:
-        return jsonify(serialize_doc(existing))
+        return jsonify(existing)
+    # First enrollment for this user makes them an active student
+    new_student = enrollments_collection.find_one(user_filter(data.get('userId')), {'_id': 1}) is None
     result = enrollments_collection.insert_one(enrollment)
+    platform_stats.enrollment_added(new_student=new_student)
+    course_recommender.record_event(enrollment['courseId'], enrollment=True)
+    context_builder.invalidate(enrollment['userId'])
+    course_catalog.invalidate_counts()
     enrollment['_id'] = str(result.inserted_id)
     # Initialize progress
-    course = courses_collection.find_one({'_id': ObjectId(enrollment['courseId'])})
-    # Sanitize topics list
-    course['topics'] = sanitize_topics(course.get('topics', []))
-    if course:
-        progress = {
-            'userId': enrollment['userId'],
-            'courseId': enrollment['courseId'],
-            'completedTopics': [],
-            'progress': 0,
-            'lastUpdated': datetime.now(timezone.utc).isoformat()
-        }
-        progress_collection.insert_one(progress)
-    return jsonify(serialize_doc(enrollment)), 201
+    if course_catalog.get(enrollment['courseId']) is not None:
+        # Upsert so a progress row created earlier (e.g. by the chatbot)
+        # does not collide with the unique userId/courseId index
+        upsert = progress_collection.update_one(
+            {'userId': enrollment['userId'], 'courseId': enrollment['courseId']},
+            {'$setOnInsert': {
+                'completedTopics': [],
+                'progress': 0,
+                'lastUpdated': datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
+        )
+        if upsert.upserted_id is not None:
+            platform_stats.progress_added(0)
+    return jsonify(enrollment), 201
 
-@app.route('/api/enrollments/user/<user_id>', methods=['GET'])
+@api.route('/api/enrollments/user/<user_id>', methods=['GET'])
 def get_user_enrollments(user_id):
-    # Try to find user by both user_id and clerk_id
-    user = users_collection.find_one({
-        '$or': [
-            {'clerkId': user_id},
-            {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-        ]
-    })
-    
-    if user:
-        user_id_str = str(user['_id'])
-        clerk_id = user.get('clerkId', '')
-        # Get enrollments using both student ID and clerk ID
-        enrollments = list(enrollments_collection.find({
-            '$or': [
-                {'userId': user_id_str},
-                {'userId': clerk_id},
-                {'userId': user_id}
-            ]
-        }))
-    else:
-        # Fallback to direct user_id lookup
-        enrollments = list(enrollments_collection.find({'userId': user_id}))
-    
-    # Get course details for each enrollment
+    """A user's enrollments with their course and progress, by _id.
+
+    Query params: limit, after (cursor from X-Next-Cursor), fields (e.g.
+    courseId,course.title,progress.progress). The course and progress
+    are only joined when asked for; courseId is kept whenever they are.
+    """
+    try:
+        limit, cursor, fields = list_params(ENROLLMENT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    want_course, course_fields = embedded_fields(fields, 'course')
+    want_progress, progress_fields = embedded_fields(fields, 'progress')
+    projection = top_level(fields, ('course', 'progress'))
+    if projection is not None and (want_course or want_progress):
+        projection['courseId'] = 1
+
+    # Enrollments stored under any of the user's ids
+    query = user_filter(user_id)
+    if cursor:
+        query = {**query, '_id': {'$gt': cursor['id']}}
+    rows = list(enrollments_collection.find(query, projection).sort('_id', 1).limit(limit + 1))
+    enrollments, next_cursor = paginate(rows, limit)
+    course_ids = [e.get('courseId') for e in enrollments]
+
+    # Batch the course and progress lookups: at most three queries per page
+    courses = course_catalog.many(course_ids) if want_course or want_progress else {}
+    progress_by_course = {}
+    if want_progress and course_ids:
+        if progress_fields is not None:
+            progress_fields['courseId'] = 1
+        for progress in progress_collection.find({
+            **user_filter(user_id),
+            'courseId': {'$in': course_ids}
+        }, progress_fields):
+            progress_by_course.setdefault(progress['courseId'], progress)
+
     for enrollment in enrollments:
-        try:
-            course = courses_collection.find_one({'_id': ObjectId(enrollment['courseId'])})
-            if course:
-                enrollment['course'] = serialize_doc(course)
-                # Get progress using all possible user IDs
-                progress = progress_collection.find_one({
-                    '$or': [
-                        {'userId': user_id, 'courseId': enrollment['courseId']},
-                        {'userId': str(user['_id']), 'courseId': enrollment['courseId']} if user else {'userId': user_id, 'courseId': enrollment['courseId']},
-                        {'userId': user.get('clerkId', ''), 'courseId': enrollment['courseId']} if user else {'userId': user_id, 'courseId': enrollment['courseId']}
-                    ]
-                })
-                if progress:
-                    enrollment['progress'] = serialize_doc(progress)
-        except:
-            continue
-    return jsonify([serialize_doc(e) for e in enrollments])
+        record = courses.get(enrollment.get('courseId'))
+        if record:
+            if want_course:
+                enrollment['course'] = record.to_dict(course_fields)
+            progress = progress_by_course.get(enrollment['courseId'])
+            if progress:
+                enrollment['progress'] = progress
+    return paginated_response(enrollments, next_cursor)
 
 # Progress endpoints
-@app.route('/api/progress', methods=['POST'])
+@api.route('/api/progress', methods=['POST'])
 def update_progress():
     data = request.json
     user_id = data.get('userId')
     course_id = data.get('courseId')
     
-    # Try to find user by both user_id and clerk_id
-    user = users_collection.find_one({
-        '$or': [
-            {'clerkId': user_id},
-            {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-        ]
+    # Look for progress under any of the user's ids
+    progress = progress_collection.find_one({
+        **user_filter(user_id),
+        'courseId': course_id
     })
     
-    if user:
-        user_id_str = str(user['_id'])
-        clerk_id = user.get('clerkId', '')
-        # Look for progress using all possible user IDs
-        progress = progress_collection.find_one({
-            '$or': [
-                {'userId': user_id, 'courseId': course_id},
-                {'userId': user_id_str, 'courseId': course_id},
-                {'userId': clerk_id, 'courseId': course_id}
-            ]
-        })
-    else:
-        progress = progress_collection.find_one({
-            'userId': user_id,
-            'courseId': course_id
-        })
-    
     if progress:
         completed_topics = data.get('completedTopics', progress.get('completedTopics', []))
-        course = courses_collection.find_one({'_id': ObjectId(course_id)})
-        total_topics = len(course.get('topics', [])) if course else 1
+        course = course_catalog.get(course_id)
+        total_topics = course.topic_count if course else 1
         progress_percent = (len(completed_topics) / total_topics * 100) if total_topics > 0 else 0
         
         progress_collection.update_one(
@@ -425,47 +806,192 @@ def update_progress():
                 'lastUpdated': datetime.now(timezone.utc).isoformat()
             }}
         )
+        platform_stats.progress_changed(progress.get('progress', 0), progress_percent)
+        if progress_percent >= COMPLETED:
+            course_recommender.record_event(course_id)
+        context_builder.invalidate(user_id)
         updated = progress_collection.find_one({'_id': progress['_id']})
-        return jsonify(serialize_doc(updated))
+        return jsonify(updated)
     return jsonify({'error': 'Progress not found'}), 404
 
-@app.route('/api/progress/user/<user_id>/course/<course_id>', methods=['GET'])
+# Most entries one POST /api/progress/batch may carry
+PROGRESS_BATCH_LIMIT = int(os.getenv('PROGRESS_BATCH_LIMIT', '500'))
+
+def progress_batch_item(item, course):
+    """The new topic indexes of one batch entry, or an error message"""
+    if course is None:
+        return None, 'Course not found'
+    topics = item.get('completedTopics', [])
+    if not isinstance(topics, list) or not all(
+        isinstance(t, int) and not isinstance(t, bool) and 0 <= t < course.topic_count for t in topics
+    ):
+        return None, f"completedTopics must be topic indexes below {course.topic_count}"
+    return topics, None
+
+def progress_batch_rows(collection, pairs, user_keys, projection):
+    """One row per (canonical user key, course id) pair, fetched in one query"""
+    rows = {}
+    if not pairs:
+        return rows
+    for row in collection.find(
+        {'userId': {'$in': list(user_keys)},
+         'courseId': {'$in': list({course_id for _, course_id in pairs})}},
+        projection
+    ):
+        pair_key = (user_keys.get(row.get('userId')), row.get('courseId'))
+        if pair_key in pairs:
+            rows.setdefault(pair_key, row)
+    return rows
+
+@api.route('/api/progress/batch', methods=['POST'])
+def update_progress_batch():
+    """Apply many progress deltas in one round of reads and one bulk write.
+
+    Body: {"updates": [{"userId", "courseId", "completedTopics": [...]}]},
+    where completedTopics are topic indexes completed since the client's
+    last sync; they are merged into the stored list. Entries for the same
+    user and course are combined. Entries for unknown users or for
+    courses the user is not enrolled in are rejected, as by the
+    single-item endpoints; an enrolled pair without a progress row gets
+    one under the user's canonical key. Returns one result per entry, in
+    order: status updated/created/error, with the resulting progress.
+    """
+    body = request.json
+    items = body.get('updates') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'updates must be a non-empty list'}), 400
+    if len(items) > PROGRESS_BATCH_LIMIT:
+        return jsonify({'error': f'At most {PROGRESS_BATCH_LIMIT} updates per batch'}), 400
+
+    results = [None] * len(items)
+    # (canonical user key, course id) -> merged entry
+    pairs = {}
+    # stored user id (any alias) -> canonical key
+    user_keys = {}
+    entries = [
+        (item.get('userId'), item.get('courseId')) if isinstance(item, dict) else (None, None)
+        for item in items
+    ]
+    courses = course_catalog.many(
+        course_id for _, course_id in entries if isinstance(course_id, str)
+    )
+    for i, (item, (user_id, course_id)) in enumerate(zip(items, entries)):
+        if not (user_id and course_id and isinstance(user_id, str) and isinstance(course_id, str)):
+            results[i] = {'index': i, 'status': 'error', 'error': 'userId and courseId required'}
+            continue
+        topics, error = progress_batch_item(item, courses.get(course_id))
+        if error:
+            results[i] = {'index': i, 'userId': user_id, 'courseId': course_id,
+                          'status': 'error', 'error': error}
+            continue
+        resolved = resolve_user(user_id)
+        if not resolved:
+            results[i] = {'index': i, 'userId': user_id, 'courseId': course_id,
+                          'status': 'error', 'error': 'User not found'}
+            continue
+        key = resolved.key
+        for stored_id in resolved.stored_ids():
+            user_keys[stored_id] = key
+        pair = pairs.setdefault((key, course_id), {'topics': [], 'items': [], 'userIds': set()})
+        pair['topics'].extend(topics)
+        pair['items'].append(i)
+        pair['userIds'].add(user_id)
+
+    # Progress is only kept for enrolled courses
+    enrolled = progress_batch_rows(enrollments_collection, pairs, user_keys, {'userId': 1, 'courseId': 1})
+    for pair_key in [pair_key for pair_key in pairs if pair_key not in enrolled]:
+        for i in pairs.pop(pair_key)['items']:
+            results[i] = {'index': i, 'userId': entries[i][0], 'courseId': pair_key[1],
+                          'status': 'error', 'error': 'Not enrolled in this course'}
+
+    existing = progress_batch_rows(
+        progress_collection, pairs, user_keys,
+        {'userId': 1, 'courseId': 1, 'completedTopics': 1, 'progress': 1}
+    )
+
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    for (key, course_id), pair in pairs.items():
+        row = existing.get((key, course_id))
+        previous = row.get('completedTopics', []) if row else []
+        # Merge, keeping the stored order and dropping repeats
+        completed = list(dict.fromkeys([*previous, *pair['topics']]))
+        total_topics = courses[course_id].topic_count
+        pair['progress'] = len(completed) / total_topics * 100 if total_topics > 0 else 0
+        pair['completedTopics'] = completed
+        pair['old'] = row.get('progress', 0) if row else None
+        fields = {'completedTopics': completed, 'progress': pair['progress'], 'lastUpdated': now}
+        if row:
+            operations.append(UpdateOne({'_id': row['_id']}, {'$set': fields}))
+        else:
+            operations.append(UpdateOne(
+                {'userId': key, 'courseId': course_id}, {'$set': fields}, upsert=True
+            ))
+        pair['op'] = len(operations) - 1
+
+    write_result = {}
+    if operations:
+        try:
+            write_result = progress_collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            write_result = e.details
+    failed = {error['index']: error.get('errmsg', 'Write failed')
+              for error in write_result.get('writeErrors', [])}
+    upserted = {entry['index'] for entry in write_result.get('upserted', [])}
+
+    added = 0
+    progress_delta = 0
+    for (key, course_id), pair in pairs.items():
+        op = pair['op']
+        if op in failed:
+            outcome = {'status': 'error', 'error': failed[op]}
+        else:
+            if op in upserted:
+                added += 1
+                progress_delta += pair['progress']
+                status = 'created'
+            else:
+                # An upsert that matched a row created meanwhile counts as
+                # an update; the periodic reconcile absorbs its stats delta
+                if pair['old'] is not None:
+                    progress_delta += pair['progress'] - pair['old']
+                status = 'updated'
+            if pair['progress'] >= COMPLETED and (pair['old'] or 0) < COMPLETED:
+                course_recommender.record_event(course_id)
+            outcome = {'status': status, 'progress': pair['progress'],
+                       'completedTopics': pair['completedTopics']}
+        for i in pair['items']:
+            results[i] = {'index': i, 'userId': entries[i][0], 'courseId': course_id, **outcome}
+
+    platform_stats.progress_batch(added, progress_delta)
+    for user_id in {user_id for pair in pairs.values() for user_id in pair['userIds']}:
+        context_builder.invalidate(user_id)
+
+    return jsonify({
+        'results': results,
+        'updated': sum(1 for r in results if r['status'] == 'updated'),
+        'created': sum(1 for r in results if r['status'] == 'created'),
+        'failed': sum(1 for r in results if r['status'] == 'error')
+    })
+
+@api.route('/api/progress/user/<user_id>/course/<course_id>', methods=['GET'])
 def get_progress(user_id, course_id):
-    # Try to find user by both user_id and clerk_id
-    user = users_collection.find_one({
-        '$or': [
-            {'clerkId': user_id},
-            {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-        ]
+    # Look for progress under any of the user's ids
+    progress = progress_collection.find_one({
+        **user_filter(user_id),
+        'courseId': course_id
     })
     
-    if user:
-        user_id_str = str(user['_id'])
-        clerk_id = user.get('clerkId', '')
-        # Look for progress using all possible user IDs
-        progress = progress_collection.find_one({
-            '$or': [
-                {'userId': user_id, 'courseId': course_id},
-                {'userId': user_id_str, 'courseId': course_id},
-                {'userId': clerk_id, 'courseId': course_id}
-            ]
-        })
-    else:
-        progress = progress_collection.find_one({
-            'userId': user_id,
-            'courseId': course_id
-        })
-    
     if not progress:
         return jsonify({'error': 'Progress not found'}), 404
-    return jsonify(serialize_doc(progress))
+    return jsonify(progress)
 
 # Study updates endpoints
-@app.route('/api/study-updates', methods=['POST'])
+@api.route('/api/study-updates', methods=['POST'])
 def create_study_update():
     data = request.json
     update = {
-        'userId': data.get('userId'),
+        'userId': canonical_user_id(data.get('userId')),
         'courseId': data.get('courseId'),
         'content': data.get('content'),
         'date': data.get('date', datetime.now(timezone.utc).isoformat()),
@@ -474,19 +1000,43 @@ def create_study_update():
     }
     result = study_updates_collection.insert_one(update)
     update['_id'] = str(result.inserted_id)
-    return jsonify(serialize_doc(update)), 201
+    return jsonify(update), 201
 
-@app.route('/api/study-updates/user/<user_id>', methods=['GET'])
+@api.route('/api/study-updates/user/<user_id>', methods=['GET'])
 def get_user_study_updates(user_id):
-    updates = list(study_updates_collection.find({'userId': user_id}).sort('date', -1))
-    # Get course details
-    for update in updates:
-        course = courses_collection.find_one({'_id': ObjectId(update['courseId'])})
-        if course:
-            update['course'] = serialize_doc(course)
-    return jsonify([serialize_doc(u) for u in updates])
+    """A user's study updates, newest first.
+
+    Query params: limit, after (cursor from X-Next-Cursor), fields (e.g.
+    content,date,verified,course.title).
+    """
+    try:
+        limit, cursor, fields = list_params(STUDY_UPDATE_FIELDS, cursor_keys=('id', 'v'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    want_course, course_fields = embedded_fields(fields, 'course')
+    projection = top_level(fields, ('course',))
+    if projection is not None:
+        # The sort key backs the cursor
+        projection['date'] = 1
+        if want_course:
+            projection['courseId'] = 1
+
+    query = user_filter(user_id)
+    if cursor:
+        query = {**query, **after_filter('date', -1, cursor.get('v'), cursor['id'])}
+    rows = list(study_updates_collection.find(query, projection)
+                .sort([('date', -1), ('_id', -1)]).limit(limit + 1))
+    updates, next_cursor = paginate(rows, limit, 'date')
+    if want_course:
+        # Course details come from the catalog snapshot
+        courses = courses_by_id((u.get('courseId') for u in updates), course_fields)
+        for update in updates:
+            course = courses.get(update.get('courseId'))
+            if course:
+                update['course'] = course
+    return paginated_response(updates, next_cursor)
 
-@app.route('/api/study-updates/<update_id>/verify', methods=['PUT'])
+@api.route('/api/study-updates/<update_id>/verify', methods=['PUT'])
 def verify_study_update(update_id):
     data = request.json
     study_updates_collection.update_one(
@@ -497,132 +1047,201 @@ def verify_study_update(update_id):
         }}
     )
     update = study_updates_collection.find_one({'_id': ObjectId(update_id)})
-    return jsonify(serialize_doc(update))
+    return jsonify(update)
 
 # Admin endpoints
-@app.route('/api/admin/stats', methods=['GET'])
+@api.route('/api/admin/stats', methods=['GET'])
 @admin_required()
 def get_admin_stats():
-    total_courses = courses_collection.count_documents({})
-    total_enrollments = enrollments_collection.count_documents({})
-    active_students = len(enrollments_collection.distinct('userId'))
-    
-    # Calculate average completion
-    all_progress = list(progress_collection.find({}))
-    avg_completion = 0
-    if all_progress:
-        avg_completion = sum(p.get('progress', 0) for p in all_progress) / len(all_progress)
-    
+    # Served from the materialized stats document (one point read)
+    return jsonify(platform_stats.summary())
+
+@api.route('/api/admin/agent/metrics', methods=['GET'])
+@admin_required()
+def get_agent_metrics():
+    """Response cache, intent router, recommender, search and prompt counters"""
+    chat_agent = get_agent()
+    if chat_agent is None:
+        return jsonify({'error': 'Chatbot agent not available'}), 503
+    cache = chat_agent.response_cache
+    router = chat_agent.router
     return jsonify({
-        'totalCourses': total_courses,
-        'activeStudents': active_students,
-        'totalEnrollments': total_enrollments,
-        'avgCompletion': round(avg_completion, 0)
+        'responseCache': cache.stats() if cache is not None else None,
+        'router': router.stats() if router is not None else None,
+        'recommender': course_recommender.stats() if course_recommender is not None else None,
+        'search': search_index.stats() if search_index is not None else None,
+        'catalog': course_catalog.stats() if course_catalog is not None else None,
+        'compression': response_compressor.stats() if response_compressor is not None else None,
+        'retrieval': topic_retriever.stats() if topic_retriever is not None else None,
+        'prompts': agent.prompt_builder.stats(),
+        'writeBehind': chat_writer.stats() if chat_writer is not None else None
     })
 
-@app.route('/api/admin/students', methods=['GET'])
+# Sortable roster columns -> field computed by the roster pipeline
+STUDENT_SORT_FIELDS = {
+    'name': 'sortName',
+    'avgProgress': 'avgProgress',
+    'enrollments': 'enrollments'
+}
+
+def _array_size(field):
+    """$size that tolerates missing or non-array fields"""
+    return {'$cond': [{'$isArray': field}, {'$size': field}, 0]}
+
+@api.route('/api/admin/students', methods=['GET'])
 @admin_required()
 def get_all_students():
-    students = list(users_collection.find({'role': 'student'}))
-    for student in students:
-        student_id_str = str(student['_id'])
-        clerk_id = student.get('clerkId', '')
-        
-        # Get enrollments using both student ID and clerk ID
-        enrollments = list(enrollments_collection.find({
-            '$or': [
-                {'userId': student_id_str},
-                {'userId': clerk_id}
-            ]
-        }))
-        student['enrollments'] = len(enrollments)
-        
-        # Get progress using both student ID and clerk ID
-        progress_list = list(progress_collection.find({
-            '$or': [
-                {'userId': student_id_str},
-                {'userId': clerk_id}
-            ]
-        }))
-        
-        if progress_list:
-            avg_progress = sum(p.get('progress', 0) for p in progress_list) / len(progress_list)
-            student['avgProgress'] = round(avg_progress, 0)
-        else:
-            student['avgProgress'] = 0
-            
-        # Get course progress details
-        student['courseProgress'] = []
-        for progress in progress_list:
-            course = courses_collection.find_one({'_id': ObjectId(progress['courseId'])})
-            if course:
-                student['courseProgress'].append({
-                    'courseTitle': course.get('title'),
-                    'progress': progress.get('progress', 0),
-                    'completedTopics': len(progress.get('completedTopics', [])),
-                    'totalTopics': len(course.get('topics', []))
-                })
-    return jsonify([serialize_doc(s) for s in students])
+    """Paginated student roster.
+
+    Query params: limit, after (cursor from X-Next-Cursor), sort
+    (name|avgProgress|enrollments), order (asc|desc), q (name/email search),
+    minProgress, maxProgress, minEnrollments.
+    """
+    limit = parse_limit(request.args.get('limit'))
+    sort_key = request.args.get('sort', 'name')
+    if sort_key not in STUDENT_SORT_FIELDS:
+        return jsonify({'error': f"sort must be one of {', '.join(STUDENT_SORT_FIELDS)}"}), 400
+    sort_field = STUDENT_SORT_FIELDS[sort_key]
+    direction = -1 if request.args.get('order') == 'desc' else 1
+    try:
+        cursor = decode_cursor(request.args.get('after'), required=('id', 'v'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-@app.route('/api/admin/student/<student_id>', methods=['GET'])
+    match = {'role': 'student'}
+    search = request.args.get('q', '').strip()
+    if search:
+        pattern = {'$regex': re.escape(search), '$options': 'i'}
+        match['$or'] = [{'name': pattern}, {'email': pattern}]
+
+    computed_match = {}
+    try:
+        if request.args.get('minProgress') is not None:
+            computed_match.setdefault('avgProgress', {})['$gte'] = float(request.args['minProgress'])
+        if request.args.get('maxProgress') is not None:
+            computed_match.setdefault('avgProgress', {})['$lte'] = float(request.args['maxProgress'])
+        if request.args.get('minEnrollments') is not None:
+            computed_match['enrollments'] = {'$gte': int(request.args['minEnrollments'])}
+    except ValueError:
+        return jsonify({'error': 'minProgress, maxProgress and minEnrollments must be numbers'}), 400
+
+    # userId is matched by equality against the student's keys, so every
+    # join below runs on the userId index
+    join_enrollments = {'$lookup': {
+        'from': 'enrollments', 'localField': 'userKeys', 'foreignField': 'userId', 'as': 'enrollmentRows'
+    }}
+    join_progress = {'$lookup': {
+        'from': 'progress', 'localField': 'userKeys', 'foreignField': 'userId', 'as': 'progressRows'
+    }}
+    add_stats = {'$addFields': {
+        'enrollments': {'$size': '$enrollmentRows'},
+        'avgProgress': {'$round': [{'$ifNull': [{'$avg': '$progressRows.progress'}, 0]}, 0]}
+    }}
+
+    pipeline = [
+        {'$match': match},
+        {'$addFields': {
+            'userKeys': user_keys_expression(USER_ID_DUAL_READ),
+            'sortName': {'$toLower': {'$ifNull': ['$name', '']}}
+        }}
+    ]
+    page_stages = []
+    if cursor:
+        page_stages.append({'$match': after_filter(sort_field, direction, cursor.get('v'), cursor['id'])})
+    page_stages += [
+        {'$sort': {sort_field: direction, '_id': direction}},
+        {'$limit': limit + 1}
+    ]
+    if sort_key == 'name' and not computed_match:
+        # Only the rows on this page need their counts
+        page_stages += [join_enrollments, join_progress, add_stats]
+    else:
+        # Sorting or filtering on the counts needs them for every match
+        pipeline += [join_enrollments, join_progress, add_stats,
+                     {'$project': {'enrollmentRows': 0, 'progressRows': 0}}]
+        if computed_match:
+            pipeline.append({'$match': computed_match})
+        page_stages.append(join_progress)
+    page_stages.append({'$project': {'userKeys': 0, 'enrollmentRows': 0}})
+    pipeline.append({'$facet': {
+        'total': [{'$count': 'count'}],
+        'page': page_stages
+    }})
+
+    result = next(users_collection.aggregate(pipeline), {'total': [], 'page': []})
+    total = result['total'][0]['count'] if result['total'] else 0
+    students, next_cursor = paginate(result['page'], limit, sort_field)
+
+    # Per-course detail for the rows on this page, with one courses query
+    course_ids = [
+        ObjectId(row['courseId']) for student in students for row in student.get('progressRows', [])
+        if ObjectId.is_valid(row.get('courseId') or '')
+    ]
+    courses = {
+        str(course['_id']): course
+        for course in courses_collection.aggregate([
+            {'$match': {'_id': {'$in': course_ids}}},
+            {'$project': {'title': 1, 'totalTopics': _array_size('$topics')}}
+        ])
+    } if course_ids else {}
+    for student in students:
+        student.pop('sortName', None)
+        student['courseProgress'] = [{
+            'courseTitle': courses[row['courseId']].get('title'),
+            'progress': row.get('progress') or 0,
+            'completedTopics': len(row['completedTopics']) if isinstance(row.get('completedTopics'), list) else 0,
+            'totalTopics': courses[row['courseId']]['totalTopics']
+        } for row in student.pop('progressRows', []) if row.get('courseId') in courses]
+    return paginated_response(students, next_cursor, total)
+
+@api.route('/api/admin/student/<student_id>', methods=['GET'])
 @admin_required()
 def get_student_details(student_id):
     student = users_collection.find_one({'_id': ObjectId(student_id)})
     if not student:
         return jsonify({'error': 'Student not found'}), 404
     
-    student_id_str = str(student['_id'])
-    clerk_id = student.get('clerkId', '')
+    student_filter = ResolvedUser(student, dual_read=USER_ID_DUAL_READ).user_filter()
     
-    # Try both student ID and clerk ID for enrollments
-    enrollments = list(enrollments_collection.find({
-        '$or': [
-            {'userId': student_id_str},
-            {'userId': clerk_id}
-        ]
-    }))
+    # Enrollments stored under the student's id(s)
+    enrollments = list(enrollments_collection.find(student_filter))
     student['enrollments'] = []
     
+    courses = courses_by_id(e.get('courseId') for e in enrollments)
     for enrollment in enrollments:
         try:
-            course = courses_collection.find_one({'_id': ObjectId(enrollment['courseId'])})
+            course = courses.get(enrollment.get('courseId'))
             if course:
                 progress = progress_collection.find_one({
-                    '$or': [
-                        {'userId': student_id_str, 'courseId': enrollment['courseId']},
-                        {'userId': clerk_id, 'courseId': enrollment['courseId']}
-                    ]
+                    **student_filter,
+                    'courseId': enrollment['courseId']
                 })
                 enrollment_data = {
-                    'course': serialize_doc(course),
-                    'progress': serialize_doc(progress) if progress else None
+                    'course': course,
+                    'progress': progress
                 }
                 student['enrollments'].append(enrollment_data)
         except:
             continue
     
     # Get study updates
-    updates = list(study_updates_collection.find({
-        '$or': [
-            {'userId': student_id_str},
-            {'userId': clerk_id}
-        ]
-    }).sort('date', -1))
+    updates = list(study_updates_collection.find(student_filter).sort('date', -1))
+    courses = courses_by_id(u.get('courseId') for u in updates)
     for update in updates:
         try:
-            course = courses_collection.find_one({'_id': ObjectId(update['courseId'])})
+            course = courses.get(update.get('courseId'))
             if course:
-                update['course'] = serialize_doc(course)
+                update['course'] = course
         except:
             continue
-    student['studyUpdates'] = [serialize_doc(u) for u in updates]
+    student['studyUpdates'] = updates
     
-    return jsonify(serialize_doc(student))
+    return jsonify(student)
 
 # Flowise Custom Tools API Endpoints
 # These endpoints are called by Flowise custom tools to get user data
 
-@app.route('/api/flowise/user-progress', methods=['POST'])
+@api.route('/api/flowise/user-progress', methods=['POST'])
 def get_user_progress_flowise():
     """Endpoint for Flowise 'Get User Progress' custom tool"""
     try:
@@ -633,36 +1252,16 @@ def get_user_progress_flowise():
             return jsonify({'error': 'userId, clerkId, or sessionId required'}), 400
         
         # Get user enrollments with progress
-        enrollments = list(enrollments_collection.find({
-            '$or': [
-                {'userId': user_id},
-                {'userId': str(user_id)}
-            ]
-        }))
-        
-        progress_data = []
-        for enrollment in enrollments:
-            try:
-                course = courses_collection.find_one({'_id': ObjectId(enrollment['courseId'])})
-                if course:
-                    progress = progress_collection.find_one({
-                        '$or': [
-                            {'userId': user_id, 'courseId': enrollment['courseId']},
-                            {'userId': str(user_id), 'courseId': enrollment['courseId']}
-                        ]
-                    })
-                    
-                    progress_data.append({
-                        'courseTitle': course.get('title'),
-                        'courseId': str(course['_id']),
-                        'progress': progress.get('progress', 0) if progress else 0,
-                        'completedTopics': len(progress.get('completedTopics', [])) if progress else 0,
-                        'totalTopics': len(course.get('topics', [])),
-                        'topics': course.get('topics', []),
-                        'completedTopicIndices': progress.get('completedTopics', []) if progress else []
-                    })
-            except:
-                continue
+        context = request_user_context(user_id)
+        progress_data = [{
+            'courseTitle': cp['courseTitle'],
+            'courseId': cp['courseId'],
+            'progress': cp['progress'],
+            'completedTopics': len(cp['completedTopics']),
+            'totalTopics': cp['totalTopics'],
+            'topics': cp['topics'],
+            'completedTopicIndices': cp['completedTopics']
+        } for cp in context.course_progress()]
         
         return jsonify({
             'userId': user_id,
@@ -672,7 +1271,7 @@ def get_user_progress_flowise():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/flowise/course-recommendations', methods=['POST'])
+@api.route('/api/flowise/course-recommendations', methods=['POST'])
 def get_course_recommendations():
     """Endpoint for Flowise 'Course Recommendations' custom tool"""
     try:
@@ -682,49 +1281,27 @@ def get_course_recommendations():
         if not user_id:
             return jsonify({'error': 'userId, clerkId, or sessionId required'}), 400
         
-        # Get user's enrolled courses
-        enrolled_course_ids = []
-        enrollments = list(enrollments_collection.find({
-            '$or': [
-                {'userId': user_id},
-                {'userId': str(user_id)}
-            ]
-        }))
-        enrolled_course_ids = [e['courseId'] for e in enrollments]
-        
-        # Get all courses
-        all_courses = list(courses_collection.find())
-        
-        # Filter out enrolled courses
-        recommended_courses = []
-        for course in all_courses:
-            if str(course['_id']) not in enrolled_course_ids:
-                recommended_courses.append({
-                    'courseId': str(course['_id']),
-                    'title': course.get('title'),
-                    'description': course.get('description'),
-                    'instructor': course.get('instructor', 'TBA'),
-                    'duration': course.get('duration', 'N/A'),
-                    'topicCount': len(course.get('topics', []))
-                })
-        
+        # Ranked by the item-item recommender (popular courses for new users)
+        limit = parse_limit(data.get('limit'), default=10, maximum=50)
+        context = request_user_context(user_id, include_topics=False)
+        recommended_courses = [{
+            'courseId': str(course['_id']),
+            'title': course.get('title'),
+            'description': course.get('description'),
+            'instructor': course.get('instructor', 'TBA'),
+            'duration': course.get('duration', 'N/A'),
+            'topicCount': topic_count(course),
+            'score': course.get('score'),
+            'reason': course.get('reason')
+        } for course in context.recommendations(limit=limit)]
+
         # Get user progress to make smart recommendations
-        user_progress = []
-        for enrollment in enrollments:
-            progress = progress_collection.find_one({
-                '$or': [
-                    {'userId': user_id, 'courseId': enrollment['courseId']},
-                    {'userId': str(user_id), 'courseId': enrollment['courseId']}
-                ]
-            })
-            if progress:
-                course = courses_collection.find_one({'_id': ObjectId(enrollment['courseId'])})
-                if course:
-                    user_progress.append({
-                        'course': course.get('title'),
-                        'progress': progress.get('progress', 0)
-                    })
-        
+        user_progress = [{
+            'course': entry['courseTitle'],
+            'progress': entry['progress']
+        } for entry in context.course_progress()
+            if entry['courseId'] in context.progress_by_course]
+
         return jsonify({
             'userId': user_id,
             'recommendedCourses': recommended_courses,
@@ -734,7 +1311,7 @@ def get_course_recommendations():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/flowise/user-info', methods=['POST'])
+@api.route('/api/flowise/user-info', methods=['POST'])
 def get_user_info_flowise():
     """Get comprehensive user information for Flowise"""
     try:
@@ -745,34 +1322,16 @@ def get_user_info_flowise():
             return jsonify({'error': 'userId, clerkId, or sessionId required'}), 400
         
         # Get user from database
-        user = users_collection.find_one({
-            '$or': [
-                {'clerkId': user_id},
-                {'clerkId': str(user_id)},
-                {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-            ]
-        })
-        
-        if not user:
+        resolved = resolve_user(user_id)
+        if not resolved:
             return jsonify({'error': 'User not found'}), 404
+        user = resolved.user
         
         # Get enrollments
-        enrollments = list(enrollments_collection.find({
-            '$or': [
-                {'userId': user_id},
-                {'userId': str(user_id)},
-                {'userId': str(user.get('_id'))}
-            ]
-        }))
+        enrollments = list(enrollments_collection.find(resolved.user_filter()))
         
         # Get progress summary
-        progress_list = list(progress_collection.find({
-            '$or': [
-                {'userId': user_id},
-                {'userId': str(user_id)},
-                {'userId': str(user.get('_id'))}
-            ]
-        }))
+        progress_list = list(progress_collection.find(resolved.user_filter()))
         
         avg_progress = 0
         if progress_list:
@@ -791,7 +1350,7 @@ def get_user_info_flowise():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/flowise/user-context', methods=['POST'])
+@api.route('/api/flowise/user-context', methods=['POST'])
 def get_user_context_flowise():
     """Comprehensive user context for Flowise chatbot"""
     try:
@@ -801,75 +1360,14 @@ def get_user_context_flowise():
         if not user_id:
             return jsonify({'error': 'userId, clerkId, or sessionId required'}), 400
         
-        # Get user from database
-        user = users_collection.find_one({
-            '$or': [
-                {'clerkId': user_id},
-                {'clerkId': str(user_id)},
-                {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-            ]
-        })
-        
-        if not user:
+        # Enrollments, courses and progress in three batched queries
+        context = request_user_context(user_id)
+        if not context.user:
             return jsonify({'error': 'User not found'}), 404
+        user = context.user
         
-        # Get enrollments with progress
-        enrollments = list(enrollments_collection.find({
-            '$or': [
-                {'userId': user_id},
-                {'userId': str(user_id)},
-                {'userId': str(user.get('_id'))}
-            ]
-        }))
-        
-        # Get detailed progress for each enrollment
-        course_progress = []
-        total_progress = 0
-        
-        for enrollment in enrollments:
-            try:
-                course = courses_collection.find_one({'_id': ObjectId(enrollment['courseId'])})
-                if course:
-                    progress = progress_collection.find_one({
-                        '$or': [
-                            {'userId': user_id, 'courseId': enrollment['courseId']},
-                            {'userId': str(user_id), 'courseId': enrollment['courseId']},
-                            {'userId': str(user.get('_id')), 'courseId': enrollment['courseId']}
-                        ]
-                    })
-                    
-                    progress_data = {
-                        'courseTitle': course.get('title'),
-                        'courseId': str(course['_id']),
-                        'progress': progress.get('progress', 0) if progress else 0,
-                        'completedTopics': progress.get('completedTopics', []) if progress else [],
-                        'totalTopics': len(course.get('topics', [])),
-                        'topics': course.get('topics', []),
-                        'enrolledAt': enrollment.get('enrolledAt')
-                    }
-                    course_progress.append(progress_data)
-                    total_progress += progress_data['progress']
-            except Exception as e:
-                print(f"Error processing enrollment: {e}")
-                continue
-        
-        # Calculate average progress
-        avg_progress = total_progress / len(course_progress) if course_progress else 0
-        
-        # Get study updates
-        study_updates = list(study_updates_collection.find({
-            '$or': [
-                {'userId': user_id},
-                {'userId': str(user_id)},
-                {'userId': str(user.get('_id'))}
-            ]
-        }).sort('date', -1).limit(10))
-        
-        # Get recommended courses (not enrolled)
-        enrolled_course_ids = [e['courseId'] for e in enrollments]
-        recommended_courses = list(courses_collection.find({
-            '_id': {'$nin': [ObjectId(cid) for cid in enrolled_course_ids]}
-        }).limit(5))
+        study_updates = context.recent_study_updates(10)
+        recommended_courses = context.recommendations(5)
         
         return jsonify({
             'user': {
@@ -880,9 +1378,9 @@ def get_user_context_flowise():
                 'createdAt': user.get('createdAt')
             },
             'learning': {
-                'totalEnrollments': len(enrollments),
-                'averageProgress': round(avg_progress, 2),
-                'courseProgress': course_progress,
+                'totalEnrollments': len(context.enrollments),
+                'averageProgress': round(context.average_progress(), 2),
+                'courseProgress': context.course_progress(),
                 'recentStudyUpdates': [{
                     'content': update.get('content'),
                     'date': update.get('date'),
@@ -903,7 +1401,7 @@ def get_user_context_flowise():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/flowise/update-progress', methods=['POST'])
+@api.route('/api/flowise/update-progress', methods=['POST'])
 def update_progress_flowise():
     """Allow chatbot to update user progress"""
     try:
@@ -916,43 +1414,45 @@ def update_progress_flowise():
             return jsonify({'error': 'userId and courseId required'}), 400
         
         # Find user
-        user = users_collection.find_one({
-            '$or': [
-                {'clerkId': user_id},
-                {'clerkId': str(user_id)},
-                {'_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-            ]
-        })
-        
-        if not user:
+        if not resolve_user(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         # Update progress
-        course = courses_collection.find_one({'_id': ObjectId(course_id)})
-        if not course:
+        course = course_catalog.get(course_id)
+        if course is None:
             return jsonify({'error': 'Course not found'}), 404
         
-        total_topics = len(course.get('topics', []))
+        total_topics = course.topic_count
         progress_percent = (len(completed_topics) / total_topics * 100) if total_topics > 0 else 0
         
         # Use the existing update_progress logic
         progress_data = {
-            'userId': user_id,
             'courseId': course_id,
             'completedTopics': completed_topics,
             'progress': progress_percent,
             'lastUpdated': datetime.now(timezone.utc).isoformat()
         }
         
-        # Update or insert progress
-        progress_collection.update_one(
-            {
-                'userId': user_id,
-                'courseId': course_id
-            },
-            {'$set': progress_data},
-            upsert=True
+        # Update the row stored under any of the user's ids, or insert one
+        # under the canonical key
+        existing = progress_collection.find_one(
+            {**user_filter(user_id), 'courseId': course_id},
+            {'progress': 1}
         )
+        if existing:
+            progress_collection.update_one({'_id': existing['_id']}, {'$set': progress_data})
+            platform_stats.progress_changed(existing.get('progress', 0), progress_percent)
+        else:
+            upsert = progress_collection.update_one(
+                {'userId': canonical_user_id(user_id), 'courseId': course_id},
+                {'$set': progress_data},
+                upsert=True
+            )
+            if upsert.upserted_id is not None:
+                platform_stats.progress_added(progress_percent)
+        if progress_percent >= COMPLETED:
+            course_recommender.record_event(course_id)
+        context_builder.invalidate(user_id)
         
         return jsonify({
             'success': True,
@@ -963,20 +1463,20 @@ def update_progress_flowise():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/flowise/chat-history', methods=['POST'])
+@api.route('/api/flowise/chat-history', methods=['POST'])
 def save_chat_history():
     """Save chat history for context"""
     data = request.json
     # Store in chat_sessions collection
     pass
 
-@app.route('/api/flowise/chat-history/<user_id>', methods=['GET'])
+@api.route('/api/flowise/chat-history/<user_id>', methods=['GET'])
 def get_chat_history(user_id):
     """Get previous chat history for context"""
     pass
 
 # Add health check endpoint
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     try:
@@ -1003,7 +1503,28 @@ def health_check():
 
 # ------------------ NEW AGENT POWERED CHATBOT ENDPOINT ------------------
 
-@app.route('/api/chatbot/message', methods=['POST'])
+def chatbot_user_context(user_id):
+    """Request-scoped UserContext for the agent (None if unavailable)"""
+    if not user_id or db is None:
+        return None
+    try:
+        return request_user_context(user_id, include_topics=False)
+    except Exception as e:
+        print("Error building user context:", e)
+        return None
+
+def chatbot_payload(agent_reply, session_id, user_id):
+    return {
+        "reply": agent_reply.get("reply", ""),
+        "action": agent_reply.get("action", "none"),
+        "data": agent_reply.get("data"),
+        "routing": agent_reply.get("routing"),
+        "sessionId": session_id,
+        "userId": user_id,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@api.route('/api/chatbot/message', methods=['POST'])
 def chatbot_message():
     """ElevateU Agent (Gemini + Mongo + Tools + Memory)"""
     try:
@@ -1018,213 +1539,28 @@ def chatbot_message():
             return jsonify({"error": "Message is required"}), 400
 
         # -------------------------------------------------------
-        # 1. SAVE USER MESSAGE TO CHAT HISTORY (same as before)
-        # -------------------------------------------------------
-        if chat_sessions_collection is not None:
-            chat_sessions_collection.update_one(
-                {"sessionId": session_id},
-                {
-                    "$set": {
-                        "userId": user_id,
-                        "userName": user_name,
-                        "userEmail": user_email,
-                        "updatedAt": datetime.now(timezone.utc)
-                    },
-                    "$push": {
-                        "messages": {
-                            "type": "user",
-                            "content": message,
-                            "timestamp": datetime.now(timezone.utc).isoformat()
-                        }
-                    }
-                },
-                upsert=True
-            )
-
-        # -------------------------------------------------------
-        # 2. BUILD USER CONTEXT (YOUR ORIGINAL FULL LOGIC)
+        # 1. BUILD USER CONTEXT (shared with the agent, built once)
         # -------------------------------------------------------
-        user_context = None
-        if user_id and db is not None:
-            try:
-                user = users_collection.find_one({
-                    "$or": [
-                        {"clerkId": user_id},
-                        {"clerkId": str(user_id)},
-                        {"_id": ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
-                    ]
-                })
-
-                if user:
-                    enrollments = list(enrollments_collection.find({
-                        "$or": [
-                            {"userId": user_id},
-                            {"userId": str(user_id)},
-                            {"userId": str(user["_id"])}
-                        ]
-                    }))
-
-                    course_progress = []
-                    total_progress = 0
-
-                    for enrollment in enrollments:
-                        try:
-                            course = courses_collection.find_one({
-                                "_id": ObjectId(enrollment["courseId"])
-                            })
-                            if not course:
-                                continue
-
-                            progress = progress_collection.find_one({
-                                "$or": [
-                                    {"userId": user_id, "courseId": enrollment["courseId"]},
-                                    {"userId": str(user_id), "courseId": enrollment["courseId"]},
-                                    {"userId": str(user.get("_id")), "courseId": enrollment["courseId"]}
-                                ]
-                            })
-
-                            if progress and isinstance(progress, dict):
-                                p = safe_progress(progress, course)
-                            else:
-                                p = safe_progress({}, course)
-
-                            # clean completed topics
-                            if not isinstance(p["completedTopics"], list):
-                                p["completedTopics"] = []
-                            else:
-                                clean = []
-                                for item in p["completedTopics"]:
-                                    try:
-                                        if isinstance(item, int):
-                                            clean.append(item)
-                                        elif isinstance(item, str) and item.isdigit():
-                                            clean.append(int(item))
-                                    except:
-                                        continue
-                                p["completedTopics"] = clean
-
-                            if not isinstance(p["topics"], list):
-                                p["topics"] = []
-
-                            cp = {
-                                "courseTitle": str(course.get("title", "Untitled")),
-                                "courseId": str(course.get("_id")),
-                                "progress": float(p.get("progress", 0)),
-                                "completedTopics": p["completedTopics"],
-                                "totalTopics": int(p.get("totalTopics", len(course.get("topics", [])))),
-                                "topics": p["topics"],
-                                "enrolledAt": enrollment.get("enrolledAt")
-                            }
-
-                            course_progress.append(cp)
-                            total_progress += cp["progress"]
-
-                        except Exception as e:
-                            print(f"Error processing enrollment: {e}")
-                            continue
-
-                    avg_progress = total_progress / len(course_progress) if course_progress else 0
-
-                    enrolled_ids = [e["courseId"] for e in enrollments]
-                    recommended_courses = list(courses_collection.find({
-                        "_id": {"$nin": [ObjectId(cid) for cid in enrolled_ids]}
-                    }).limit(5))
-
-                    completed_courses = sum(1 for p in course_progress if p["progress"] >= 100)
-                    active_courses = sum(1 for p in course_progress if 0 < p["progress"] < 100)
-
-                    enrollment_list = []
-                    for enrollment in enrollments:
-                        matched = next(
-                            (cp for cp in course_progress if cp["courseId"] == enrollment["courseId"]),
-                            None
-                        )
-
-                        course_obj = {
-                            "title": matched.get("courseTitle", "Unknown") if matched else "Unknown",
-                            "topics": matched.get("topics", []) if matched else []
-                        }
-
-                        enrollment_list.append({
-                            "courseId": enrollment.get("courseId"),
-                            "enrolledAt": enrollment.get("enrolledAt"),
-                            "progress": matched["progress"] if matched else 0,
-                            "lastAccessed": enrollment.get("lastAccessed"),
-                            "course": course_obj
-                        })
-
-                    user_context = {
-                        "user": {
-                            "userId": user_id,
-                            "name": user.get("name"),
-                            "email": user.get("email"),
-                            "role": user.get("role"),
-                            "createdAt": user.get("createdAt")
-                        },
-                        "learning": {
-                            "totalEnrollments": len(enrollments),
-                            "averageProgress": round(avg_progress, 2),
-                            "completedCourses": completed_courses,
-                            "activeCourses": active_courses,
-                            "courseProgress": course_progress,
-                            "completionRate": round(
-                                (completed_courses / len(enrollments) * 100), 1
-                            ) if enrollments else 0
-                        },
-                        "enrollments": enrollment_list,
-                        "recommendations": [{
-                            "courseId": str(course["_id"]),
-                            "title": course.get("title"),
-                            "description": course.get("description"),
-                            "instructor": course.get("instructor", "TBA"),
-                            "topics": course.get("topics", []),
-                            "difficulty": course.get("difficulty", "beginner"),
-                            "duration": course.get("duration", "4 weeks")
-                        } for course in recommended_courses]
-                    }
-
-            except Exception as e:
-                print("Error building user context:", e)
-                user_context = None
+        user_context = chatbot_user_context(user_id)
 
         # -------------------------------------------------------
-        # 3. PASS MESSAGE INTO THE NEW AI AGENT
+        # 2. PASS MESSAGE INTO THE NEW AI AGENT
+        #    (the agent saves the turn to the chat session)
         # -------------------------------------------------------
-        agent_reply = agent.process_message(
+        chat_agent = get_agent()
+        if chat_agent is None:
+            return jsonify({"error": "Chatbot agent not available"}), 503
+        agent_reply = chat_agent.process_message(
             message=message,
-            user_id=user_id
+            user_id=user_id,
+            user_context=user_context,
+            session={"sessionId": session_id, "userName": user_name, "userEmail": user_email}
         )
 
         # -------------------------------------------------------
-        # 4. SAVE AGENT RESPONSE INTO CHAT HISTORY
+        # 3. RETURN CLEAN RESPONSE TO FRONTEND
         # -------------------------------------------------------
-        if chat_sessions_collection is not None:
-            chat_sessions_collection.update_one(
-                {"sessionId": session_id},
-                {
-                    "$push": {
-                        "messages": {
-                            "type": "agent",
-                            "content": agent_reply.get("reply", ""),
-                            "timestamp": datetime.now(timezone.utc).isoformat(),
-                            "action": agent_reply.get("action", "none"),
-                            "data": agent_reply.get("data", {})
-                        }
-                    }
-                }
-            )
-
-        # -------------------------------------------------------
-        # 5. RETURN CLEAN RESPONSE TO FRONTEND
-        # -------------------------------------------------------
-        return jsonify({
-            "reply": agent_reply.get("reply", ""),
-            "action": agent_reply.get("action", "none"),
-            "data": agent_reply.get("data"),
-            "sessionId": session_id,
-            "userId": user_id,
-            "timestamp": datetime.now().isoformat()
-        })
+        return jsonify(chatbot_payload(agent_reply, session_id, user_id))
 
     except Exception as e:
         print("ERROR in chatbot message:", e)
@@ -1233,45 +1569,113 @@ def chatbot_message():
             "error": str(e)
         }), 500
 
+@api.route('/api/chatbot/message/stream', methods=['POST'])
+def chatbot_message_stream():
+    """Same as /api/chatbot/message, streamed as Server-Sent Events.
+
+    Emits `delta` events ({"text": ...}) while the reply is generated and
+    one `final` event with the same payload the non-streaming endpoint
+    returns. The agent saves the turn to the chat session when it is done.
+    """
+    data = request.json or {}
+    message = data.get("message", "")
+    user_id = data.get("userId")
+    user_name = data.get("userName", "User")
+    user_email = data.get("userEmail", "")
+    session_id = data.get("sessionId", f"session_{datetime.now().timestamp()}")
+
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+    chat_agent = get_agent()
+    if chat_agent is None:
+        return jsonify({"error": "Chatbot agent not available"}), 503
+
+    user_context = chatbot_user_context(user_id)
+    session = {"sessionId": session_id, "userName": user_name, "userEmail": user_email}
+
+    def generate():
+        try:
+            for event, payload in chat_agent.process_message_stream(
+                message=message,
+                user_id=user_id,
+                user_context=user_context,
+                session=session
+            ):
+                if event == "delta":
+                    yield sse_event("delta", {"text": payload})
+                    continue
+                yield sse_event("final", chatbot_payload(payload, session_id, user_id))
+        except Exception as e:
+            print("ERROR in chatbot stream:", e)
+            yield sse_event("error", {
+                "reply": "Sorry Ameer, something went wrong.",
+                "error": str(e)
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # Chat history endpoints
-@app.route('/api/chatbot/sessions/<session_id>/history', methods=['GET'])
+@api.route('/api/chatbot/sessions/<session_id>/history', methods=['GET'])
 def get_chatbot_session_history(session_id):
-    """Get chat history for a session"""
+    """Get chat history for a session, newest page first.
+
+    `limit` messages per page (oldest first within the page); pass the
+    X-Next-Cursor header back as `after` to load older messages. `fields`
+    picks the message fields (e.g. type,content); `id` is always included.
+    """
     try:
-        if chat_sessions_collection is None:
+        if conversation_store is None:
             return jsonify({'error': 'Database not connected'}), 503
 
-        session = chat_sessions_collection.find_one({'sessionId': session_id})
+        try:
+            limit, cursor, fields = list_params(MESSAGE_FIELDS, cursor_keys=())
+            check_history_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Apply queued chat writes first so the latest turns are visible
+        chat_writer.flush(timeout=2.0)
+        session = conversation_store.get_session(session_id)
         if not session:
             return jsonify({'error': 'Session not found'}), 404
 
-        return jsonify({
+        messages, next_cursor = conversation_store.history(
+            session_id, limit, cursor, fields=[f for f in fields if f != '_id'] if fields else None
+        )
+        response = jsonify({
             'sessionId': session_id,
-            'messages': session.get('messages', []),
+            'messages': [{**m, 'id': str(m['id'])} if 'id' in m else m for m in messages],
+            'messageCount': session.get('messageCount'),
             'userId': session.get('userId'),
             'userName': session.get('userName')
         })
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = encode_cursor(next_cursor)
+        return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/chatbot/user/<user_id>/sessions', methods=['GET'])
+@api.route('/api/chatbot/user/<user_id>/sessions', methods=['GET'])
 def get_user_sessions(user_id):
     """Get all chat sessions for a user"""
     try:
-        if chat_sessions_collection is None:
+        if conversation_store is None:
             return jsonify({'error': 'Database not connected'}), 503
 
-        sessions = list(chat_sessions_collection.find(
-            {'userId': user_id},
-            {'sessionId': 1, 'userName': 1, 'updatedAt': 1, 'messages.0': 1}
-        ).sort('updatedAt', -1).limit(10))
+        chat_writer.flush(timeout=2.0)
+        sessions = conversation_store.sessions_for_user(user_id, limit=10)
 
-        return jsonify([serialize_doc(session) for session in sessions])
+        return jsonify(sessions)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", debug=True, port=5000, threaded=True)
+    # Local development server; production runs gunicorn (see gunicorn.conf.py)
+    create_app().run(host="0.0.0.0", debug=True, port=5000, threaded=True)
 
@@ -0,0 +1,37 @@
+"""Daemon threads for per-worker background work (periodic rebuilds and
+reconciles, and on-demand refreshes after writes).
+
+guarded() logs a failed run instead of killing the thread, so a MongoDB
+hiccup only costs one run.
+"""
+import threading
+
+
+def guarded(task, description):
+    """`task` wrapped so an exception is logged, not raised"""
+    def run():
+        try:
+            return task()
+        except Exception as e:
+            print(f" * {description} failed: {e}")
+    return run
+
+
+def start_background(task, name):
+    """Run `task` once in a daemon thread"""
+    threading.Thread(target=task, name=name, daemon=True).start()
+
+
+def start_periodic(task, interval_seconds, name, run_now=True):
+    """Run `task` now (if `run_now`) and every `interval_seconds` in a
+    daemon thread; set the returned Event to stop it"""
+    stop = threading.Event()
+
+    def run():
+        if run_now:
+            task()
+        while not stop.wait(interval_seconds):
+            task()
+
+    start_background(run, name)
+    return stop
@@ -0,0 +1,67 @@
+"""Cold-start time of the backend against COLD_START_BUDGET_MS.
+
+Each run is a fresh interpreter that imports app and calls create_app(),
+which is what a gunicorn master (or `python app.py`) pays before it can
+serve. MongoDB is not contacted: workers connect after the fork, on
+their first request. The imports that were moved off this path are
+timed too, for comparison.
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--budget-ms 1500]
+
+Exits with status 1 if the median is over budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = (
+    "import time; t = time.perf_counter(); "
+    "import app; app.create_app(); "
+    "print((time.perf_counter() - t) * 1000)"
+)
+DEFERRED = {
+    'google.generativeai (first chat)': 'google.generativeai',
+    'numpy + scipy.sparse (first recommender build)': 'scipy.sparse',
+}
+
+
+def time_ms(code):
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=BACKEND, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_ms(module):
+    return time_ms(f"import time; t = time.perf_counter(); import {module}; "
+                   f"print((time.perf_counter() - t) * 1000)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.getenv('COLD_START_BUDGET_MS', '1500')))
+    args = parser.parse_args()
+
+    runs = [time_ms(STARTUP) for _ in range(args.runs)]
+    median = statistics.median(runs)
+    print(f"import app + create_app(): median {median:.0f} ms, "
+          f"min {min(runs):.0f} ms, max {max(runs):.0f} ms ({args.runs} runs)")
+    for label, module in DEFERRED.items():
+        try:
+            print(f"  deferred {label}: {import_ms(module):.0f} ms")
+        except subprocess.CalledProcessError:
+            print(f"  deferred {label}: not installed")
+
+    within = median <= args.budget_ms
+    print(f"budget {args.budget_ms:.0f} ms: {'ok' if within else 'OVER'}")
+    sys.exit(0 if within else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Caches shared by the backend services.
+
+TTLCache is the in-process LRU+TTL cache. RedisCache implements the same
+get/set/delete/clear interface on a Redis-compatible server so several
+workers can share entries; make_cache() picks one from a URL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from bson import json_util
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': 'memory',
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / total, 3) if total else 0
+        }
+
+
+class RedisCache:
+    """Cache backed by a Redis-compatible server (Redis, Valkey, KeyDB...).
+
+    Values are stored as Extended JSON so ObjectId and datetime survive the
+    round trip. Entries expire after `ttl` seconds; eviction under memory
+    pressure follows the server's maxmemory-policy (allkeys-lru suits this).
+    """
+
+    def __init__(self, url, prefix='elevateu:', ttl=300):
+        import redis  # optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json_util.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json_util.dumps(value), ex=int(self.ttl if ttl is None else ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*', count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': 'redis',
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / total, 3) if total else 0
+        }
+
+
+def make_cache(url=None, prefix='elevateu:', maxsize=1024, ttl=300):
+    """RedisCache when `url` is set (and redis is installed), else TTLCache"""
+    if url:
+        try:
+            return RedisCache(url, prefix=prefix, ttl=ttl)
+        except ImportError:
+            print(" * redis package not installed, using the in-process cache")
+    return TTLCache(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,243 @@
+"""Process-wide snapshot of the course catalog.
+
+Courses are read on almost every request but written only by admin CRUD.
+Each worker keeps one immutable CatalogSnapshot: compact CourseRecord
+objects keyed by id. The snapshot is swapped out whole and never
+mutated, so readers need no locks.
+
+The catalog version lives in the `catalog_meta` collection. The course
+write endpoints call bump(), which increments it and reloads this
+worker at once. Other workers compare their snapshot with the stored
+version at most every `check_interval` seconds (one point read) and
+reload when it has moved. A lookup that misses the snapshot checks the
+version at once, then reads `courses` directly, so a course created
+through another worker (or inserted without a bump) is never reported
+as missing.
+
+Enrollment counts change far more often than the catalog, so they are
+kept apart from the snapshot. They are refreshed by one $group
+aggregation at most every `counts_ttl` seconds, or sooner after
+invalidate_counts().
+"""
+import bisect
+import hashlib
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+CATALOG_ID = 'courses'
+RECORD_FIELDS = ('title', 'description', 'instructor', 'duration', 'topics', 'createdAt')
+
+
+class CourseRecord:
+    __slots__ = ('id', 'title', 'description', 'instructor', 'duration', 'topics', 'created_at', 'extra')
+
+    def __init__(self, doc):
+        self.id = str(doc['_id'])
+        self.title = doc.get('title')
+        self.description = doc.get('description')
+        self.instructor = doc.get('instructor')
+        self.duration = doc.get('duration')
+        topics = doc.get('topics')
+        self.topics = tuple(topics) if isinstance(topics, list) else ()
+        self.created_at = doc.get('createdAt')
+        # Fields outside the usual schema (e.g. difficulty) are kept as-is
+        self.extra = {k: v for k, v in doc.items() if k != '_id' and k not in RECORD_FIELDS} or None
+
+    @property
+    def topic_count(self):
+        return len(self.topics)
+
+    def to_dict(self, fields=None):
+        """A fresh course document (string _id) safe to modify.
+
+        `fields` is a projection ({field: 1}); it may also ask for the
+        computed `topicCount`.
+        """
+        doc = {
+            '_id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'instructor': self.instructor,
+            'duration': self.duration,
+            'topics': self.topics
+        }
+        if self.created_at is not None:
+            doc['createdAt'] = self.created_at
+        if self.extra:
+            doc.update(self.extra)
+        if fields is not None:
+            doc = {field: doc[field] for field in fields if field in doc}
+            if 'topicCount' in fields:
+                doc['topicCount'] = self.topic_count
+        if 'topics' in doc:
+            doc['topics'] = list(self.topics)
+        return doc
+
+
+class CatalogSnapshot:
+    __slots__ = ('version', 'records', 'order', 'loaded_at')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = {record.id: record for record in records}
+        self.order = tuple(record.id for record in records)
+        self.loaded_at = time.time()
+
+
+class CourseCatalog:
+    def __init__(self, db, check_interval=5.0, counts_ttl=30.0):
+        self.courses = db['courses']
+        self.enrollments = db['enrollments']
+        self.meta = db['catalog_meta']
+        self.check_interval = check_interval
+        self.counts_ttl = counts_ttl
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+        self._counts = None
+        self._counts_at = 0.0
+        self.reloads = 0
+        self.version_checks = 0
+
+    def _stored_version(self):
+        doc = self.meta.find_one({'_id': CATALOG_ID}, {'version': 1})
+        return (doc or {}).get('version', 0)
+
+    def _load(self, version):
+        records = [CourseRecord(doc) for doc in self.courses.find({}).sort('_id', 1)]
+        self._snapshot = CatalogSnapshot(version, records)
+        self.reloads += 1
+        return self._snapshot
+
+    def snapshot(self, force=False):
+        """The current snapshot, reloaded if the stored version moved.
+
+        The version is checked at most every `check_interval` seconds, or
+        right away with `force` (used when a lookup misses, since the
+        course may have been created through another worker).
+        """
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if not force and snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+        # One thread checks; the others keep serving the previous snapshot
+        if not self._load_lock.acquire(blocking=force or snapshot is None):
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if force or snapshot is None or time.monotonic() - self._checked_at >= self.check_interval:
+                self.version_checks += 1
+                version = self._stored_version()
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._load(version)
+                self._checked_at = time.monotonic()
+            return snapshot
+        finally:
+            self._load_lock.release()
+
+    def bump(self):
+        """Record a catalog write and reload this worker's snapshot"""
+        doc = self.meta.find_one_and_update(
+            {'_id': CATALOG_ID},
+            {'$inc': {'version': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self._load_lock:
+            self._load(doc['version'])
+            self._checked_at = time.monotonic()
+        self.invalidate_counts()
+
+    def _fetch(self, course_ids):
+        """Records read from `courses` for ids no snapshot has"""
+        object_ids = [ObjectId(cid) for cid in course_ids if ObjectId.is_valid(cid)]
+        if not object_ids:
+            return {}
+        return {
+            str(doc['_id']): CourseRecord(doc)
+            for doc in self.courses.find({'_id': {'$in': object_ids}})
+        }
+
+    def get(self, course_id):
+        """The course's record, or None if it does not exist"""
+        return self.many([str(course_id)]).get(str(course_id))
+
+    def many(self, course_ids):
+        """Records for the given ids that exist, keyed by id"""
+        course_ids = set(course_ids)
+        records = self.snapshot().records
+        found = {cid: records[cid] for cid in course_ids if cid in records}
+        if len(found) < len(course_ids):
+            # Missing here may only mean this worker is behind
+            records = self.snapshot(force=True).records
+            found.update((cid, records[cid]) for cid in course_ids if cid in records)
+            missing = course_ids.difference(found)
+            if missing:
+                found.update(self._fetch(missing))
+        return found
+
+    def enrollment_counts(self):
+        counts = self._counts
+        if counts is None or time.monotonic() - self._counts_at >= self.counts_ttl:
+            counts = {
+                row['_id']: row['count']
+                for row in self.enrollments.aggregate([
+                    {'$group': {'_id': '$courseId', 'count': {'$sum': 1}}}
+                ])
+            }
+            self._counts = counts
+            self._counts_at = time.monotonic()
+        return counts
+
+    def invalidate_counts(self):
+        self._counts = None
+
+    def listing(self, limit=None, after=None, fields=None):
+        """One page of GET /api/courses: (ETag, build, last id or None, total).
+
+        Courses are ordered by _id; `after` is the last id of the previous
+        page. build() returns the course documents (with enrollmentCount
+        unless `fields` leaves it out). The ETag covers the page, fields,
+        catalog version and counts, so nothing is built on a 304.
+        """
+        snapshot = self.snapshot()
+        order = snapshot.order
+        start = bisect.bisect_right(order, after) if after else 0
+        end = min(start + limit, len(order)) if limit else len(order)
+        page = order[start:end]
+        with_counts = fields is None or 'enrollmentCount' in fields
+        counts = self.enrollment_counts() if with_counts else {}
+
+        variant = f"{start}:{limit}:{','.join(fields) if fields else '*'}:"
+        digest = hashlib.sha1(
+            (variant + ','.join(str(counts.get(cid, 0)) for cid in page)).encode()
+        ).hexdigest()[:12]
+
+        def build():
+            courses = []
+            for cid in page:
+                course = snapshot.records[cid].to_dict(fields)
+                if with_counts:
+                    course['enrollmentCount'] = counts.get(cid, 0)
+                courses.append(course)
+            return courses
+
+        last = page[-1] if page and end < len(order) else None
+        return f"catalog-{snapshot.version}-{digest}", build, last, len(order)
+
+    def etag(self, course_id):
+        """ETag of one course: it changes with every catalog version"""
+        return f"course-{course_id}-{self.snapshot().version}"
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else None,
+            'courses': len(snapshot.records) if snapshot else 0,
+            'loadedAt': snapshot.loaded_at if snapshot else None,
+            'reloads': self.reloads,
+            'versionChecks': self.version_checks
+        }
@@ -0,0 +1,103 @@
+"""Negotiated compression of API responses.
+
+init_compression() registers an after_request hook. It compresses
+buffered JSON and text responses of at least `min_size` bytes with the
+best encoding the client accepts: brotli when the `brotli` package is
+installed, then gzip. These responses are left alone:
+
+- streamed responses (Server-Sent Events must reach the client chunk by
+  chunk)
+- files sent by send_file (static_files.py serves precompressed copies)
+- anything that already has a Content-Encoding
+- non-200 responses
+
+A compressed response carries `Vary: Accept-Encoding`, and its ETag is
+made weak, because the bytes differ from the uncompressed representation.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+# Dynamic responses favour speed over ratio (static files use quality 11)
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+
+
+def available_compressors():
+    available = []
+    if brotli is not None:
+        available.append(('br', lambda data: brotli.compress(data, quality=BROTLI_QUALITY)))
+    available.append(('gzip', lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)))
+    return available
+
+
+class ResponseCompressor:
+    def __init__(self, min_size=MIN_SIZE):
+        self.min_size = min_size
+        self.compressors = available_compressors()
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _eligible(self, response):
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        mimetype = response.mimetype or ''
+        return mimetype.startswith(COMPRESSIBLE_TYPES) and mimetype != 'text/event-stream'
+
+    def __call__(self, response, request):
+        if not self._eligible(response):
+            return response
+        encoding = next(
+            ((name, compress) for name, compress in self.compressors if request.accept_encodings[name]),
+            None
+        )
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        name, compress = encoding
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = name
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        self.responses += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        return response
+
+    def stats(self):
+        return {
+            'encodings': [name for name, _ in self.compressors],
+            'minSize': self.min_size,
+            'responses': self.responses,
+            'bytesIn': self.bytes_in,
+            'bytesOut': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+        }
+
+
+def init_compression(app, min_size=MIN_SIZE):
+    compressor = ResponseCompressor(min_size)
+
+    @app.after_request
+    def compress_response(response):
+        return compressor(response, request)
+
+    return compressor
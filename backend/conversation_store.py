@@ -0,0 +1,222 @@
+"""Conversation storage shared by the chat endpoints and the agent.
+
+Every chat message is written once. A session is one small header
+document in `chat_sessions` (owner, message counter, first/last message
+previews) plus its messages in `chat_messages` bucket documents of at
+most BUCKET_SIZE messages each. Appending bumps the header's counter
+(on the write-behind thread), which numbers the message; message n goes
+to bucket `seq` n // BUCKET_SIZE, upserted on the unique (sessionId, seq)
+pair, so concurrent appends from any worker converge on the same bucket
+and no write ever touches an unbounded array. Every message carries a
+client-side ObjectId `id`; buckets record sessionId/userId and
+firstId/lastId, which serves both session history pages (walking back
+from the bucket with the newest message) and the agent's "last N
+messages of this user" memory.
+
+Sessions written before bucketing keep their `messages` array on the
+header document and are still served from it until
+migrate_conversations.py moves them into buckets.
+"""
+import threading
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+BUCKET_SIZE = 50
+PREVIEW_CHARS = 200
+
+
+def message_preview(message):
+    return {
+        'type': message.get('type'),
+        'content': (message.get('content') or '')[:PREVIEW_CHARS],
+        'timestamp': message.get('timestamp')
+    }
+
+
+def bucket_push(session_id, user_id, seq, messages, now, **on_insert):
+    """Upsert appending `messages` to the session's bucket `seq`"""
+    ids = [message['id'] for message in messages]
+    return UpdateOne(
+        {'sessionId': session_id, 'seq': seq},
+        {
+            '$push': {'messages': {'$each': messages}},
+            '$inc': {'count': len(messages)},
+            '$min': {'firstId': min(ids)},
+            '$max': {'lastId': max(ids)},
+            '$setOnInsert': {'userId': user_id, 'createdAt': now, **on_insert}
+        },
+        upsert=True
+    )
+
+
+def check_history_cursor(cursor):
+    """Raise ValueError unless `cursor` is one history() hands out"""
+    if cursor is None or 'id' in cursor:
+        return
+    legacy = cursor.get('legacy')
+    if not isinstance(legacy, int) or isinstance(legacy, bool) or legacy < 0:
+        raise ValueError("Invalid cursor")
+
+
+class ConversationStore:
+    """`writer` is any object with enqueue(collection, operation, on_done)
+    that accepts deferred operations (see write_behind.WriteBehindQueue).
+    With one, an append makes no MongoDB round trip in the request: the
+    header counter is bumped on the writer thread. Without one writes run
+    inline. Queued messages stay visible to recent_history() until
+    written."""
+
+    def __init__(self, db, writer=None, bucket_size=BUCKET_SIZE):
+        self.sessions = db['chat_sessions']
+        self.buckets = db['chat_messages']
+        self.writer = writer
+        self.bucket_size = bucket_size
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _write(self, collection, operation, on_done=None):
+        if self.writer is not None:
+            self.writer.enqueue(collection.name, operation, on_done=on_done)
+        else:
+            if callable(operation):
+                operation = operation(collection.database)
+            collection.bulk_write([operation])
+            if on_done is not None:
+                on_done()
+
+    def append(self, session_id, user_id, message, owner=None):
+        """Store one message; `owner` ({userName, userEmail}) is set on the header"""
+        now = datetime.now(timezone.utc)
+        message = {'id': ObjectId(), **message}
+        message.setdefault('timestamp', now.isoformat())
+        header_update = {
+            '$set': {**(owner or {}), 'userId': user_id, 'updatedAt': now,
+                     'lastMessage': message_preview(message)},
+            '$inc': {'messageCount': 1},
+            '$setOnInsert': {'createdAt': now, 'firstMessage': message_preview(message)}
+        }
+
+        def bucket_write(db):
+            # Runs on the writer thread: the header's counter numbers the
+            # message, which picks its bucket
+            header = self.sessions.find_one_and_update(
+                {'sessionId': session_id}, header_update,
+                projection={'messageCount': 1}, upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            seq = (header['messageCount'] - 1) // self.bucket_size
+            return bucket_push(session_id, user_id, seq, [message], now)
+
+        with self._lock:
+            self._pending.setdefault(user_id, []).append(message)
+        self._write(self.buckets, bucket_write, on_done=lambda: self._written(user_id, message['id']))
+        return message
+
+    def _written(self, user_id, message_id):
+        with self._lock:
+            pending = [m for m in self._pending.get(user_id, []) if m['id'] != message_id]
+            if pending:
+                self._pending[user_id] = pending
+            else:
+                self._pending.pop(user_id, None)
+
+    def recent_history(self, user_id, limit=5):
+        """The user's last `limit` messages across sessions, oldest first"""
+        newest_first = []
+        for bucket in self.buckets.find({'userId': user_id}, {'messages': 1, 'lastId': 1}).sort('lastId', -1):
+            # Buckets of parallel sessions interleave; stop once no later
+            # bucket can hold anything newer than the current top `limit`
+            if len(newest_first) >= limit and bucket['lastId'] < newest_first[limit - 1]['id']:
+                break
+            newest_first.extend(bucket.get('messages', []))
+            newest_first.sort(key=lambda m: m['id'], reverse=True)
+        with self._lock:
+            pending = list(self._pending.get(user_id, []))
+        if pending:
+            seen = {m['id'] for m in newest_first}
+            newest_first += [m for m in pending if m['id'] not in seen]
+        newest_first.sort(key=lambda m: m['id'], reverse=True)
+        return newest_first[:limit][::-1]
+
+    def get_session(self, session_id):
+        return self.sessions.find_one(
+            {'sessionId': session_id},
+            {'messages': 0}
+        )
+
+    @staticmethod
+    def _message_projection(fields):
+        """Projection of the messages array; `id` always comes along"""
+        if not fields:
+            return {'messages': 1}
+        return {f'messages.{field}': 1 for field in ('id', *fields)}
+
+    def _bucket_page(self, session_id, limit, before, fields=None):
+        query = {'sessionId': session_id}
+        if before is not None:
+            query['firstId'] = {'$lt': before}
+
+        newest_first = []
+        projection = {**self._message_projection(fields), 'lastId': 1}
+        for bucket in self.buckets.find(query, projection).sort('lastId', -1):
+            # Ids are taken before the counter, so appends racing on a
+            # bucket boundary can leave neighbouring buckets overlapping
+            # slightly; stop once no later bucket can hold anything newer
+            # than the top `limit + 1`
+            if len(newest_first) > limit and bucket['lastId'] < newest_first[limit]['id']:
+                break
+            newest_first.extend(
+                m for m in bucket.get('messages', []) if before is None or m['id'] < before
+            )
+            newest_first.sort(key=lambda m: m['id'], reverse=True)
+        return newest_first
+
+    def _legacy_messages(self, session_id, fields=None):
+        doc = self.sessions.find_one(
+            {'sessionId': session_id, 'messages.0': {'$exists': True}},
+            self._message_projection(fields)
+        )
+        return (doc or {}).get('messages') or []
+
+    def history(self, session_id, limit, cursor=None, fields=None):
+        """One page of messages walking backwards from the newest.
+
+        Returns (messages oldest first, next cursor or None). Cursors are
+        {'id': <oldest message id>} inside the buckets, then
+        {'legacy': <index>} inside a pre-bucketing `messages` array.
+        `fields` limits the message fields read (plus `id`).
+        """
+        cursor = cursor or {}
+        page = []
+        if 'legacy' not in cursor:
+            newest_first = self._bucket_page(session_id, limit, cursor.get('id'), fields)
+            page = newest_first[:limit][::-1]
+            if len(newest_first) > limit:
+                return page, {'id': page[0]['id']}
+
+        # Buckets exhausted: continue into the legacy array, if any
+        remaining = limit - len(page)
+        legacy = self._legacy_messages(session_id, fields)
+        if not legacy:
+            return page, None
+        end = min(cursor.get('legacy', len(legacy)), len(legacy))
+        if remaining <= 0:
+            return page, {'legacy': end} if end > 0 else None
+        start = max(end - remaining, 0)
+        return legacy[start:end] + page, {'legacy': start} if start > 0 else None
+
+    def sessions_for_user(self, user_id, limit=10):
+        sessions = list(self.sessions.find(
+            {'userId': user_id},
+            {
+                'sessionId': 1, 'userName': 1, 'updatedAt': 1, 'messageCount': 1,
+                'firstMessage': 1, 'lastMessage': 1, 'messages': {'$slice': 1}
+            }
+        ).sort('updatedAt', -1).limit(limit))
+        for session in sessions:
+            legacy = session.pop('messages', None)
+            if legacy and 'firstMessage' not in session:
+                session['firstMessage'] = message_preview(legacy[0])
+        return sessions
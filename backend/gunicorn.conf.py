@@ -0,0 +1,33 @@
+"""Gunicorn settings for the production image.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app) and forked into
+workers; nothing it holds at that point is a connection or a thread.
+Each worker then builds its own MongoDB pool and background threads
+(post_worker_init), and the Gemini client on its first chat request.
+gthread workers serve requests, including long-lived chat streams, from
+a thread pool.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+# Read by the app to bound its per-worker cache TTLs
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+# Chat replies can take a while; the worker heartbeat is independent of
+# request time with gthread, so this only bounds a stuck worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    """Connect this worker before it accepts requests"""
+    import app as elevateu
+    elevateu.ensure_services()
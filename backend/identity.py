@@ -0,0 +1,110 @@
+"""Canonical user identity resolution.
+
+Users reach the API with either their Clerk id or their Mongo _id (as a
+string), and older rows in enrollments/progress/study_updates store either
+form in `userId`. UserResolver maps any incoming id to one ResolvedUser whose
+`key` is the canonical user key (the Clerk id when the user has one, the
+stringified _id otherwise) and whose `aliases` cover every stored form.
+
+While dual-read is on, filters match every alias; once migrate_user_ids.py has
+rewritten all rows to the canonical key it can be switched off so filters
+become plain equality on `userId`.
+"""
+from bson import ObjectId
+
+from cache import TTLCache
+
+
+def canonical_user_key(user):
+    """Canonical userId for a users document"""
+    return user.get('clerkId') or str(user['_id'])
+
+
+def user_keys_expression(dual_read=True):
+    """Aggregation expression for the userId values a users document owns.
+
+    Set on users as an array so $lookup can join enrollments/progress with
+    localField/foreignField equality, which uses the userId index.
+    """
+    canonical = {'$ifNull': ['$clerkId', {'$toString': '$_id'}]}
+    if not dual_read:
+        return [canonical]
+    return [canonical, {'$toString': '$_id'}]
+
+
+class ResolvedUser:
+    __slots__ = ('user', 'key', 'aliases', 'dual_read')
+
+    def __init__(self, user, dual_read=True):
+        self.user = user
+        self.dual_read = dual_read
+        self.key = canonical_user_key(user)
+        aliases = [self.key, str(user['_id'])]
+        if user.get('clerkId'):
+            aliases.append(user['clerkId'])
+        # Preserve order (canonical key first) while dropping duplicates
+        self.aliases = list(dict.fromkeys(aliases))
+
+    def stored_ids(self):
+        """Ids this user's rows may be stored under (canonical key first)"""
+        return self.aliases if self.dual_read else [self.key]
+
+    def user_filter(self, field='userId'):
+        """Filter matching rows stored under this user's id(s)"""
+        ids = self.stored_ids()
+        if len(ids) == 1:
+            return {field: ids[0]}
+        return {field: {'$in': ids}}
+
+
+class UserResolver:
+    """Resolves incoming user ids with an LRU+TTL cache in front of `users`.
+
+    create_user/update_user must call invalidate() so a new or changed user
+    is picked up immediately. Misses are only cached for `miss_ttl` seconds:
+    invalidate() reaches the local worker only, so a user who signs up on
+    another worker must become visible here quickly.
+    """
+
+    def __init__(self, users_collection, maxsize=4096, ttl=300, miss_ttl=5, dual_read=True):
+        self.users = users_collection
+        self.dual_read = dual_read
+        self.miss_ttl = miss_ttl
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def resolve(self, user_id):
+        if not user_id:
+            return None
+        user_id = str(user_id)
+
+        cached = self.cache.get(user_id, default=False)
+        if cached is not False:
+            return cached
+
+        if ObjectId.is_valid(user_id):
+            query = {'$or': [{'clerkId': user_id}, {'_id': ObjectId(user_id)}]}
+        else:
+            query = {'clerkId': user_id}
+        user = self.users.find_one(query)
+
+        if not user:
+            if self.miss_ttl > 0:
+                self.cache.set(user_id, None, ttl=self.miss_ttl)
+            return None
+
+        resolved = ResolvedUser(user, dual_read=self.dual_read)
+        self.cache.set(user_id, resolved)
+        for alias in resolved.aliases:
+            self.cache.set(alias, resolved)
+        return resolved
+
+    def invalidate(self, *user_ids):
+        """Drop cached entries for the given ids and every alias they map to"""
+        for user_id in user_ids:
+            if not user_id:
+                continue
+            resolved = self.cache.get(str(user_id))
+            self.cache.delete(str(user_id))
+            if resolved:
+                for alias in resolved.aliases:
+                    self.cache.delete(alias)
@@ -0,0 +1,161 @@
+"""MongoDB index declarations for every ElevateU collection.
+
+All indexes the application relies on are declared in INDEXES so query plans
+stay on IXSCAN as the data grows. ensure_indexes() applies them idempotently at
+startup; run this module directly to apply them or to report missing, unknown
+and unused indexes:
+
+    python indexes.py            # report only
+    python indexes.py --apply    # create missing indexes, then report
+"""
+import argparse
+import os
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# collection name -> list of IndexModel. Names are explicit so the report can
+# match declared and existing indexes by name as well as by key.
+INDEXES = {
+    'users': [
+        IndexModel(
+            [('clerkId', ASCENDING)],
+            name='clerkId_unique',
+            unique=True,
+            partialFilterExpression={'clerkId': {'$type': 'string'}}
+        ),
+        IndexModel([('role', ASCENDING)], name='role'),
+    ],
+    'enrollments': [
+        IndexModel(
+            [('userId', ASCENDING), ('courseId', ASCENDING)],
+            name='userId_courseId_unique',
+            unique=True
+        ),
+        IndexModel([('courseId', ASCENDING)], name='courseId'),
+    ],
+    'progress': [
+        IndexModel(
+            [('userId', ASCENDING), ('courseId', ASCENDING)],
+            name='userId_courseId_unique',
+            unique=True
+        ),
+        IndexModel([('courseId', ASCENDING)], name='courseId'),
+    ],
+    'study_updates': [
+        IndexModel([('userId', ASCENDING), ('date', DESCENDING)], name='userId_date'),
+    ],
+    'agent_memory': [
+        IndexModel([('userId', ASCENDING), ('timestamp', DESCENDING)], name='userId_timestamp'),
+    ],
+    'chat_sessions': [
+        IndexModel([('sessionId', ASCENDING)], name='sessionId_unique', unique=True),
+        IndexModel([('userId', ASCENDING), ('updatedAt', DESCENDING)], name='userId_updatedAt'),
+    ],
+    'chat_messages': [
+        IndexModel(
+            [('sessionId', ASCENDING), ('seq', DESCENDING)],
+            name='sessionId_seq_unique',
+            unique=True
+        ),
+        IndexModel([('sessionId', ASCENDING), ('lastId', DESCENDING)], name='sessionId_lastId'),
+        IndexModel([('userId', ASCENDING), ('lastId', DESCENDING)], name='userId_lastId'),
+    ],
+}
+
+
+def _key_of(spec):
+    """Normalize an index key spec to a comparable tuple"""
+    return tuple(
+        (field, direction if isinstance(direction, str) else int(direction))
+        for field, direction in spec.items()
+    )
+
+
+def ensure_indexes(db, indexes=None):
+    """Create every declared index that is not present yet.
+
+    Each index is created on its own so one conflict (for example a unique
+    index over existing duplicates) does not block the others. Returns a dict
+    of collection -> list of (index name, error message) for failed builds.
+    """
+    failures = {}
+    for collection_name, models in (indexes or INDEXES).items():
+        collection = db[collection_name]
+        for model in models:
+            try:
+                collection.create_indexes([model])
+            except OperationFailure as e:
+                name = model.document['name']
+                failures.setdefault(collection_name, []).append((name, str(e)))
+                print(f" * Index {collection_name}.{name} could not be created: {e}")
+    return failures
+
+
+def index_report(db, indexes=None):
+    """Compare declared indexes with the ones present in the database.
+
+    Returns a dict per collection with 'missing' (declared but absent),
+    'undeclared' (present but not declared) and 'unused' (present with zero
+    recorded accesses since the server last started).
+    """
+    report = {}
+    for collection_name, models in (indexes or INDEXES).items():
+        collection = db[collection_name]
+        existing = {
+            index['name']: _key_of(index['key'])
+            for index in collection.list_indexes()
+            if index['name'] != '_id_'
+        }
+        declared = {
+            model.document['name']: _key_of(model.document['key'])
+            for model in models
+        }
+        existing_keys = set(existing.values())
+        declared_keys = set(declared.values())
+
+        try:
+            unused = sorted(
+                stat['name']
+                for stat in collection.aggregate([{'$indexStats': {}}])
+                if stat['name'] != '_id_' and stat['accesses']['ops'] == 0
+            )
+        except OperationFailure:
+            # $indexStats needs the clusterMonitor role on some deployments
+            unused = None
+
+        report[collection_name] = {
+            'missing': sorted(name for name, key in declared.items() if key not in existing_keys),
+            'undeclared': sorted(name for name, key in existing.items() if key not in declared_keys),
+            'unused': unused,
+        }
+    return report
+
+
+def print_report(report):
+    for collection_name, entry in report.items():
+        unused = entry['unused']
+        print(f"{collection_name}:")
+        print(f"  missing:    {', '.join(entry['missing']) or '-'}")
+        print(f"  undeclared: {', '.join(entry['undeclared']) or '-'}")
+        print(f"  unused:     {'n/a' if unused is None else ', '.join(unused) or '-'}")
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Apply and audit ElevateU MongoDB indexes')
+    parser.add_argument('--apply', action='store_true', help='create missing indexes before reporting')
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGO_URI'), serverSelectionTimeoutMS=5000)
+    database = client[os.getenv('DB_NAME', 'elevateu')]
+
+    if args.apply:
+        failed = ensure_indexes(database)
+        print(f"Indexes applied ({sum(len(v) for v in failed.values())} failed)")
+    print_report(index_report(database))
+    client.close()
@@ -0,0 +1,67 @@
+"""JSON encoding for every Flask response.
+
+FastJSONProvider encodes BSON types directly: ObjectId becomes its hex
+string, and datetimes become ISO 8601 (naive values are UTC, as pymongo
+returns them). Documents can therefore be handed to jsonify() straight
+from MongoDB, without copying them or converting _id first. orjson is
+used when it is installed; otherwise the stdlib encoder with the same
+`default` hook produces the same JSON, only slower.
+"""
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(value):
+    """Types neither encoder handles natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (Decimal, Decimal128)):
+        return str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(JSONProvider):
+    mimetype = 'application/json'
+
+    if orjson is not None:
+        OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=encode_default, option=self.OPTIONS).decode()
+
+        def _bytes(self, obj):
+            return orjson.dumps(obj, default=encode_default, option=self.OPTIONS)
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+    else:
+        def dumps(self, obj, **kwargs):
+            return json.dumps(obj, default=encode_default, ensure_ascii=False, separators=(',', ':'))
+
+        def _bytes(self, obj):
+            return self.dumps(obj).encode()
+
+        def loads(self, s, **kwargs):
+            return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,290 @@
+"""Merge the legacy conversation collections into the conversation store.
+
+Before the unified store every chat turn was written twice: into the
+`messages` array of a `chat_sessions` document and into `agent_memory`.
+This tool moves both into `chat_messages` buckets (see
+conversation_store.py):
+
+1. sessions: each `chat_sessions` document that still has a `messages`
+   array is split into buckets, its header gets the counters and
+   previews, and the array is removed. The legacy messages predate any
+   bucket the live API appended, so they take negative `seq` numbers. A
+   session is rewritten in one pass, so an interrupted run simply picks
+   the remaining sessions up.
+2. agent_memory: rows are scanned in _id order (checkpointed in
+   `migrations`). Rows that duplicate a message already in the user's
+   sessions are skipped; the rest are appended to the user's
+   "agent_<userId>" session, numbered by its message counter like live
+   appends. The row's _id becomes the message id, so re-running a batch
+   never inserts a message twice.
+
+    python migrate_conversations.py --dry-run
+    python migrate_conversations.py --batch-size 200 --max-writes-per-sec 200
+    python migrate_conversations.py --drop-agent-memory   # once nothing remains
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, ReturnDocument, UpdateOne
+
+from conversation_store import BUCKET_SIZE, bucket_push, message_preview
+from migration import BatchMigration
+
+MIGRATION_ID = 'merge_conversations'
+
+
+def _parse_time(value, fallback):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return fallback
+
+
+def _message_id(timestamp, seq):
+    """ObjectId that sorts by the message's own time, then by position"""
+    base = ObjectId.from_datetime(timestamp).binary[:4]
+    return ObjectId(base + os.urandom(5) + seq.to_bytes(3, 'big'))
+
+
+class ConversationMigration(BatchMigration):
+    MIGRATION_ID = MIGRATION_ID
+
+    def __init__(self, db, batch_size=200, max_writes_per_sec=200, dry_run=False,
+                 bucket_size=BUCKET_SIZE):
+        super().__init__(db, batch_size, max_writes_per_sec, dry_run)
+        self.bucket_size = bucket_size
+        self.sessions = db['chat_sessions']
+        self.buckets = db['chat_messages']
+        self.agent_memory = db['agent_memory']
+
+    def _bucket_docs(self, session_id, user_id, messages):
+        """Buckets for messages older than all of the session's buckets: seq -n..-1"""
+        now = datetime.now(timezone.utc)
+        chunks = [messages[i:i + self.bucket_size] for i in range(0, len(messages), self.bucket_size)]
+        return [{
+            'sessionId': session_id,
+            'seq': seq - len(chunks),
+            'userId': user_id,
+            'count': len(chunk),
+            'messages': chunk,
+            'firstId': chunk[0]['id'],
+            'lastId': chunk[-1]['id'],
+            'createdAt': now,
+            'migrated': True
+        } for seq, chunk in enumerate(chunks)]
+
+    def _bucket_pushes(self, session_id, user_id, messages, start):
+        """Upserts appending messages after the session's first `start` ones"""
+        now = datetime.now(timezone.utc)
+        by_seq = {}
+        for position, message in enumerate(messages, start):
+            by_seq.setdefault(position // self.bucket_size, []).append(message)
+        return [
+            bucket_push(session_id, user_id, seq, chunk, now, migrated=True)
+            for seq, chunk in by_seq.items()
+        ]
+
+    # ---------------- phase 1: chat_sessions.messages ----------------
+
+    def _plan_session(self, doc):
+        fallback = doc.get('updatedAt') or doc['_id'].generation_time
+        fallback = _parse_time(fallback, doc['_id'].generation_time)
+        messages = []
+        for seq, message in enumerate(doc.get('messages') or []):
+            timestamp = _parse_time(message.get('timestamp'), fallback)
+            messages.append({'id': _message_id(timestamp, seq), **message})
+
+        header = {'$unset': {'messages': ''}, '$inc': {'messageCount': len(messages)}}
+        if messages:
+            header['$set'] = {'firstMessage': message_preview(messages[0])}
+            if 'lastMessage' not in doc:
+                header['$set']['lastMessage'] = message_preview(messages[-1])
+
+        # Buckets from an interrupted run of this session are replaced
+        bucket_ops = [DeleteMany({'sessionId': doc['sessionId'], 'migrated': True})] + [
+            InsertOne(bucket) for bucket in self._bucket_docs(doc['sessionId'], doc.get('userId'), messages)
+        ]
+        return bucket_ops, UpdateOne({'_id': doc['_id']}, header)
+
+    def migrate_sessions(self):
+        total_writes = 0
+        skip = 0
+        while True:
+            docs = list(self.sessions.find(
+                {'messages': {'$exists': True}},
+                {'sessionId': 1, 'userId': 1, 'messages': 1, 'updatedAt': 1, 'lastMessage': 1}
+            ).sort('_id', 1).skip(skip).limit(self.batch_size))
+            if not docs:
+                break
+
+            started_at = time.monotonic()
+            writes = 0
+            for doc in docs:
+                bucket_ops, header_op = self._plan_session(doc)
+                writes += len(bucket_ops) + 1
+                if not self.dry_run:
+                    self.buckets.bulk_write(bucket_ops, ordered=True)
+                    self.sessions.bulk_write([header_op])
+            if self.dry_run:
+                # Nothing was unset, so page past this batch
+                skip += len(docs)
+            total_writes += writes
+            print(f"chat_sessions: {len(docs)} sessions, {writes} writes")
+            self._throttle(writes, started_at)
+        return total_writes
+
+    # ---------------- phase 2: agent_memory ----------------
+
+    def _known_messages(self, user_id, ids):
+        """(user contents, agent contents, ids already migrated) for one user"""
+        user_contents, agent_contents, migrated = set(), [], set()
+        for bucket in self.buckets.find({'userId': user_id}, {'messages': 1}):
+            for message in bucket.get('messages', []):
+                if message.get('id') in ids:
+                    migrated.add(message['id'])
+                elif message.get('type') == 'agent':
+                    agent_contents.append(message.get('content') or '')
+                else:
+                    user_contents.add(message.get('content') or '')
+        return user_contents, agent_contents, migrated
+
+    def _plan_memory(self, user_id, rows):
+        ids = {row['_id'] for row in rows}
+        user_contents, agent_contents, migrated = self._known_messages(user_id, ids)
+        messages = []
+        for row in rows:
+            content = row.get('content') or ''
+            if row['_id'] in migrated:
+                continue
+            if row.get('role') == 'agent':
+                # The session copy is the final reply, which starts with the
+                # model's reply that agent_memory stored
+                if any(text.startswith(content) for text in agent_contents):
+                    continue
+            elif content in user_contents:
+                continue
+            messages.append({
+                'id': row['_id'],
+                'type': 'agent' if row.get('role') == 'agent' else 'user',
+                'content': content,
+                'timestamp': _parse_time(row.get('timestamp'), row['_id'].generation_time).isoformat()
+            })
+        if not messages:
+            return []
+
+        # The header's counter numbers the messages, as in
+        # ConversationStore.append; a dry run only reads it
+        session_id = f"agent_{user_id}"
+        header_update = {
+            '$set': {'userId': user_id, 'lastMessage': message_preview(messages[-1])},
+            '$max': {'updatedAt': _parse_time(messages[-1]['timestamp'], datetime.now(timezone.utc))},
+            '$inc': {'messageCount': len(messages)},
+            '$setOnInsert': {'createdAt': datetime.now(timezone.utc), 'firstMessage': message_preview(messages[0])}
+        }
+        if self.dry_run:
+            header = self.sessions.find_one({'sessionId': session_id}, {'messageCount': 1})
+        else:
+            header = self.sessions.find_one_and_update(
+                {'sessionId': session_id}, header_update,
+                projection={'messageCount': 1}, upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        start = (header or {}).get('messageCount') or 0
+        return self._bucket_pushes(session_id, user_id, messages, start)
+
+    def migrate_agent_memory(self):
+        checkpoint = self._load_checkpoint('agentMemory')
+        if checkpoint.get('done'):
+            print("agent_memory: already migrated")
+            return 0
+        last_id = checkpoint.get('lastId')
+
+        total_writes = 0
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            rows = list(self.agent_memory.find(query).sort('_id', 1).limit(self.batch_size))
+            if not rows:
+                break
+
+            started_at = time.monotonic()
+            by_user = {}
+            for row in rows:
+                by_user.setdefault(row.get('userId'), []).append(row)
+            writes = 0
+            for user_id, user_rows in by_user.items():
+                bucket_ops = self._plan_memory(user_id, user_rows)
+                if not bucket_ops:
+                    continue
+                writes += len(bucket_ops) + 1
+                if not self.dry_run:
+                    self.buckets.bulk_write(bucket_ops, ordered=True)
+            total_writes += writes
+            last_id = rows[-1]['_id']
+            self._save_checkpoint('agentMemory', last_id)
+            print(f"agent_memory: {len(rows)} scanned, {writes} writes (through {last_id})")
+            self._throttle(writes, started_at)
+
+        self._save_checkpoint('agentMemory', last_id, done=True)
+        return total_writes
+
+    def run(self):
+        writes = self.migrate_sessions()
+        print(f"chat_sessions: done, {writes} writes{' (dry run)' if self.dry_run else ''}")
+        writes = self.migrate_agent_memory()
+        print(f"agent_memory: done, {writes} writes{' (dry run)' if self.dry_run else ''}")
+
+    def remaining(self):
+        checkpoint = self._load_checkpoint('agentMemory')
+        if checkpoint.get('done'):
+            memory_left = 0
+        else:
+            last_id = checkpoint.get('lastId')
+            memory_left = self.agent_memory.count_documents({'_id': {'$gt': last_id}} if last_id else {})
+        return {
+            'chat_sessions': self.sessions.count_documents({'messages': {'$exists': True}}),
+            'agent_memory': memory_left
+        }
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Merge chat_sessions messages and agent_memory into chat_messages')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--max-writes-per-sec', type=float, default=200,
+                        help='upper bound on writes per second (0 disables throttling)')
+    parser.add_argument('--dry-run', action='store_true', help='plan writes without applying them')
+    parser.add_argument('--status', action='store_true', help='only report what is left to migrate')
+    parser.add_argument('--drop-agent-memory', action='store_true',
+                        help='drop agent_memory once everything has been migrated')
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGO_URI'), serverSelectionTimeoutMS=5000)
+    database = client[os.getenv('DB_NAME', 'elevateu')]
+    migration = ConversationMigration(
+        database,
+        batch_size=args.batch_size,
+        max_writes_per_sec=args.max_writes_per_sec,
+        dry_run=args.dry_run
+    )
+
+    if not args.status:
+        migration.run()
+    left = migration.remaining()
+    print(f"Still to migrate: {left}")
+    if args.drop_agent_memory and not args.dry_run:
+        if any(left.values()):
+            print("Not dropping agent_memory: migration incomplete")
+        else:
+            database['agent_memory'].drop()
+            print("agent_memory dropped")
+    client.close()
@@ -0,0 +1,177 @@
+"""Backfill that rewrites every stored `userId` to the canonical user key.
+
+enrollments, progress and study_updates hold `userId` as a mix of Clerk ids and
+stringified Mongo _ids. This tool walks each collection in _id order, maps
+every userId to the canonical key (see identity.canonical_user_key) and
+rewrites it in batches with a bounded write rate. Progress is checkpointed in
+the `migrations` collection after every batch, so an interrupted run resumes
+where it stopped.
+
+Rows that collide with an existing canonical row for the same course are
+merged: duplicate enrollments are dropped, duplicate progress rows are folded
+into the canonical one (union of completed topics, highest progress).
+
+Run with the app in dual-read mode (USER_ID_DUAL_READ=true, the default):
+
+    python migrate_user_ids.py --dry-run
+    python migrate_user_ids.py --batch-size 500 --max-writes-per-sec 200
+
+Once a run reports no remaining rows, set USER_ID_DUAL_READ=false so the API
+queries `userId` with plain equality filters.
+"""
+import argparse
+import os
+import time
+
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+
+from identity import canonical_user_key
+from migration import BatchMigration
+
+MIGRATION_ID = 'normalize_user_ids'
+# collection -> whether rows are unique per (userId, courseId)
+COLLECTIONS = {
+    'enrollments': True,
+    'progress': True,
+    'study_updates': False,
+}
+
+
+class UserIdBackfill(BatchMigration):
+    MIGRATION_ID = MIGRATION_ID
+
+    def _canonical_keys(self, user_ids):
+        """Map each stored userId form to its canonical key (one query per batch)"""
+        object_ids = [ObjectId(u) for u in user_ids if ObjectId.is_valid(u)]
+        users = self.db['users'].find(
+            {'$or': [{'clerkId': {'$in': list(user_ids)}}, {'_id': {'$in': object_ids}}]},
+            {'clerkId': 1}
+        )
+        mapping = {}
+        for user in users:
+            key = canonical_user_key(user)
+            mapping[str(user['_id'])] = key
+            if user.get('clerkId'):
+                mapping[user['clerkId']] = key
+        return mapping
+
+    def _plan_batch(self, collection, docs, mapping, unique_per_course):
+        """Build the write operations that move a batch onto canonical keys"""
+        moves = [
+            (doc, mapping[doc['userId']]) for doc in docs
+            if doc.get('userId') in mapping and mapping[doc['userId']] != doc['userId']
+        ]
+        if not moves:
+            return []
+        if not unique_per_course:
+            return [UpdateOne({'_id': doc['_id']}, {'$set': {'userId': key}}) for doc, key in moves]
+
+        # Existing canonical rows the moved rows would collide with
+        existing = {
+            (row['userId'], row['courseId']): row
+            for row in collection.find({
+                'userId': {'$in': list({key for _, key in moves})},
+                'courseId': {'$in': list({doc.get('courseId') for doc, _ in moves})}
+            })
+        }
+        operations = []
+        for doc, key in moves:
+            target = existing.get((key, doc.get('courseId')))
+            if target is None:
+                operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'userId': key}}))
+                existing[(key, doc.get('courseId'))] = {**doc, 'userId': key}
+                continue
+            if 'completedTopics' in doc:
+                # progress: fold the duplicate into the canonical row
+                operations.append(UpdateOne(
+                    {'_id': target['_id']},
+                    {
+                        '$addToSet': {'completedTopics': {'$each': doc.get('completedTopics') or []}},
+                        '$max': {'progress': doc.get('progress', 0)}
+                    }
+                ))
+            operations.append(DeleteOne({'_id': doc['_id']}))
+        return operations
+
+    def run_collection(self, collection_name, unique_per_course):
+        collection = self.db[collection_name]
+        checkpoint = self._load_checkpoint(f'collections.{collection_name}')
+        if checkpoint.get('done'):
+            print(f"{collection_name}: already migrated")
+            return 0
+        last_id = checkpoint.get('lastId')
+
+        total_writes = 0
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            docs = list(collection.find(
+                query,
+                {'userId': 1, 'courseId': 1, 'completedTopics': 1, 'progress': 1}
+            ).sort('_id', 1).limit(self.batch_size))
+            if not docs:
+                break
+
+            started_at = time.monotonic()
+            user_ids = {doc['userId'] for doc in docs if doc.get('userId')}
+            mapping = self._canonical_keys(user_ids)
+            operations = self._plan_batch(collection, docs, mapping, unique_per_course)
+
+            if operations and not self.dry_run:
+                collection.bulk_write(operations, ordered=True)
+            total_writes += len(operations)
+            last_id = docs[-1]['_id']
+            self._save_checkpoint(f'collections.{collection_name}', last_id)
+            print(f"{collection_name}: {len(docs)} scanned, {len(operations)} writes (through {last_id})")
+            self._throttle(len(operations), started_at)
+
+        self._save_checkpoint(f'collections.{collection_name}', last_id, done=True)
+        return total_writes
+
+    def run(self):
+        for collection_name, unique_per_course in COLLECTIONS.items():
+            writes = self.run_collection(collection_name, unique_per_course)
+            print(f"{collection_name}: done, {writes} writes{' (dry run)' if self.dry_run else ''}")
+
+    def remaining(self):
+        """Count rows whose userId is a known user but not its canonical key"""
+        counts = {}
+        for collection_name in COLLECTIONS:
+            collection = self.db[collection_name]
+            user_ids = collection.distinct('userId')
+            mapping = self._canonical_keys([u for u in user_ids if u])
+            legacy = [u for u, key in mapping.items() if u != key]
+            counts[collection_name] = collection.count_documents({'userId': {'$in': legacy}})
+        return counts
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Normalize userId to the canonical user key')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-writes-per-sec', type=float, default=200,
+                        help='upper bound on writes per second (0 disables throttling)')
+    parser.add_argument('--dry-run', action='store_true', help='plan writes without applying them')
+    parser.add_argument('--status', action='store_true', help='only report rows still to migrate')
+    parser.add_argument('--restart', action='store_true', help='discard checkpoints and scan from the start')
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGO_URI'), serverSelectionTimeoutMS=5000)
+    database = client[os.getenv('DB_NAME', 'elevateu')]
+    backfill = UserIdBackfill(
+        database,
+        batch_size=args.batch_size,
+        max_writes_per_sec=args.max_writes_per_sec,
+        dry_run=args.dry_run
+    )
+
+    if args.restart and not args.dry_run:
+        database['migrations'].delete_one({'_id': MIGRATION_ID})
+    if not args.status:
+        backfill.run()
+    print(f"Rows still on legacy ids: {backfill.remaining()}")
+    client.close()
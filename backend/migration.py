@@ -0,0 +1,49 @@
+"""Base class for the resumable batch migrations (migrate_*.py).
+
+A migration scans a collection in _id order, applies each batch with a
+bounded write rate and checkpoints the last _id it finished in the
+`migrations` collection, under its own MIGRATION_ID document, so an
+interrupted run resumes where it stopped. dry_run plans writes without
+applying them or moving checkpoints.
+"""
+import time
+from datetime import datetime, timezone
+
+
+class BatchMigration:
+    MIGRATION_ID = None
+
+    def __init__(self, db, batch_size=500, max_writes_per_sec=200, dry_run=False):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_writes_per_sec = max_writes_per_sec
+        self.dry_run = dry_run
+        self.checkpoints = db['migrations']
+
+    def _load_checkpoint(self, key):
+        """{'lastId', 'done'} saved under `key` (a dotted path), or {}"""
+        state = self.checkpoints.find_one({'_id': self.MIGRATION_ID}) or {}
+        for part in key.split('.'):
+            state = state.get(part) or {}
+        return state
+
+    def _save_checkpoint(self, key, last_id, done=False):
+        if self.dry_run:
+            return
+        self.checkpoints.update_one(
+            {'_id': self.MIGRATION_ID},
+            {'$set': {
+                key: {'lastId': last_id, 'done': done},
+                'updatedAt': datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+
+    def _throttle(self, writes, started_at):
+        """Sleep long enough to keep the write rate under max_writes_per_sec"""
+        if not self.max_writes_per_sec or not writes:
+            return
+        min_duration = writes / self.max_writes_per_sec
+        elapsed = time.monotonic() - started_at
+        if elapsed < min_duration:
+            time.sleep(min_duration - elapsed)
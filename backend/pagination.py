@@ -0,0 +1,124 @@
+"""Cursor pagination helpers shared by the list endpoints.
+
+List endpoints keep returning a plain JSON array. The cursor for the next
+page travels in the `X-Next-Cursor` response header and comes back as the
+`after` query parameter; `X-Total-Count` carries the total when it is known.
+Cursors are opaque base64url tokens wrapping the last row's sort value and
+_id, so pages stay stable while rows are inserted.
+
+`fields` is a comma-separated list of the fields to return (_id is always
+included). parse_fields() turns it into a MongoDB projection, so fields
+nobody asked for are neither read nor serialized. Embedded documents are
+selected whole (`course`) or by subfield (`course.title`).
+"""
+import base64
+
+from bson import ObjectId, json_util
+from flask import jsonify
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Clamp the `limit` query parameter to [1, maximum]"""
+    try:
+        limit = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(values):
+    raw = json_util.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, required=('id',)):
+    """Decode an `after` token; raises ValueError if it is malformed.
+
+    `required` are the keys the endpoint's cursors always carry (`id`,
+    plus `v` when the sort is on another field). `id` must be an ObjectId
+    or a string, as paginate() and the catalog listing write it.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json_util.loads(raw)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, dict) or any(key not in values for key in required):
+        raise ValueError("Invalid cursor")
+    if 'id' in values and not isinstance(values['id'], (ObjectId, str)):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def after_filter(field, direction, value, last_id):
+    """Match rows that sort strictly after (value, last_id) on (field, _id)"""
+    op = '$gt' if direction > 0 else '$lt'
+    return {'$or': [
+        {field: {op: value}},
+        {field: value, '_id': {op: last_id}}
+    ]}
+
+
+def paginate(rows, limit, sort_field=None):
+    """Split a limit+1 fetch into (page, next cursor or None)"""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    cursor = {'id': last['_id']}
+    if sort_field:
+        cursor['v'] = last.get(sort_field)
+    return page, encode_cursor(cursor)
+
+
+def paginated_response(items, next_cursor, total=None):
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    return response
+
+
+def parse_fields(value, allowed):
+    """Projection for the `fields` query parameter, or None for all fields.
+
+    Raises ValueError naming any field not in `allowed`.
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return {'_id': 1, **{field: 1 for field in fields}}
+
+
+def embedded_fields(projection, name):
+    """(wanted, projection) for the embedded document `name`.
+
+    wanted is False when the client did not ask for it; the projection is
+    None when the whole document is wanted.
+    """
+    if projection is None or name in projection:
+        return True, None
+    prefix = f"{name}."
+    sub = {field[len(prefix):]: 1 for field in projection if field.startswith(prefix)}
+    if not sub:
+        return False, None
+    return True, {'_id': 1, **sub}
+
+
+def top_level(projection, embedded=()):
+    """The projection without the embedded documents (which are joined separately)"""
+    if projection is None:
+        return None
+    return {
+        field: 1 for field in projection
+        if field not in embedded and not any(field.startswith(f"{name}.") for name in embedded)
+    }
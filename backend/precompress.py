@@ -0,0 +1,70 @@
+"""Write .gz and .br copies of the built frontend for static_files.py.
+
+Run once at image build time, after the Vite bundle is copied in:
+
+    python precompress.py static
+
+Text assets larger than MIN_SIZE get a gzip (level 9) and, when the
+`brotli` package is installed, a brotli (quality 11) sibling. A variant
+is kept only if it is smaller than the original. Timestamps are copied,
+so a variant never looks older than its source.
+"""
+import argparse
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.html', '.js', '.mjs', '.css', '.svg', '.json', '.map', '.txt', '.xml', '.ico', '.wasm')
+MIN_SIZE = 1024
+
+
+def _write_variant(path, suffix, data, stat):
+    target = path + suffix
+    with open(target, 'wb') as f:
+        f.write(data)
+    os.utime(target, (stat.st_atime, stat.st_mtime))
+    return len(data)
+
+
+def precompress(root, min_size=MIN_SIZE):
+    """Compress every eligible file under `root`; returns (files, bytes in, bytes out)"""
+    files = original = compressed = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            sizes = []
+            gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gzipped) < len(data):
+                sizes.append(_write_variant(path, '.gz', gzipped, stat))
+            if brotli is not None:
+                squeezed = brotli.compress(data, quality=11)
+                if len(squeezed) < len(data):
+                    sizes.append(_write_variant(path, '.br', squeezed, stat))
+            if sizes:
+                files += 1
+                original += len(data)
+                compressed += min(sizes)
+    return files, original, compressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompress static frontend assets')
+    parser.add_argument('root', nargs='?', default=os.path.join(os.path.dirname(__file__), 'static'))
+    parser.add_argument('--min-size', type=int, default=MIN_SIZE)
+    args = parser.parse_args()
+
+    files, original, compressed = precompress(args.root, args.min_size)
+    print(f"Precompressed {files} files: {original} -> {compressed} bytes"
+          f"{'' if brotli is not None else ' (gzip only; brotli not installed)'}")
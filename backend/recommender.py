@@ -0,0 +1,235 @@
+"""Item-item collaborative filtering for course recommendations.
+
+refresh() reads `enrollments` and `progress` once and builds two sparse
+user x course matrices, one of enrollments and one of completions
+(progress >= COMPLETED). Their column-normalized products give cosine
+course-course similarities. The blend is pruned to the top NEIGHBORS
+per course and kept in memory as a CSR matrix, together with a
+popularity ranking.
+
+recommend() scores the courses a user is enrolled in against that
+matrix. It needs no database access and answers in well under a
+millisecond for catalogs of a few thousand courses. Users without
+enrollments, or without enough similar courses, are filled from the
+popularity ranking (cold start).
+
+The model is rebuilt in a background thread on a timer, and sooner once
+enough writes have been recorded. Enrollments also update the popularity
+counts immediately. Without numpy/scipy only the popularity ranking is
+served. They are imported by the first build (on the refresh thread),
+not when the module is imported, to keep them off the startup path.
+"""
+import threading
+import time
+from collections import Counter
+
+from background import guarded, start_background, start_periodic
+
+# numpy / scipy.sparse, set by load_numeric()
+np = None
+sp = None
+
+COMPLETED = 100
+NEIGHBORS = 50
+# Weight of co-completion relative to co-enrollment similarity
+COMPLETION_WEIGHT = 0.5
+
+
+def load_numeric():
+    """Import numpy and scipy.sparse on first use; False if unavailable"""
+    global np, sp
+    if np is None:
+        try:
+            import numpy
+            import scipy.sparse
+        except ImportError:
+            return False
+        np, sp = numpy, scipy.sparse
+    return True
+
+
+class RecommendationModel:
+    """Immutable snapshot served by CourseRecommender"""
+
+    __slots__ = ('course_ids', 'index', 'similarity', 'popular', 'counts', 'built_at', 'build_ms')
+
+    def __init__(self, course_ids, similarity, popular, counts, build_ms):
+        self.course_ids = course_ids
+        self.index = {course_id: i for i, course_id in enumerate(course_ids)}
+        self.similarity = similarity
+        self.popular = popular
+        self.counts = counts
+        self.built_at = time.time()
+        self.build_ms = build_ms
+
+
+def _cosine(matrix):
+    """Course x course cosine similarity of a users x courses matrix"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = matrix @ sp.diags(1.0 / norms)
+    return (normalized.T @ normalized).tocsr()
+
+
+def _prune(similarity, neighbors):
+    """Keep the `neighbors` strongest off-diagonal entries of each row"""
+    similarity = similarity.tolil()
+    similarity.setdiag(0)
+    similarity = similarity.tocsr()
+    similarity.eliminate_zeros()
+    rows, cols, values = [], [], []
+    for i in range(similarity.shape[0]):
+        start, end = similarity.indptr[i], similarity.indptr[i + 1]
+        row_values = similarity.data[start:end]
+        row_cols = similarity.indices[start:end]
+        if len(row_values) > neighbors:
+            keep = np.argpartition(row_values, -neighbors)[-neighbors:]
+            row_values, row_cols = row_values[keep], row_cols[keep]
+        rows.extend([i] * len(row_values))
+        cols.extend(row_cols)
+        values.extend(row_values)
+    return sp.csr_matrix((values, (rows, cols)), shape=similarity.shape)
+
+
+class CourseRecommender:
+    def __init__(self, db, neighbors=NEIGHBORS, completion_weight=COMPLETION_WEIGHT,
+                 refresh_after=500):
+        self.db = db
+        self.neighbors = neighbors
+        self.completion_weight = completion_weight
+        self.refresh_after = refresh_after
+        self.model = None
+        self._events = 0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._popularity_delta = Counter()
+
+    def refresh(self):
+        """Rebuild the model from enrollments and progress"""
+        if not self._refreshing.acquire(blocking=False):
+            return self.model
+        try:
+            started = time.perf_counter()
+            with self._lock:
+                self._events = 0
+                self._popularity_delta = Counter()
+
+            course_ids = [str(c['_id']) for c in self.db['courses'].find({}, {'_id': 1})]
+            index = {course_id: i for i, course_id in enumerate(course_ids)}
+            users = {}
+            enrolled = []
+            for row in self.db['enrollments'].find({}, {'userId': 1, 'courseId': 1, '_id': 0}):
+                if row.get('courseId') in index:
+                    user = users.setdefault(row.get('userId'), len(users))
+                    enrolled.append((user, index[row['courseId']]))
+            completed = []
+            for row in self.db['progress'].find(
+                {'progress': {'$gte': COMPLETED}},
+                {'userId': 1, 'courseId': 1, '_id': 0}
+            ):
+                if row.get('courseId') in index:
+                    user = users.setdefault(row.get('userId'), len(users))
+                    completed.append((user, index[row['courseId']]))
+
+            counts = Counter(course_ids[course] for _, course in enrolled)
+            counts.update(course_ids[course] for _, course in completed)
+            popular = [course_id for course_id, _ in counts.most_common()]
+            popular += [course_id for course_id in course_ids if course_id not in counts]
+
+            similarity = None
+            if course_ids and users and load_numeric():
+                shape = (len(users), len(course_ids))
+                similarity = _cosine(self._matrix(enrolled, shape))
+                if completed:
+                    similarity = similarity + self.completion_weight * _cosine(self._matrix(completed, shape))
+                similarity = _prune(similarity, self.neighbors)
+
+            build_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.model = RecommendationModel(course_ids, similarity, popular, dict(counts), build_ms)
+            print(f" * Recommender built: {len(course_ids)} courses, {len(users)} users, {build_ms} ms")
+            return self.model
+        finally:
+            self._refreshing.release()
+
+    def _matrix(self, pairs, shape):
+        pairs = list(set(pairs))
+        rows = [user for user, _ in pairs]
+        cols = [course for _, course in pairs]
+        return sp.csr_matrix((np.ones(len(pairs)), (rows, cols)), shape=shape)
+
+    def recommend(self, enrolled, k=5):
+        """Top `k` (courseId, score, reason) for a user.
+
+        `enrolled` maps the user's enrolled course ids to their progress
+        (0-100); completed courses count double as evidence. reason is
+        'similar' for collaborative scores and 'popular' for the fallback.
+        """
+        model = self.model or self.refresh()
+        if model is None:
+            return []
+        exclude = set(enrolled)
+        results = []
+
+        items = [(model.index[c], 1.0 + (1.0 if (p or 0) >= COMPLETED else 0.0))
+                 for c, p in enrolled.items() if c in model.index]
+        if model.similarity is not None and items:
+            rows = np.fromiter((i for i, _ in items), dtype=np.int64)
+            weights = np.fromiter((w for _, w in items), dtype=float)
+            scores = np.asarray(model.similarity[rows].T @ weights).ravel()
+            scores[rows] = 0
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+            for i in candidates[np.argsort(-scores[candidates], kind='stable')]:
+                results.append((model.course_ids[i], round(float(scores[i]), 4), 'similar'))
+
+        if len(results) < k:
+            chosen = exclude | {course_id for course_id, _, _ in results}
+            with self._lock:
+                delta = dict(self._popularity_delta)
+            popular = model.popular
+            if delta:
+                # Enrollments since the last build reorder the head of the
+                # fallback; only courses that can reach the top k are re-ranked
+                head = popular[:k + len(chosen)]
+                head += [c for c in delta if c in model.index and c not in head]
+                popular = sorted(
+                    head, key=lambda c: -(model.counts.get(c, 0) + delta.get(c, 0))
+                ) + popular[k + len(chosen):]
+            for course_id in popular:
+                if len(results) >= k:
+                    break
+                if course_id not in chosen:
+                    results.append((course_id, 0.0, 'popular'))
+        return results
+
+    def record_event(self, course_id=None, enrollment=False):
+        """Count a write; enough of them trigger a background rebuild"""
+        with self._lock:
+            self._events += 1
+            if enrollment and course_id:
+                self._popularity_delta[course_id] += 1
+            due = self._events >= self.refresh_after
+        if due:
+            self.refresh_async()
+
+    def refresh_async(self):
+        start_background(guarded(self.refresh, 'Recommender refresh'), 'recommender-refresh')
+
+    def start_refresh_thread(self, interval_seconds):
+        """Build now, then rebuild every `interval_seconds` in a daemon thread"""
+        return start_periodic(
+            guarded(self.refresh, 'Recommender refresh'), interval_seconds, 'recommender-refresh'
+        )
+
+    def stats(self):
+        model = self.model
+        return {
+            'built': model is not None,
+            'courses': len(model.course_ids) if model else 0,
+            'similarities': int(model.similarity.nnz) if model and model.similarity is not None else 0,
+            'buildMs': model.build_ms if model else None,
+            'builtAt': model.built_at if model else None,
+            'pendingEvents': self._events,
+            'collaborative': load_numeric()
+        }
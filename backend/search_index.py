@@ -0,0 +1,191 @@
+"""In-process full-text index over the course catalog.
+
+Courses are tokenized from title, description, instructor and topics into
+an inverted index (term -> {courseId: weighted term frequency}) and
+ranked with BM25. Fields are weighted by multiplying their term counts,
+so a title hit counts more than a description hit. The last query word
+is also matched as a prefix against a sorted term list, which is what
+typeahead needs.
+
+The index also keeps a small summary of each course, so search results
+are served without touching MongoDB. It is built from the catalog
+snapshot and remembers the catalog version it was built from; sync()
+rebuilds it when that version moves, so a write handled by any worker
+reaches every worker's index within the catalog's `check_interval`.
+"""
+import bisect
+import math
+import threading
+import time
+
+from tokenizer import STOPWORDS, tokenize
+
+FIELD_WEIGHTS = {'title': 3.0, 'topics': 2.0, 'instructor': 2.0, 'description': 1.0}
+SUMMARY_FIELDS = ('title', 'description', 'instructor', 'duration', 'difficulty')
+# Fields taken from catalog records: only what is indexed or summarized
+INDEX_FIELDS = {field: 1 for field in ('_id', *FIELD_WEIGHTS, *SUMMARY_FIELDS)}
+
+K1 = 1.2
+B = 0.75
+MAX_PREFIX_EXPANSIONS = 50
+# Prefix expansions score slightly below exact matches
+PREFIX_DISCOUNT = 0.8
+
+
+def _field_text(course, field):
+    value = course.get(field)
+    if field == 'topics' and isinstance(value, list):
+        return ' '.join(t.get('title', '') if isinstance(t, dict) else str(t) for t in value)
+    return value if isinstance(value, str) else ''
+
+
+def course_summary(course):
+    topics = course.get('topics')
+    return {
+        '_id': str(course['_id']),
+        **{field: course.get(field) for field in SUMMARY_FIELDS if field in course},
+        'topicCount': len(topics) if isinstance(topics, list) else 0
+    }
+
+
+class CourseSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._postings = {}
+        self._terms = []          # sorted, for prefix lookups
+        self._doc_terms = {}      # courseId -> {term: weighted tf}
+        self._doc_length = {}
+        self._total_length = 0.0
+        self._summaries = {}
+        self._title_order = None  # memoized listing for empty queries
+        self.built_at = None
+        self.version = None       # catalog version the index was built from
+
+    def _add(self, course):
+        course_id = str(course['_id'])
+        self._remove(course_id)
+        self._title_order = None
+        frequencies = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(_field_text(course, field), STOPWORDS):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+        for term, tf in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[course_id] = tf
+        length = sum(frequencies.values())
+        self._doc_terms[course_id] = frequencies
+        self._doc_length[course_id] = length
+        self._total_length += length
+        self._summaries[course_id] = course_summary(course)
+
+    def _remove(self, course_id):
+        frequencies = self._doc_terms.pop(course_id, None)
+        if frequencies is None:
+            return
+        self._title_order = None
+        for term in frequencies:
+            postings = self._postings[term]
+            postings.pop(course_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+        self._total_length -= self._doc_length.pop(course_id)
+        self._summaries.pop(course_id, None)
+
+    def rebuild(self, courses, version=None):
+        """Replace the whole index from an iterable of course documents"""
+        fresh = CourseSearchIndex()
+        for course in courses:
+            fresh._add(course)
+        with self._lock:
+            self._postings = fresh._postings
+            self._terms = fresh._terms
+            self._doc_terms = fresh._doc_terms
+            self._doc_length = fresh._doc_length
+            self._total_length = fresh._total_length
+            self._summaries = fresh._summaries
+            self._title_order = None
+            self.built_at = time.time()
+            self.version = version
+
+    def sync(self, snapshot):
+        """Rebuild from a catalog snapshot whose version differs from the index's.
+
+        One thread rebuilds; the others keep searching the previous index
+        (they only wait when there is none yet).
+        """
+        if snapshot.version == self.version and self.built_at is not None:
+            return
+        if not self._build_lock.acquire(blocking=self.built_at is None):
+            return
+        try:
+            if snapshot.version != self.version or self.built_at is None:
+                self.rebuild(
+                    (snapshot.records[cid].to_dict(INDEX_FIELDS) for cid in snapshot.order),
+                    snapshot.version
+                )
+        finally:
+            self._build_lock.release()
+
+    def _expand_prefix(self, prefix):
+        start = bisect.bisect_left(self._terms, prefix)
+        expansions = []
+        for term in self._terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            expansions.append(term)
+        return expansions
+
+    def search(self, query, limit=20, offset=0):
+        """(summaries with `score`, total matches) for one page of results.
+
+        An empty query lists the catalog by title.
+        """
+        tokens = tokenize(query, STOPWORDS)
+        with self._lock:
+            if not tokens:
+                if self._title_order is None:
+                    self._title_order = sorted(
+                        self._summaries, key=lambda cid: ((self._summaries[cid].get('title') or '').lower(), cid)
+                    )
+                ranked = self._title_order
+                page = [{**self._summaries[cid], 'score': None} for cid in ranked[offset:offset + limit]]
+                return page, len(ranked)
+
+            doc_count = len(self._doc_terms)
+            avg_length = self._total_length / doc_count if doc_count else 0
+            # (term, query weight): exact terms, plus prefix expansions of the last word
+            query_terms = {token: 1.0 for token in tokens}
+            for term in self._expand_prefix(tokens[-1]):
+                query_terms.setdefault(term, PREFIX_DISCOUNT)
+
+            scores = {}
+            for term, query_weight in query_terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for course_id, tf in postings.items():
+                    norm = K1 * (1 - B + B * self._doc_length[course_id] / avg_length) if avg_length else K1
+                    scores[course_id] = scores.get(course_id, 0.0) + query_weight * idf * tf * (K1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            page = [
+                {**self._summaries[course_id], 'score': round(score, 4)}
+                for course_id, score in ranked[offset:offset + limit]
+            ]
+            return page, len(ranked)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'courses': len(self._doc_terms),
+                'terms': len(self._terms),
+                'builtAt': self.built_at,
+                'catalogVersion': self.version
+            }
+
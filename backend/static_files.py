@@ -0,0 +1,119 @@
+"""Static serving for the built React frontend.
+
+The static folder is walked once at startup. Each file becomes a
+StaticAsset holding its mimetype, size, mtime, ETag and any precompressed
+siblings (`.br`/`.gz`, written by precompress.py when the image is
+built). Requests are answered from that table with no filesystem checks:
+
+- the smallest variant the client accepts is sent, with
+  `Content-Encoding` and `Vary: Accept-Encoding`
+- content-hashed assets (Vite writes them to assets/) are cached for a
+  year as `immutable`. Everything else, index.html included, is cached
+  with `no-cache`, so browsers revalidate it and get a 304 while it is
+  unchanged
+- unknown paths fall back to index.html for client-side routing, except
+  under assets/, where a missing hashed file is a 404 rather than HTML
+"""
+import mimetypes
+import os
+import re
+
+from flask import send_file
+
+# Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Vite names bundles like index-B3xk9_aZ.js
+HASHED_NAME = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+ASSETS_DIR = 'assets/'
+INDEX_FILE = 'index.html'
+
+
+class StaticAsset:
+    __slots__ = ('path', 'mimetype', 'size', 'mtime', 'etag', 'immutable', 'variants')
+
+    def __init__(self, path, relative):
+        stat = os.stat(path)
+        self.path = path
+        self.mimetype = mimetypes.guess_type(relative)[0] or 'application/octet-stream'
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f"{int(stat.st_mtime)}-{stat.st_size}"
+        self.immutable = relative.startswith(ASSETS_DIR) and bool(HASHED_NAME.search(relative))
+        # encoding -> (path, size) of precompressed copies that are current
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            try:
+                variant = os.stat(path + suffix)
+            except OSError:
+                continue
+            if variant.st_mtime >= stat.st_mtime and variant.st_size < stat.st_size:
+                self.variants[encoding] = (path + suffix, variant.st_size)
+
+
+class StaticSite:
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.index()
+
+    def index(self):
+        """(Re)build the path -> StaticAsset table from disk"""
+        compressed = tuple(suffix for _, suffix in ENCODINGS)
+        assets = {}
+        if os.path.isdir(self.root):
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith(compressed):
+                        continue
+                    path = os.path.join(directory, name)
+                    relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    assets[relative] = StaticAsset(path, relative)
+        self.assets = assets
+        variants = sum(len(asset.variants) for asset in assets.values())
+        print(f" * Static files indexed: {len(assets)} files, {variants} precompressed variants")
+        return assets
+
+    def lookup(self, path):
+        """The asset for a request path, index.html for client routes, else None"""
+        asset = self.assets.get(path) if path else None
+        if asset is None and not path.startswith(ASSETS_DIR):
+            asset = self.assets.get(INDEX_FILE)
+        return asset
+
+    def serve(self, asset, request):
+        encoding = None
+        path = asset.path
+        for candidate, _ in ENCODINGS:
+            if candidate in asset.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                path = asset.variants[candidate][0]
+                break
+
+        response = send_file(
+            path,
+            mimetype=asset.mimetype,
+            etag=f"{asset.etag}-{encoding}" if encoding else asset.etag,
+            last_modified=asset.mtime,
+            conditional=True
+        )
+        if encoding and response.status_code != 304:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        if asset.immutable:
+            response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def stats(self):
+        return {
+            'files': len(self.assets),
+            'bytes': sum(asset.size for asset in self.assets.values()),
+            'immutable': sum(1 for asset in self.assets.values() if asset.immutable),
+            'precompressed': {
+                encoding: sum(1 for asset in self.assets.values() if encoding in asset.variants)
+                for encoding, _ in ENCODINGS
+            }
+        }
@@ -0,0 +1,109 @@
+"""Materialized platform statistics for the admin dashboard.
+
+A single `platform_stats` document holds the counters behind
+/api/admin/stats. Write paths keep it current with $inc deltas, and
+reconcile() recomputes it from the source collections with aggregations.
+Reconcile runs on first read, after bulk deletes, on a timer inside each
+worker and from the command line (`python stats.py`), which corrects any
+drift from concurrent deltas.
+"""
+import os
+from datetime import datetime, timezone
+
+from background import guarded, start_periodic
+
+STATS_ID = 'platform'
+
+
+class PlatformStats:
+    def __init__(self, db):
+        self.db = db
+        self.collection = db['platform_stats']
+
+    def get(self):
+        """Single point read; falls back to a reconcile if the doc is missing"""
+        doc = self.collection.find_one({'_id': STATS_ID})
+        return doc or self.reconcile()
+
+    def summary(self):
+        doc = self.get()
+        count = doc.get('progressCount', 0)
+        avg_completion = doc.get('progressSum', 0) / count if count else 0
+        return {
+            'totalCourses': doc.get('totalCourses', 0),
+            'activeStudents': doc.get('activeStudents', 0),
+            'totalEnrollments': doc.get('totalEnrollments', 0),
+            'avgCompletion': round(avg_completion, 0)
+        }
+
+    def _inc(self, **deltas):
+        # No upsert: a partial document would be served as truth, so when the
+        # doc is missing the next get() rebuilds it through reconcile()
+        self.collection.update_one(
+            {'_id': STATS_ID},
+            {'$inc': deltas, '$set': {'updatedAt': datetime.now(timezone.utc)}}
+        )
+
+    def course_added(self):
+        self._inc(totalCourses=1)
+
+    def enrollment_added(self, new_student=False):
+        self._inc(totalEnrollments=1, activeStudents=1 if new_student else 0)
+
+    def progress_added(self, progress=0):
+        self._inc(progressCount=1, progressSum=progress or 0)
+
+    def progress_changed(self, old_progress, new_progress):
+        delta = (new_progress or 0) - (old_progress or 0)
+        if delta:
+            self._inc(progressSum=delta)
+
+    def progress_batch(self, added=0, progress_delta=0):
+        """One $inc for a batch: `added` new rows and the net progress change"""
+        if added or progress_delta:
+            self._inc(progressCount=added, progressSum=progress_delta)
+
+    def reconcile(self):
+        """Recompute every counter from the source collections"""
+        active = list(self.db['enrollments'].aggregate([
+            {'$group': {'_id': '$userId'}},
+            {'$count': 'count'}
+        ]))
+        progress = list(self.db['progress'].aggregate([
+            {'$group': {
+                '_id': None,
+                'sum': {'$sum': {'$ifNull': ['$progress', 0]}},
+                'count': {'$sum': 1}
+            }}
+        ]))
+        doc = {
+            '_id': STATS_ID,
+            'totalCourses': self.db['courses'].count_documents({}),
+            'totalEnrollments': self.db['enrollments'].count_documents({}),
+            'activeStudents': active[0]['count'] if active else 0,
+            'progressSum': progress[0]['sum'] if progress else 0,
+            'progressCount': progress[0]['count'] if progress else 0,
+            'reconciledAt': datetime.now(timezone.utc),
+            'updatedAt': datetime.now(timezone.utc)
+        }
+        self.collection.replace_one({'_id': STATS_ID}, doc, upsert=True)
+        return doc
+
+    def start_reconcile_thread(self, interval_seconds):
+        """Reconcile every `interval_seconds` in a daemon thread"""
+        return start_periodic(
+            guarded(self.reconcile, 'Stats reconcile'), interval_seconds, 'stats-reconcile',
+            run_now=False
+        )
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI'), serverSelectionTimeoutMS=5000)
+    stats = PlatformStats(client[os.getenv('DB_NAME', 'elevateu')])
+    stats.reconcile()
+    print(stats.summary())
+    client.close()
@@ -0,0 +1,20 @@
+"""Word tokenizer shared by course search, topic retrieval and prompt
+trimming.
+
+Tokens are lower-cased runs of letters and digits, keeping `+` and `#`
+so course names like C++ and C# stay searchable. Callers pass the
+stopwords they want dropped: search drops only glue words (STOPWORDS),
+retrieval also drops question words ("how", "what", "my") that say
+nothing about the topic, and prompt trimming keeps every word.
+"""
+import re
+
+STOPWORDS = frozenset('a an and are as at be by for from in into is it of on or the to with'.split())
+QUESTION_STOPWORDS = STOPWORDS | frozenset(
+    'can do how i me my this what when where which who why you your'.split()
+)
+_TOKEN = re.compile(r"[a-z0-9+#]+")
+
+
+def tokenize(text, stopwords=()):
+    return [t for t in _TOKEN.findall(str(text or '').lower()) if t not in stopwords]
@@ -0,0 +1,184 @@
+"""Write-behind queue for chat persistence.
+
+Chat turns enqueue their Mongo writes (InsertOne/UpdateOne operations)
+instead of running them in the request. A daemon thread drains the queue
+and applies each batch with one ordered bulk_write per collection, so
+writes to the same collection keep their order. An operation can also be
+deferred: a callable that takes the database and returns the operation,
+run on the writer thread just before its batch is written (for writes
+that depend on a value allocated in MongoDB, like a counter).
+
+The queue is bounded: when it is full, enqueue() waits up to
+`put_timeout` seconds and then performs the write synchronously, which
+slows producers down instead of dropping data. An operation the server
+rejects (duplicate key, validation) is dropped on its own, counted in
+`rejected`, and the rest of the batch is written at once. A batch that
+fails as a whole (network error, failover) is retried from its first
+unapplied operation, up to `retries` times with exponential backoff;
+only then are the remaining writes dropped (counted in `failed`).
+close() (registered with atexit by the app) flushes what is left. Read-your-writes is the caller's job: keep the documents until
+their `on_done` callback fires, which happens once they are written or
+dropped (see conversation_store.ConversationStore), or call flush()
+before reading.
+"""
+import queue
+import threading
+import time
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+class WriteBehindQueue:
+    def __init__(self, db, maxsize=10000, batch_size=500, flush_interval=0.05, put_timeout=1.0,
+                 retries=3, retry_backoff=0.2):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.sync_writes = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+        return self
+
+    def enqueue(self, collection, operation, on_done=None):
+        """Queue one pymongo write operation for `collection`"""
+        item = (collection, operation, on_done)
+        if self._thread is None or self._stop.is_set():
+            self._apply([item])
+            return
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the caller pays for the write itself
+            with self._idle:
+                self._pending -= 1
+            self.sync_writes += 1
+            self._apply([item])
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(batch)
+            with self._idle:
+                self._pending -= len(batch)
+                if self._pending == 0:
+                    self._idle.notify_all()
+
+    def _apply(self, batch):
+        by_collection = {}
+        for collection, operation, on_done in batch:
+            by_collection.setdefault(collection, []).append((operation, on_done))
+
+        for collection, items in by_collection.items():
+            self._write(collection, items)
+        self.batches += 1
+
+    def _resolve(self, items):
+        """Build deferred operations in place, so a retry doesn't rebuild them"""
+        for i, (operation, on_done) in enumerate(items):
+            if callable(operation):
+                items[i] = (operation(self.db), on_done)
+
+    def _write(self, collection, items):
+        """Apply one collection's operations in order, retrying what failed"""
+        delay = self.retry_backoff
+        attempt = 0
+        while items:
+            try:
+                self._resolve(items)
+                self.db[collection].bulk_write([operation for operation, _ in items], ordered=True)
+                applied, rejected, error = len(items), None, None
+            except BulkWriteError as e:
+                # Ordered: every operation before the first error was applied
+                # and the server rejected that one; nothing to retry
+                write_errors = e.details.get('writeErrors') or []
+                applied = write_errors[0]['index'] if write_errors else len(items)
+                rejected = write_errors[0] if write_errors else None
+                error = e
+            except PyMongoError as e:
+                applied, rejected, error = 0, None, e
+            self.written += applied
+            self._done(items[:applied])
+            items = items[applied:]
+            if rejected is not None:
+                self.rejected += 1
+                print(f" * Write-behind dropped a rejected write to {collection}: {rejected.get('errmsg')}")
+                self._done(items[:1])
+                items = items[1:]
+            elif items:
+                if attempt == self.retries:
+                    break
+                attempt += 1
+                self.retried += len(items)
+                print(f" * Write-behind batch to {collection} failed, retrying in {delay:.1f}s: {error}")
+                time.sleep(delay)
+                delay *= 2
+        if not items:
+            return
+
+        self.failed += len(items)
+        print(f" * Write-behind dropped {len(items)} writes to {collection} "
+              f"after {self.retries} retries: {error}")
+        self._done(items)
+
+    @staticmethod
+    def _done(items):
+        for _, on_done in items:
+            if on_done is not None:
+                on_done()
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is written (or timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush and stop the worker; later writes run synchronously"""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'retried': self.retried,
+            'syncWrites': self.sync_writes
+        }
@@ -78,25 +78,23 @@ const ChatBot = () => {
     setInputMessage("");
     setIsLoading(true);
 
-    try {
-      const response = await fetch(`${CHATBOT_API_URL}/api/chatbot/message`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          message: inputMessage,
-          userId,
-          userName: user?.firstName,
-          userEmail: user?.primaryEmailAddress?.emailAddress,
-          sessionId: `session_${Date.now()}`,
-        }),
-      });
-
-      const data = await response.json();
+    const payload = {
+      message: inputMessage,
+      userId,
+      userName: user?.firstName,
+      userEmail: user?.primaryEmailAddress?.emailAddress,
+      sessionId: `session_${Date.now()}`,
+    };
+    const botMsgId = `bot_${Date.now()}`;
+    let streamStarted = false;
 
+    // Replace the streaming placeholder with the final reply
+    const finishBotMsg = (data) => {
       // ✔ Extract only the reply (NO JSON SHOWN TO USER)
       const cleanedReply = cleanAgentResponse(data.reply);
 
       const newBotMsg = {
+        id: botMsgId,
         type: "bot",
         content: cleanedReply || "I'm here to help!",
         action: data.action,
@@ -105,20 +103,98 @@ const ChatBot = () => {
         timestamp: new Date().toISOString(),
       };
 
-      setMessages((prev) => [...prev, newBotMsg]);
-    } catch (error) {
-      console.error("Agent error:", error);
+      setMessages((prev) =>
+        prev.some((msg) => msg.id === botMsgId)
+          ? prev.map((msg) => (msg.id === botMsgId ? newBotMsg : msg))
+          : [...prev, newBotMsg]
+      );
+    };
 
-      setMessages((prev) => [
-        ...prev,
+    try {
+      // Stream the reply as it is generated (Server-Sent Events)
+      const response = await fetch(
+        `${CHATBOT_API_URL}/api/chatbot/message/stream`,
         {
-          type: "bot",
-          content:
-            "Oops! I had trouble connecting to the server. Please try again.",
-          error: true,
-          timestamp: new Date().toISOString(),
-        },
-      ]);
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(payload),
+        }
+      );
+      if (!response.ok || !response.body) {
+        throw new Error(`Stream unavailable (${response.status})`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const frames = buffer.split("\n\n");
+        buffer = frames.pop();
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(frame.match(/^data: (.*)$/m)?.[1] || "{}");
+
+          if (event === "delta") {
+            streamStarted = true;
+            setIsLoading(false);
+            setMessages((prev) =>
+              prev.some((msg) => msg.id === botMsgId)
+                ? prev.map((msg) =>
+                    msg.id === botMsgId
+                      ? { ...msg, content: msg.content + data.text }
+                      : msg
+                  )
+                : [
+                    ...prev,
+                    {
+                      id: botMsgId,
+                      type: "bot",
+                      content: data.text,
+                      agent: true,
+                      streaming: true,
+                      timestamp: new Date().toISOString(),
+                    },
+                  ]
+            );
+          } else if (event === "final" || event === "error") {
+            finishBotMsg(data);
+            finished = true;
+          }
+        }
+      }
+      if (!finished) throw new Error("Stream ended without a reply");
+    } catch (streamError) {
+      console.warn("Streaming failed:", streamError);
+      try {
+        // Only retry without streaming if nothing was relayed yet
+        if (streamStarted) throw streamError;
+        const response = await fetch(`${CHATBOT_API_URL}/api/chatbot/message`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(payload),
+        });
+
+        finishBotMsg(await response.json());
+      } catch (error) {
+        console.error("Agent error:", error);
+
+        setMessages((prev) => [
+          ...prev.filter((msg) => msg.id !== botMsgId),
+          {
+            type: "bot",
+            content:
+              "Oops! I had trouble connecting to the server. Please try again.",
+            error: true,
+            timestamp: new Date().toISOString(),
+          },
+        ]);
+      }
     } finally {
       setIsLoading(false);
     }
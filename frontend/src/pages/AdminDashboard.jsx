@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { useAuth, useUser } from '@clerk/clerk-react'
-import api, { adminApi } from '../services/api'
+import api, { adminApi, getAllPages } from '../services/api'
 import { getInitials } from '../utils/helpers'
 import './AdminDashboard.css'
 
@@ -12,6 +12,7 @@ function AdminDashboard() {
   const [stats, setStats] = useState({})
   const [courses, setCourses] = useState([])
   const [students, setStudents] = useState([])
+  const [studentsCursor, setStudentsCursor] = useState(null)
   const [activeTab, setActiveTab] = useState('courses')
   const [loading, setLoading] = useState(true)
   const [showAddCourse, setShowAddCourse] = useState(false)
@@ -32,15 +33,19 @@ function AdminDashboard() {
         role: 'admin'
       })
 
-      const [statsRes, coursesRes, studentsRes] = await Promise.all([
+      const [statsRes, allCourses, studentsRes] = await Promise.all([
         adminApi.getStats(userId),
-        api.get('/api/courses'),
+        getAllPages('/api/courses', {
+          limit: 200,
+          fields: 'title,description,instructor,duration,topicCount,enrollmentCount'
+        }),
         adminApi.getStudents(userId)
       ])
 
       setStats(statsRes.data)
-      setCourses(coursesRes.data)
+      setCourses(allCourses)
       setStudents(studentsRes.data)
+      setStudentsCursor(studentsRes.headers['x-next-cursor'] || null)
     } catch (error) {
       console.error('Error fetching data:', error)
       alert('Failed to fetch admin data. Please check your permissions.')
@@ -49,6 +54,16 @@ function AdminDashboard() {
     }
   }
 
+  const loadMoreStudents = async () => {
+    try {
+      const response = await adminApi.getStudents(userId, { after: studentsCursor })
+      setStudents((prev) => [...prev, ...response.data])
+      setStudentsCursor(response.headers['x-next-cursor'] || null)
+    } catch (error) {
+      console.error('Error loading more students:', error)
+    }
+  }
+
   const handleDeleteCourse = async (courseId) => {
     if (!window.confirm('Are you sure you want to delete this course?')) return
 
@@ -177,7 +192,7 @@ function AdminDashboard() {
                   <div className="course-details">
                     <p><strong>Instructor:</strong> {course.instructor || 'TBA'}</p>
                     <p><strong>Duration:</strong> {course.duration || 'N/A'}</p>
-                    <p><strong>Topics:</strong> {course.topics?.length || 0} topics</p>
+                    <p><strong>Topics:</strong> {course.topicCount ?? course.topics?.length ?? 0} topics</p>
                     <p><strong>Enrolled:</strong> {course.enrollmentCount || 0} students</p>
                   </div>
                 </div>
@@ -233,6 +248,11 @@ function AdminDashboard() {
                 </div>
               ))}
             </div>
+            {studentsCursor && (
+              <button className="btn-view-details" onClick={loadMoreStudents}>
+                Load more students
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -1,10 +1,12 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { useAuth, useUser } from '@clerk/clerk-react'
-import api from '../services/api'
+import api, { getAllPages } from '../services/api'
 import { getInitials } from '../utils/helpers'
 import './BrowseCourses.css'
 
+const PAGE_SIZE = 24
+
 function BrowseCourses() {
   const { userId } = useAuth()
   const { user } = useUser()
@@ -12,16 +14,32 @@ function BrowseCourses() {
   const [courses, setCourses] = useState([])
   const [enrollments, setEnrollments] = useState([])
   const [loading, setLoading] = useState(true)
+  const [query, setQuery] = useState('')
+  const [nextCursor, setNextCursor] = useState(null)
+  const [total, setTotal] = useState(0)
+  const latestRequest = useRef(0)
 
   useEffect(() => {
-    fetchCourses()
     fetchEnrollments()
   }, [userId])
 
-  const fetchCourses = async () => {
+  // Debounce typing so each pause sends one search
+  useEffect(() => {
+    const timer = setTimeout(() => fetchCourses(query), query ? 250 : 0)
+    return () => clearTimeout(timer)
+  }, [query])
+
+  const fetchCourses = async (q, after = null) => {
+    const requestId = ++latestRequest.current
     try {
-      const response = await api.get('/api/courses')
-      setCourses(response.data)
+      const response = await api.get('/api/courses/search', {
+        params: { q, limit: PAGE_SIZE, ...(after ? { after } : {}) }
+      })
+      // Ignore responses to searches the user has already typed past
+      if (requestId !== latestRequest.current) return
+      setCourses((prev) => (after ? [...prev, ...response.data] : response.data))
+      setNextCursor(response.headers['x-next-cursor'] || null)
+      setTotal(Number(response.headers['x-total-count'] || response.data.length))
     } catch (error) {
       console.error('Error fetching courses:', error)
     } finally {
@@ -32,8 +50,8 @@ function BrowseCourses() {
   const fetchEnrollments = async () => {
     if (!userId) return
     try {
-      const response = await api.get(`/api/enrollments/user/${userId}`)
-      setEnrollments(response.data.map(e => e.courseId))
+      const data = await getAllPages(`/api/enrollments/user/${userId}`, { limit: 200, fields: 'courseId' })
+      setEnrollments(data.map(e => e.courseId))
     } catch (error) {
       console.error('Error fetching enrollments:', error)
     }
@@ -107,10 +125,21 @@ function BrowseCourses() {
           </button>
         </div>
 
+        <div className="course-search">
+          <input
+            type="search"
+            className="course-search-input"
+            placeholder="Search courses, topics or instructors"
+            value={query}
+            onChange={(e) => setQuery(e.target.value)}
+          />
+          {query && <span className="course-search-count">{total} result{total === 1 ? '' : 's'}</span>}
+        </div>
+
         <div className="courses-section">
           {courses.length === 0 ? (
             <div className="empty-state">
-              <p>No courses available at the moment.</p>
+              <p>{query ? 'No courses match your search.' : 'No courses available at the moment.'}</p>
             </div>
           ) : (
             <div className="courses-grid">
@@ -124,7 +153,7 @@ function BrowseCourses() {
                     <div className="course-details">
                       <p><strong>Instructor:</strong> {course.instructor || 'TBA'}</p>
                       <p><strong>Duration:</strong> {course.duration || 'N/A'}</p>
-                      <p><strong>Topics:</strong> {course.topics?.length || 0} topics</p>
+                      <p><strong>Topics:</strong> {course.topicCount ?? course.topics?.length ?? 0} topics</p>
                     </div>
                     <button
                       className="btn-enroll"
@@ -138,6 +167,11 @@ function BrowseCourses() {
               })}
             </div>
           )}
+          {nextCursor && (
+            <button className="btn-load-more" onClick={() => fetchCourses(query, nextCursor)}>
+              Load more courses
+            </button>
+          )}
         </div>
       </div>
     </div>
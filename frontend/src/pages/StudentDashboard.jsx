@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { useAuth, useUser } from '@clerk/clerk-react'
-import api from '../services/api'
+import api, { getAllPages } from '../services/api'
 import { getInitials } from '../utils/helpers'
 import ChatBot from '../components/ChatBot'
 import './StudentDashboard.css'
@@ -31,16 +31,11 @@ function StudentDashboard() {
         role: 'student'
       })
 
-      const response = await api.get(`/api/enrollments/user/${userId}`)
-      
-      // Handle the response data properly
-      if (response.data && Array.isArray(response.data)) {
-        setEnrollments(response.data)
-      } else {
-        console.error('Invalid response format:', response.data)
-        setEnrollments([])
-        setError('Failed to load enrollments: Invalid data format')
-      }
+      const data = await getAllPages(`/api/enrollments/user/${userId}`, {
+        limit: 200,
+        fields: 'courseId,course.title,course.description,course.duration,course.topicCount,progress.progress'
+      })
+      setEnrollments(data)
     } catch (error) {
       console.error('Error fetching enrollments:', error)
       setEnrollments([])
@@ -165,9 +160,8 @@ function StudentDashboard() {
                   const course = enrollment.course
                   const progress = enrollment.progress
                   const progressPercent = progress?.progress || 0
-                  const totalTopics = course?.topics?.length || 0
-                  const completedTopics = progress?.completedTopics?.length || 0
-
+                  const totalTopics = course?.topicCount ?? course?.topics?.length ?? 0
+                  
                   return (
                     <div key={enrollment._id} className="course-card">
                       <div className="course-status">In Progress</div>
@@ -43,6 +43,19 @@ api.interceptors.response.use(
   }
 );
 
+// Fetch every page of a cursor-paginated list endpoint (follows the
+// X-Next-Cursor header); `params` may include `fields` and `limit`
+export const getAllPages = async (url, params = {}) => {
+  const items = [];
+  let after = null;
+  do {
+    const response = await api.get(url, { params: { ...params, ...(after ? { after } : {}) } });
+    items.push(...response.data);
+    after = response.headers['x-next-cursor'] || null;
+  } while (after);
+  return items;
+};
+
 // Admin API functions with authentication
 export const adminApi = {
   // Get admin stats
@@ -55,9 +68,10 @@ export const adminApi = {
     });
   },
 
-  // Get all students
-  getStudents: (userId) => {
+  // Get a page of students (pass `after` from the X-Next-Cursor header)
+  getStudents: (userId, params = {}) => {
     return api.get('/api/admin/students', {
+      params,
       headers: {
         'X-Admin-Key': 'elevateu-admin-2024',
         'X-User-ID': userId